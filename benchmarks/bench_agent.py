@@ -0,0 +1,417 @@
+"""
+智能体循环和工具的离线基准测试
+
+模型请求发往本地的 MockChatServer（按脚本回放流式回复和工具调用，可以设置延迟），不花费 API 费用，也没有网络抖动。
+在 1k/10k/100k 个文件的合成仓库上分别测量：
+    loop        按脚本运行完整的工具循环（AgentEngine），每次模型请求在客户端的额外耗时、工具阶段耗时和总耗时
+    tools       上述运行中每个工具的耗时（来自会话指标），以及代码搜索索引就绪所需的时间
+                索引就绪后还检查带 ^、$ 锚点的搜索结果，结果不对时记为失败
+    throughput  多个会话并发运行同一脚本时每秒完成的任务数和模型请求数
+以及不依赖仓库大小的：
+    messages    同步 Agent 多轮对话和单个长任务中 Agent.messages 的序列化大小、请求体大小和 Python 内存的增长
+                （有无上下文压缩各一次；压缩后的历史超过预算时记为失败）
+另外用假的请求检查模型路由：按 p95 耗时排序、对冲延迟，以及对冲时只采用胜出一方的结果和增量。
+
+结果写入 JSON（"metrics" 是扁平的 指标名 -> 数值，便于比较），传入 --baseline 时与之前的结果比较，有指标变差超过容差或有失败时退出码为 1。
+
+用法（在程序目录下运行）：
+    python -m benchmarks.bench_agent --output bench_results.json
+    python -m benchmarks.bench_agent --sizes 1000 10000 --ttft 0.05 --chunk-delay 0.002
+    python -m benchmarks.bench_agent --sizes 1000 --baseline bench_results.json --tolerance 0.3
+"""
+import os
+import re
+import gc
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tracemalloc
+
+# 模型客户端在导入时就要求有 API 密钥；基准测试的请求只发往本地的模拟服务
+os.environ.setdefault("OPENROUTER_API_KEY", "mock")
+
+from openai import OpenAI, AsyncOpenAI
+
+from helpers.agent import Agent
+from helpers.agent_engine import AgentEngine, AgentEvents
+from helpers.context_compactor import ContextCompactor, estimate_message_tokens
+from helpers.get_prompt import get_prompt
+from helpers.model_router import ModelRouter, min_hedge_delay_seconds, min_samples
+from helpers.request_retry import ResilientRequester, RetryPolicy
+from helpers.stats import percentile
+from helpers.telemetry import get_metrics_log, read_metrics, summarize_metrics
+from tools.code_search import search_code, warm_up as warm_up_code_search
+from tools.tools_list import tools_list, tools_mapping
+from benchmarks.bench_results import program_dir_path, default_workspace_path, get_meta, write_results
+from benchmarks.mock_server import MockChatServer, make_response
+from benchmarks.synthetic_repo import create_synthetic_repo, get_file_path, get_module_text
+
+
+default_sizes = [1000, 10000, 100000]
+# 模拟的模型名称只影响提示词缓存断点和费用估算
+bench_model_name = "anthropic/claude-sonnet-4"
+# 等待代码搜索索引建立的最长时间（秒）
+max_index_wait_seconds = 600
+# 消息增长测试中上下文压缩的预算（token），比默认值小，几轮之后就开始压缩；
+# 需要大于始终保留的最近几轮（每轮一次 get_dir_tree，最多约 10000 token），否则压缩后也无法回到预算以内
+bench_token_budget = 50_000
+final_answer = "根据以上的搜索和阅读，compute 函数的实现没有问题，已经把 value 改回原值。" * 10
+
+
+def get_task_responses(root_dir: str, file_count: int, user_content: str) -> list[dict]:
+    """
+    一个任务的脚本：浏览目录、搜索、读取、编辑再改回，最后给出回答
+
+    每个任务修改不同的文件（由用户消息中的任务序号决定），并发运行时不会互相冲突。
+    """
+    task_index = int(re.search(r"\d+", user_content).group())
+    target_index = (task_index * 7919) % file_count
+    target_path = get_file_path(root_dir, target_index)
+    neighbor_path = get_file_path(root_dir, (target_index + 1) % file_count)
+    return [
+        make_response("我先看一下项目结构，并找到 compute 函数的定义。", [
+            ("get_dir_tree", {"dir_path": root_dir}),
+            ("search_code", {"pattern": rf"def compute_{target_index}\b", "dir_path": root_dir}),
+        ], reasoning="需要先了解目录结构。"),
+        make_response("找到了，读取这个文件和相邻的文件。", [
+            ("read_file", {"file_path": target_path}),
+            ("read_file", {"file_path": neighbor_path}),
+        ]),
+        make_response("修改 value 的初始值。", [
+            ("edit_file", {"file_path": target_path, "new_text": "value = 1", "old_text": "value = 0"}),
+        ]),
+        make_response("确认修改后再改回原值。", [
+            ("read_file", {"file_path": target_path}),
+            ("edit_file", {"file_path": target_path, "new_text": "value = 0", "old_text": "value = 1"}),
+        ]),
+        make_response("再看看所有的 TODO。", [
+            ("search_code", {"pattern": "TODO", "dir_path": root_dir, "literal": True}),
+        ]),
+        make_response(final_answer),
+    ]
+
+
+def create_bench_router() -> ModelRouter:
+    """不限流、不重试、没有备用模型的路由，测到的只是本地开销"""
+    requester = ResilientRequester(RetryPolicy(max_attempts=1), requests_per_second=1e9, burst=1e9)
+    return ModelRouter(requester, fallbacks={}, hedge_delay=None)
+
+
+async def check_router(failures: list) -> None:
+    """
+    不经过模拟服务，直接用假的 send 检查路由的行为：
+        p95 耗时远高于同组的模型排到后面，对冲延迟取主模型的 p95（不低于下限）；
+        对冲时慢的主模型被取消、由备用模型给出结果，界面只收到胜出一方的增量
+    """
+    requester = ResilientRequester(RetryPolicy(max_attempts=1), requests_per_second=1e9, burst=1e9)
+    await asyncio.gather(*(
+        requester.call_async(model_name, lambda delay=delay: asyncio.sleep(delay))
+        for model_name, delay in (("slow", 0.2), ("fast", 0.0)) for _ in range(min_samples)
+    ))
+    router = ModelRouter(requester, fallbacks={"slow": ["fast"]}, hedge_delay=10.0)
+    if router.route("slow") != ["fast", "slow"]:
+        failures.append({"case": "router.latency_route", "kind": "wrong_result", "result": router.route("slow")})
+    if router.get_hedge_delay("fast") != min_hedge_delay_seconds:
+        failures.append({"case": "router.hedge_delay", "kind": "wrong_result", "result": router.get_hedge_delay("fast")})
+
+    cancelled_models = []
+    received_deltas = []
+
+    async def send(model_name, on_delta):
+        try:
+            await asyncio.sleep(1.0 if model_name == "primary" else 0.0)
+            for i in range(3):
+                on_delta("content", f"{model_name}_{i}")
+                await asyncio.sleep(0)
+            return model_name
+        except asyncio.CancelledError:
+            cancelled_models.append(model_name)
+            raise
+
+    hedging_router = ModelRouter(
+        ResilientRequester(RetryPolicy(max_attempts=1), requests_per_second=1e9, burst=1e9),
+        fallbacks={"primary": ["secondary"]},
+        hedge_delay=0.05
+    )
+    result = await hedging_router.call_async("primary", send, lambda kind, text: received_deltas.append(text))
+    # 让被取消的任务处理 CancelledError
+    await asyncio.sleep(0.01)
+    expected_deltas = [f"secondary_{i}" for i in range(3)]
+    if result != ("secondary", "secondary") or cancelled_models != ["primary"] or received_deltas != expected_deltas:
+        failures.append({
+            "case": "router.hedging",
+            "kind": "wrong_result",
+            "result": {"result": result, "cancelled": cancelled_models, "deltas": received_deltas},
+        })
+
+
+class CallTimingEvents(AgentEvents):
+    """记录每次模型请求的开始和结束时间"""
+
+    def __init__(self) -> None:
+        self.call_starts: list[float] = []
+        self.call_ends: list[float] = []
+        self.error_message: str | None = None
+
+    def on_assistant_start(self, message_id):
+        self.call_starts.append(time.monotonic())
+
+    def on_assistant_message(self, message_id, message_index, message_dict):
+        self.call_ends.append(time.monotonic())
+
+    def on_error(self, error_message):
+        self.error_message = error_message
+
+
+def to_ms(seconds: float | None) -> float | None:
+    return round(seconds * 1000, 3) if seconds is not None else None
+
+
+def wait_for_index(root_dir: str) -> float:
+    """等待代码搜索索引就绪，返回等待的秒数"""
+    started_at = time.monotonic()
+    # 与 AgentEngine 一样把仓库登记为项目根目录
+    trigram_index = warm_up_code_search(root_dir)
+    while not trigram_index.is_ready and time.monotonic() - started_at < max_index_wait_seconds:
+        time.sleep(0.05)
+    return time.monotonic() - started_at
+
+
+def check_search(root_dir: str, file_count: int, failures: list) -> None:
+    """带 ^、$ 锚点的模式（经过索引筛选和整个文件的预筛选）也要找到对应的行"""
+    index = file_count // 2
+    file_path = get_file_path(root_dir, index)
+    module_lines = get_module_text(index).split("\n")
+    checks = [
+        (rf"^def compute_{index}\(", module_lines.index(f"def compute_{index}(x, y = {index % 97}):") + 1),
+        (rf"^MODULE_ID = {index}$", module_lines.index(f"MODULE_ID = {index}") + 1),
+    ]
+    for pattern, line_number in checks:
+        result = search_code(pattern, root_dir)
+        if f"{file_path}:{line_number}:" not in result:
+            failures.append({"case": f"search_code {pattern}", "kind": "wrong_result", "result": result[:200]})
+
+
+async def run_task(root_dir: str, client: AsyncOpenAI, router: ModelRouter, task_index: int) -> tuple[AgentEngine, CallTimingEvents]:
+    events = CallTimingEvents()
+    engine = AgentEngine(root_dir, root_dir, bench_model_name, events, client=client, router=router)
+    try:
+        await engine.run(f"任务 {task_index}：检查 compute 函数并调整 value 的初始值")
+    finally:
+        engine.close()
+    if events.error_message is not None:
+        raise RuntimeError(f"任务 {task_index} 失败：{events.error_message}")
+    return engine, events
+
+
+async def bench_loop(server: MockChatServer, root_dir: str, repeats: int, metrics: dict, prefix: str) -> list[str]:
+    """顺序运行 repeats 个任务，用模拟服务记录的处理时间扣除模型本身的耗时，返回这些任务的会话 ID"""
+    client = AsyncOpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+    router = create_bench_router()
+    walls, call_overheads, tool_phases, session_ids = [], [], [], []
+    for task_index in range(repeats):
+        server.reset_stats()
+        started_at = time.monotonic()
+        engine, events = await run_task(root_dir, client, router, task_index)
+        walls.append(time.monotonic() - started_at)
+        session_ids.append(engine.telemetry.session_id)
+
+        # 同一个会话的请求是顺序发出的，模拟服务的处理时间与客户端的请求一一对应
+        for call_start, call_end, service_time in zip(events.call_starts, events.call_ends, server.service_times):
+            call_overheads.append(call_end - call_start - service_time)
+        for call_end, next_call_start in zip(events.call_ends, events.call_starts[1:]):
+            tool_phases.append(next_call_start - call_end)
+    await client.close()
+
+    call_overheads.sort()
+    tool_phases.sort()
+    walls.sort()
+    metrics[f"{prefix}.wall_p50_ms"] = to_ms(percentile(walls, 0.5))
+    metrics[f"{prefix}.call_overhead_p50_ms"] = to_ms(percentile(call_overheads, 0.5))
+    metrics[f"{prefix}.call_overhead_p95_ms"] = to_ms(percentile(call_overheads, 0.95))
+    metrics[f"{prefix}.tool_phase_p50_ms"] = to_ms(percentile(tool_phases, 0.5))
+    metrics[f"{prefix}.tool_phase_p95_ms"] = to_ms(percentile(tool_phases, 0.95))
+    return session_ids
+
+
+def collect_tool_metrics(session_ids: list[str], metrics: dict, prefix: str) -> dict:
+    """从指标日志中汇总这些会话的工具耗时"""
+    session_id_set = set(session_ids)
+    metrics_log = get_metrics_log()
+    metrics_paths = [os.path.join(metrics_log.dir_path, name) for name in sorted(os.listdir(metrics_log.dir_path))]
+    records = [record for record in read_metrics(metrics_paths) if record.get("session") in session_id_set]
+    summary = summarize_metrics(records)
+    for tool_name, tool in sorted(summary["tools"].items()):
+        metrics[f"{prefix}.{tool_name}.p50_ms"] = to_ms(tool["p50"])
+        metrics[f"{prefix}.{tool_name}.p95_ms"] = to_ms(tool["p95"])
+    return summary["tools"]
+
+
+async def bench_throughput(server: MockChatServer, root_dir: str, concurrency: int, task_count: int, first_task_index: int, metrics: dict, prefix: str) -> None:
+    client = AsyncOpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+    router = create_bench_router()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_limited(task_index):
+        async with semaphore:
+            await run_task(root_dir, client, router, task_index)
+
+    server.reset_stats()
+    started_at = time.monotonic()
+    await asyncio.gather(*(run_limited(first_task_index + i) for i in range(task_count)))
+    wall = time.monotonic() - started_at
+    await client.close()
+
+    metrics[f"{prefix}.tasks_per_second"] = round(task_count / wall, 3)
+    metrics[f"{prefix}.calls_per_second"] = round(server.request_count / wall, 3)
+
+
+def bench_messages(server: MockChatServer, root_dir: str, turns: int, single_task: bool, use_compactor: bool, metrics: dict, prefix: str) -> list[dict]:
+    """
+    同步 Agent 的消息增长，每轮调用一次 get_dir_tree（返回约 30000 字符）
+
+    single_task 为 False 时每轮是一条新的用户消息，模型调用一次工具后回答；为 True 时只有一条用户消息，
+    模型在同一个任务中连续调用 turns 轮工具（长任务中较早的工具返回同样需要被压缩）。
+    每轮结束后记录消息条数、消息列表的 JSON 大小和估算 token 数、最后一次请求体的大小和 tracemalloc 统计的当前内存。
+    """
+    client = OpenAI(base_url=server.base_url, api_key="mock", max_retries=0)
+    agent = Agent(
+        agent_name="bench",
+        client=client,
+        model_name=bench_model_name,
+        system_prompt=get_prompt(prompt_name="main_system", variables={"root_dir_path": root_dir, "cwd_path": root_dir}),
+        tools=tools_list,
+        stream=True,
+        context_compactor=ContextCompactor(token_budget=bench_token_budget) if use_compactor else None,
+        router=create_bench_router()
+    )
+
+    def run_tool_calls(message_dict: dict) -> None:
+        for tool_call in message_dict["tool_calls"]:
+            tool_name = tool_call["function"]["name"]
+            tool_content = str(tools_mapping[tool_name](**json.loads(tool_call["function"]["arguments"])))
+            agent.messages.append({"role": "tool", "tool_call_id": tool_call["id"], "content": tool_content})
+
+    gc.collect()
+    tracemalloc.start()
+    baseline_bytes = tracemalloc.get_traced_memory()[0]
+    samples = []
+    try:
+        if single_task:
+            message_dict = agent.user_call("看一下目录结构")
+        for turn in range(turns):
+            if single_task:
+                run_tool_calls(message_dict)
+                message_dict = agent()
+            else:
+                message_dict = agent.user_call(f"第 {turn} 轮：看一下目录结构")
+                while message_dict.get("tool_calls"):
+                    run_tool_calls(message_dict)
+                    message_dict = agent()
+            gc.collect()
+            samples.append({
+                "turn": turn + 1,
+                "messages": len(agent.messages),
+                "messages_bytes": len(json.dumps(agent.messages, ensure_ascii=False).encode('utf-8')),
+                "messages_tokens": sum(estimate_message_tokens(message) for message in agent.messages),
+                "request_bytes": server.request_bytes[-1],
+                "traced_bytes": tracemalloc.get_traced_memory()[0] - baseline_bytes,
+            })
+    finally:
+        tracemalloc.stop()
+        client.close()
+
+    first, last = samples[0], samples[-1]
+    growth_turns = max(1, last["turn"] - first["turn"])
+    for name in ("messages_bytes", "messages_tokens", "request_bytes", "traced_bytes"):
+        metrics[f"{prefix}.{name}_final"] = last[name]
+        metrics[f"{prefix}.{name}_per_turn"] = round((last[name] - first[name]) / growth_turns, 1)
+    return samples
+
+
+def run_benchmarks(args) -> dict:
+    metrics = {}
+    failures = []
+    details = {"tools": {}, "messages": {}}
+    asyncio.run(check_router(failures))
+    # 模拟服务在整个测试中只启动一次，每个阶段替换 responses 来回放不同的脚本
+    responses = lambda user_content: []
+    with MockChatServer(lambda user_content: responses(user_content), args.ttft, args.chunk_delay) as server:
+        for file_count in args.sizes:
+            size_name = f"files_{file_count}"
+            sys.stderr.write(f"[{size_name}] 生成合成仓库...\n")
+            root_dir = create_synthetic_repo(os.path.join(args.workspace, "repos", size_name), file_count)
+            responses = lambda user_content, root_dir=root_dir, file_count=file_count: get_task_responses(root_dir, file_count, user_content)
+            metrics[f"index.{size_name}.ready_s"] = round(wait_for_index(root_dir), 3)
+            check_search(root_dir, file_count, failures)
+
+            sys.stderr.write(f"[{size_name}] 工具循环...\n")
+            session_ids = asyncio.run(bench_loop(server, root_dir, args.repeats, metrics, f"loop.{size_name}"))
+            details["tools"][size_name] = collect_tool_metrics(session_ids, metrics, f"tools.{size_name}")
+
+            sys.stderr.write(f"[{size_name}] 并发吞吐...\n")
+            asyncio.run(bench_throughput(server, root_dir, args.concurrency, args.concurrency * 2, args.repeats, metrics, f"throughput.{size_name}"))
+
+        # 工具返回的大小与仓库有关，只在最小的仓库上测试，指标名中带上仓库大小
+        size_name = f"files_{min(args.sizes)}"
+        sys.stderr.write(f"[{size_name}] 多轮对话的消息增长...\n")
+        root_dir = create_synthetic_repo(os.path.join(args.workspace, "repos", size_name), min(args.sizes))
+        tool_response = make_response(None, [("get_dir_tree", {"dir_path": root_dir})])
+        for single_task in (False, True):
+            # 每轮一条用户消息时模型调用一次工具就回答；单个长任务中模型连续调用 turns 轮工具
+            messages_responses = [tool_response] * (args.turns if single_task else 1) + [make_response(final_answer)]
+            responses = lambda user_content, messages_responses=messages_responses: messages_responses
+            shape = "single_task" if single_task else "multi_turn"
+            for use_compactor in (False, True):
+                name = f"{shape}.compactor_on" if use_compactor else f"{shape}.compactor_off"
+                details["messages"][name] = bench_messages(server, root_dir, args.turns, single_task, use_compactor, metrics, f"messages.{size_name}.{name}")
+                # 压缩后的历史应当保持在预算以内，否则说明有一部分历史始终不会被压缩
+                final_tokens = details["messages"][name][-1]["messages_tokens"]
+                if use_compactor and final_tokens > bench_token_budget:
+                    failures.append({"case": f"messages.{name}", "kind": "over_budget", "tokens": final_tokens, "token_budget": bench_token_budget})
+
+    return {"meta": get_meta(args), "metrics": metrics, "failures": failures, "details": details}
+
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description="智能体循环和工具的离线基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=default_sizes, help="合成仓库的文件数")
+    parser.add_argument("--repeats", type=int, default=5, help="每个仓库上顺序运行的任务数")
+    parser.add_argument("--concurrency", type=int, default=8, help="测吞吐时同时运行的会话数（共运行两倍数量的任务）")
+    parser.add_argument("--turns", type=int, default=30, help="消息增长测试的对话轮数")
+    parser.add_argument("--ttft", type=float, default=0.0, help="模拟服务发出第一个分块前的延迟（秒）")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="模拟服务流式分块之间的延迟（秒）")
+    parser.add_argument("--workspace", default=default_workspace_path, help="合成仓库、会话日志和索引缓存的目录，合成仓库会被复用")
+    parser.add_argument("--output", help="结果文件（JSON），省略时输出到标准输出")
+    parser.add_argument("--baseline", help="与之前的结果文件比较")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="与基准比较时允许的相对变差")
+    parser.add_argument("--min-delta", type=float, default=1.0, help="与基准比较时忽略的绝对变化（指标自身的单位）")
+    args = parser.parse_args(argv)
+    if min(args.sizes) < 2 or args.repeats < 1 or args.concurrency < 1 or args.turns < 2:
+        parser.error("--sizes 至少为 2，--repeats 和 --concurrency 至少为 1，--turns 至少为 2")
+    return args
+
+
+def main(argv = None) -> int:
+    args = parse_args(argv)
+    for name in ("workspace", "output", "baseline"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    # 在工作区中运行：会话日志、指标日志和索引缓存都写到这里，不影响程序目录下的数据
+    os.makedirs(args.workspace, exist_ok=True)
+    shutil.copytree(os.path.join(program_dir_path, "prompts"), os.path.join(args.workspace, "prompts"), dirs_exist_ok=True)
+    os.chdir(args.workspace)
+
+    result = run_benchmarks(args)
+    for failure in result["failures"]:
+        sys.stderr.write(f"[失败] {failure}\n")
+    exit_code = write_results(result, args)
+    return 1 if result["failures"] else exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
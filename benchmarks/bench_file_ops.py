@@ -0,0 +1,307 @@
+"""
+tools/file_ops 的微基准和规模测试
+
+在生成的目录和文件上（深、宽、大量小文件、少数大文件、混合编码含 GBK）调用 get_dir_tree、read_file、edit_file
+和 delete_file_or_dir，记录每次调用的耗时（多次取最小值）和 tracemalloc 统计的内存峰值。
+每个规模测试在依次翻倍的输入上运行，用 log(耗时) 对 log(规模) 的最小二乘斜率估计复杂度的指数，
+指数超过 --max-exponent（默认 1.5，线性约为 1，平方约为 2）时视为失败，退出码为 1。
+
+冷启动指测量前清空目录索引、文件内容和行索引缓存；热调用指同样的参数再次调用（走缓存）。
+
+用法（在程序目录下运行）：
+    python -m benchmarks.bench_file_ops --output file_ops_results.json
+    python -m benchmarks.bench_file_ops --scale 0.25            # 快速运行
+    python -m benchmarks.bench_file_ops --baseline file_ops_results.json
+"""
+import os
+import gc
+import sys
+import math
+import time
+import shutil
+import argparse
+import tracemalloc
+
+from tools.file_ops import get_dir_tree, read_file, edit_file, delete_file_or_dir
+from tools.dir_index import dir_index
+from tools.read_cache import file_content_cache
+from tools.line_index import line_index_cache
+from benchmarks.bench_results import default_workspace_path, get_meta, write_results
+from benchmarks.synthetic_repo import (
+    create_synthetic_repo, create_wide_dir, create_deep_dir, create_large_file, create_mixed_encoding_files, large_file_end_line
+)
+
+
+# 规模测试依次翻倍的步数
+scale_steps = 4
+mib = 1024 * 1024
+
+
+def clear_caches() -> None:
+    dir_index.clear()
+    file_content_cache.clear()
+    line_index_cache.clear()
+
+
+def time_call(func, repeats: int, is_cold: bool, prepare = None) -> float:
+    """多次调用取最短的耗时（秒）；prepare 在每次调用前执行，不计入耗时"""
+    best = math.inf
+    for _ in range(repeats):
+        if prepare is not None:
+            prepare()
+        if is_cold:
+            clear_caches()
+        gc.collect()
+        started_at = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started_at)
+    return best
+
+
+def measure_peak(func, is_cold: bool, prepare = None) -> int:
+    """单独调用一次，返回调用期间 tracemalloc 统计的内存峰值（字节）；开启 tracemalloc 会拖慢调用，因此不与计时一起进行"""
+    if prepare is not None:
+        prepare()
+    if is_cold:
+        clear_caches()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def fit_exponent(sizes: list[float], values: list[float]) -> float | None:
+    """log(value) 对 log(size) 的最小二乘斜率"""
+    points = [(math.log(size), math.log(value)) for size, value in zip(sizes, values) if value > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def check_result(case_name: str, result: str) -> None:
+    if result.startswith("错误"):
+        raise RuntimeError(f"{case_name} 返回错误：{result[:200]}")
+
+
+class ScalingCase:
+    """
+    一个规模测试：在依次翻倍的输入上调用同一个工具
+
+    Args:
+        create(size): 生成输入，返回传给 call 的参数（如路径）
+        call(target): 调用被测的工具，返回工具的结果
+        prepare(target): 每次调用前执行（不计时），如重新生成要删除的目录
+        has_warm: 是否同时测量热调用
+        get_fit_size(size, target): 拟合指数时使用的规模，省略时使用 size 本身
+    """
+
+    def __init__(self, name, base_size, unit, create, call, prepare = None, has_warm = True, get_fit_size = None):
+        self.name = name
+        self.base_size = base_size
+        self.unit = unit
+        self.create = create
+        self.call = call
+        self.prepare = prepare
+        self.has_warm = has_warm
+        self.get_fit_size = get_fit_size
+
+
+def get_scaling_cases(workspace: str) -> list[ScalingCase]:
+    data_dir = os.path.join(workspace, "file_ops")
+
+    def create_huge_file(size_mib, encoding = 'utf-8'):
+        return create_large_file(os.path.join(data_dir, "huge", f"{encoding}_{size_mib}mib.py"), int(size_mib * mib), encoding)
+
+    def restore_end_line(file_path):
+        # 上一次调用改过的最后一行改回原样（不计时），每次调用都是同样的输入
+        edit_file(file_path, large_file_end_line, large_file_end_line.upper())
+
+    def create_delete_source(file_count):
+        return create_synthetic_repo(os.path.join(data_dir, "delete_source", str(file_count)), file_count)
+
+    def copy_delete_target(source_dir):
+        # 每次删除前从生成好的目录复制一份
+        target_dir = source_dir + "_target"
+        if os.path.exists(target_dir):
+            shutil.rmtree(target_dir)
+        shutil.copytree(source_dir, target_dir)
+
+    return [
+        ScalingCase(
+            "get_dir_tree.many_small", 2000, "files",
+            lambda size: create_synthetic_repo(os.path.join(data_dir, "many_small", str(size)), size),
+            lambda root_dir: get_dir_tree(root_dir)
+        ),
+        ScalingCase(
+            "get_dir_tree.many_small_unlimited", 2000, "files",
+            lambda size: create_synthetic_repo(os.path.join(data_dir, "many_small", str(size)), size),
+            lambda root_dir: get_dir_tree(root_dir, max_chars=None)
+        ),
+        ScalingCase(
+            "get_dir_tree.wide", 2500, "files",
+            lambda size: create_wide_dir(os.path.join(data_dir, "wide", str(size)), size),
+            lambda root_dir: get_dir_tree(root_dir)
+        ),
+        ScalingCase(
+            "get_dir_tree.deep", 50, "levels",
+            lambda size: create_deep_dir(os.path.join(data_dir, "deep", str(size)), size),
+            lambda root_dir: get_dir_tree(root_dir),
+            # 目录路径的长度随深度增长，输入的实际大小（所有目录路径的总字符数）是深度的平方级
+            get_fit_size=lambda depth, root_dir: sum(len(root_dir) + 2 * level for level in range(1, depth + 1))
+        ),
+        ScalingCase(
+            "read_file.huge_head", 4, "MiB",
+            lambda size: create_huge_file(size),
+            lambda file_path: read_file(file_path)
+        ),
+        ScalingCase(
+            "read_file.huge_tail", 4, "MiB",
+            lambda size: create_huge_file(size),
+            lambda file_path: read_file(file_path, offset=int(os.path.getsize(file_path) / 80), limit=50)
+        ),
+        ScalingCase(
+            "read_file.gbk_middle", 1, "MiB",
+            lambda size: create_huge_file(size, 'gbk'),
+            lambda file_path: read_file(file_path, offset=int(os.path.getsize(file_path) / 160), limit=200)
+        ),
+        ScalingCase(
+            "read_file.small_full", 16, "KiB",
+            lambda size: create_large_file(os.path.join(data_dir, "small", f"{size}kib.py"), size * 1024),
+            lambda file_path: read_file(file_path)
+        ),
+        ScalingCase(
+            "edit_file.huge", 2, "MiB",
+            lambda size: create_huge_file(size),
+            lambda file_path: edit_file(file_path, large_file_end_line.upper(), large_file_end_line),
+            prepare=restore_end_line,
+            has_warm=False
+        ),
+        ScalingCase(
+            "delete_file_or_dir.many_small", 500, "files",
+            create_delete_source,
+            lambda source_dir: delete_file_or_dir(source_dir + "_target"),
+            prepare=copy_delete_target,
+            has_warm=False
+        ),
+    ]
+
+
+def run_scaling_case(case: ScalingCase, args, metrics: dict, failures: list) -> dict:
+    sizes = [case.base_size * args.scale * 2 ** step for step in range(scale_steps)]
+    sizes = [int(size) if case.unit != "MiB" else size for size in sizes]
+    points = []
+    fit_sizes = []
+    for size in sizes:
+        target = case.create(size)
+        fit_sizes.append(case.get_fit_size(size, target) if case.get_fit_size is not None else size)
+        prepare = (lambda: case.prepare(target)) if case.prepare is not None else None
+        if prepare is not None:
+            prepare()
+        check_result(case.name, case.call(target))
+
+        cold_seconds = time_call(lambda: case.call(target), args.repeats, True, prepare)
+        point = {"size": size, "cold_ms": round(cold_seconds * 1000, 3)}
+        if case.has_warm:
+            case.call(target)
+            point["warm_ms"] = round(time_call(lambda: case.call(target), args.repeats, False) * 1000, 3)
+        point["peak_kib"] = round(measure_peak(lambda: case.call(target), True, prepare) / 1024, 1)
+        points.append(point)
+
+        label = f"{case.name}.{size:g}{case.unit}"
+        for name in ("cold_ms", "warm_ms", "peak_kib"):
+            if name in point:
+                metrics[f"{label}.{name}"] = point[name]
+
+    time_exponent = fit_exponent(fit_sizes, [point["cold_ms"] for point in points])
+    memory_exponent = fit_exponent(fit_sizes, [point["peak_kib"] for point in points])
+    result = {"unit": case.unit, "points": points, "fit_sizes": fit_sizes, "time_exponent": time_exponent, "memory_exponent": memory_exponent}
+    for name, exponent in (("time_exponent", time_exponent), ("memory_exponent", memory_exponent)):
+        if exponent is None:
+            continue
+        result[name] = round(exponent, 3)
+        if exponent > args.max_exponent:
+            failures.append({"case": case.name, "kind": name, "exponent": round(exponent, 3), "max_exponent": args.max_exponent})
+    return result
+
+
+def run_encoding_cases(args, metrics: dict) -> dict:
+    """各种编码和换行符的小文件：记录耗时和工具是否能正确读取"""
+    file_paths = create_mixed_encoding_files(os.path.join(args.workspace, "file_ops", "encodings"))
+    results = {}
+    for kind, file_path in file_paths.items():
+        content = read_file(file_path)
+        cold_seconds = time_call(lambda: read_file(file_path), args.repeats, True)
+        results[kind] = {
+            "cold_ms": round(cold_seconds * 1000, 3),
+            "is_error": content.startswith("错误"),
+            "has_crlf": "\r" in content,
+            "chars": len(content),
+        }
+        metrics[f"read_file.encoding_{kind}.cold_ms"] = results[kind]["cold_ms"]
+    return results
+
+
+def is_selected(case_name: str, args) -> bool:
+    return not args.cases or any(case_name.startswith(prefix) for prefix in args.cases)
+
+
+def run_benchmarks(args) -> dict:
+    metrics = {}
+    failures = []
+    details = {"scaling": {}, "encodings": {}}
+    for case in get_scaling_cases(args.workspace):
+        if not is_selected(case.name, args):
+            continue
+        sys.stderr.write(f"[{case.name}] ...\n")
+        try:
+            details["scaling"][case.name] = run_scaling_case(case, args, metrics, failures)
+        except (RuntimeError, RecursionError, OSError) as e:
+            failures.append({"case": case.name, "kind": "error", "error": str(e)})
+    if is_selected("read_file.encoding", args):
+        sys.stderr.write("[read_file.encoding] ...\n")
+        details["encodings"] = run_encoding_cases(args, metrics)
+        # 二进制文件之外都应该能读取
+        for kind, result in details["encodings"].items():
+            if result["is_error"] != (kind == "binary"):
+                failures.append({"case": f"read_file.encoding_{kind}", "kind": "error", "error": "读取结果与预期不符"})
+    return {"meta": get_meta(args), "metrics": metrics, "failures": failures, "details": details}
+
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description="tools/file_ops 的微基准和规模测试")
+    parser.add_argument("--scale", type=float, default=1.0, help="所有规模测试的输入大小乘以该系数")
+    parser.add_argument("--repeats", type=int, default=3, help="每个输入上调用的次数，取最短的耗时")
+    parser.add_argument("--max-exponent", type=float, default=1.5, help="耗时或内存峰值对输入规模的指数的上限")
+    parser.add_argument("--cases", nargs="*", help="只运行名称以这些前缀开头的测试，如 get_dir_tree read_file.huge")
+    parser.add_argument("--workspace", default=default_workspace_path, help="生成的测试数据的目录，同样参数的数据会被复用")
+    parser.add_argument("--output", help="结果文件（JSON），省略时输出到标准输出")
+    parser.add_argument("--baseline", help="与之前的结果文件比较")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="与基准比较时允许的相对变差")
+    parser.add_argument("--min-delta", type=float, default=1.0, help="与基准比较时忽略的绝对变化（毫秒或 KiB）")
+    args = parser.parse_args(argv)
+    if args.scale <= 0 or args.repeats < 1:
+        parser.error("--scale 必须大于 0，--repeats 至少为 1")
+    return args
+
+
+def main(argv = None) -> int:
+    args = parse_args(argv)
+    for name in ("workspace", "output", "baseline"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+    result = run_benchmarks(args)
+    for failure in result["failures"]:
+        sys.stderr.write(f"[失败] {failure}\n")
+    exit_code = write_results(result, args)
+    return 1 if result["failures"] else exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""基准测试结果的元信息、与基准结果的比较和写出，各个基准测试脚本共用"""
+import os
+import sys
+import json
+import platform
+import subprocess
+from datetime import datetime
+
+
+program_dir_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 合成仓库等测试数据的目录（.cache 不纳入版本管理），同样参数的数据会被复用
+default_workspace_path = os.path.join(program_dir_path, ".cache", "bench")
+# 不影响结果可比性的参数，比较时不检查
+ignored_arg_names = ("output", "baseline", "workspace", "tolerance", "min_delta")
+
+
+def get_git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=program_dir_path, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_meta(args) -> dict:
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": get_git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {name: value for name, value in vars(args).items() if name not in ignored_arg_names},
+    }
+
+
+def compare_with_baseline(metrics: dict, baseline_metrics: dict, tolerance: float, min_delta: float) -> list[dict]:
+    """
+    返回变差超过容差的指标
+
+    以 _per_second 结尾的指标越大越好，其余越小越好；变化的绝对值小于 min_delta 时视为噪声。
+    """
+    regressions = []
+    for name, value in metrics.items():
+        baseline_value = baseline_metrics.get(name)
+        if value is None or baseline_value is None:
+            continue
+        if name.endswith("_per_second"):
+            is_worse = value < baseline_value * (1 - tolerance)
+        else:
+            is_worse = value > baseline_value * (1 + tolerance)
+        if is_worse and abs(value - baseline_value) >= min_delta:
+            regressions.append({"metric": name, "baseline": baseline_value, "value": value})
+    return regressions
+
+
+def write_results(result: dict, args) -> int:
+    """
+    与 args.baseline 比较（如果有）后把结果写入 args.output（省略时输出到标准输出）
+
+    Returns:
+        有指标变差时为 1，否则为 0
+    """
+    exit_code = 0
+    if args.baseline is not None:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        # 参数不同（如轮数、延迟、规模）时同名指标不可比
+        baseline_args = baseline["meta"]["args"]
+        for name, value in result["meta"]["args"].items():
+            if name != "sizes" and baseline_args.get(name) != value:
+                sys.stderr.write(f"[警告] 基准的参数 {name}={baseline_args.get(name)} 与本次的 {value} 不同\n")
+        result["regressions"] = compare_with_baseline(result["metrics"], baseline["metrics"], args.tolerance, args.min_delta)
+        for regression in result["regressions"]:
+            sys.stderr.write(f"[变差] {regression['metric']}: {regression['baseline']} -> {regression['value']}\n")
+        exit_code = 1 if result["regressions"] else 0
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output is None:
+        sys.stdout.write(text + "\n")
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    return exit_code
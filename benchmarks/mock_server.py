@@ -0,0 +1,226 @@
+"""
+本地模拟的 OpenAI 兼容 /chat/completions 服务，按脚本回放录制的回复
+
+回复按请求中最后一条用户消息之后已有的助手消息数选择：第 0 条回复用户消息，第 1 条回复第一轮工具结果，以此类推，
+超出脚本时回复 final_response。因此同一个脚本可以被多个并发会话同时使用，每个会话各自从头回放；
+不同任务需要不同的脚本时，responses 传入按用户消息返回脚本的函数。
+"""
+import sys
+import json
+import time
+import threading
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from helpers.session_store import load_session
+
+
+# 流式返回时每个分块的字符数（约一个 token）
+default_chunk_chars = 4
+final_response = {"content": "完成。"}
+
+
+def make_response(content = None, tool_calls = (), reasoning = None, usage = None) -> dict:
+    """
+    构造一条回复
+
+    Args:
+        tool_calls: [(工具名, 参数字典), ...]
+        usage: {"prompt_tokens", "completion_tokens", "cached_tokens"}，省略时按请求和回复的字符数估算
+    """
+    response = {"content": content, "tool_calls": [{"name": name, "arguments": arguments} for name, arguments in tool_calls]}
+    if reasoning:
+        response["reasoning"] = reasoning
+    if usage is not None:
+        response["usage"] = usage
+    return response
+
+
+def load_responses_from_session(session_path: str) -> list[dict]:
+    """从会话日志中取出助手消息，作为按顺序回放的回复"""
+    _, messages, _ = load_session(session_path)
+    responses = []
+    for message in messages:
+        if message.get("role") != "assistant":
+            continue
+        tool_calls = [
+            (tool_call["function"]["name"], json.loads(tool_call["function"]["arguments"] or "{}"))
+            for tool_call in message.get("tool_calls") or []
+        ]
+        responses.append(make_response(message.get("content"), tool_calls, message.get("reasoning")))
+    return responses
+
+
+def _get_text(content) -> str:
+    """消息内容可能是带缓存断点的分段列表"""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _split(text: str, chunk_chars: int) -> list[str]:
+    return [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "MockChatServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        started_at = time.monotonic()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        request = json.loads(body)
+        response = self.server.select_response(request["messages"])
+        usage = response.get("usage") or self.server.estimate_usage(body, response)
+        model_name = request.get("model", "mock")
+
+        time.sleep(self.server.ttft)
+        if request.get("stream"):
+            self._write_stream(model_name, response, usage, request.get("stream_options", {}).get("include_usage", False))
+        else:
+            self._write_completion(model_name, response, usage)
+        self.server.record_request(len(body), time.monotonic() - started_at)
+
+    def _usage_dict(self, usage):
+        return {
+            "prompt_tokens": usage["prompt_tokens"],
+            "completion_tokens": usage["completion_tokens"],
+            "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"],
+            "prompt_tokens_details": {"cached_tokens": usage.get("cached_tokens", 0)},
+        }
+
+    def _write_completion(self, model_name, response, usage):
+        message = {"role": "assistant", "content": response.get("content")}
+        if response.get("tool_calls"):
+            message["tool_calls"] = [
+                {"id": f"call_{i}", "type": "function", "function": {"name": tool_call["name"], "arguments": json.dumps(tool_call["arguments"], ensure_ascii=False)}}
+                for i, tool_call in enumerate(response["tool_calls"])
+            ]
+        data = json.dumps({
+            "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model_name,
+            "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if response.get("tool_calls") else "stop"}],
+            "usage": self._usage_dict(usage),
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_stream(self, model_name, response, usage, include_usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_chunk(delta = None, finish_reason = None, usage_dict = None):
+            chunk = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model_name,
+                     "choices": [] if delta is None else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            if usage_dict is not None:
+                chunk["usage"] = usage_dict
+            self._write_event("data: " + json.dumps(chunk, ensure_ascii=False) + "\n\n")
+
+        chunk_chars = self.server.chunk_chars
+        deltas = [{"reasoning": text} for text in _split(response.get("reasoning") or "", chunk_chars)]
+        deltas += [{"content": text} for text in _split(response.get("content") or "", chunk_chars)]
+        for index, tool_call in enumerate(response.get("tool_calls") or []):
+            arguments = json.dumps(tool_call["arguments"], ensure_ascii=False)
+            deltas.append({"tool_calls": [{"index": index, "id": f"call_{index}", "type": "function", "function": {"name": tool_call["name"], "arguments": ""}}]})
+            deltas += [{"tool_calls": [{"index": index, "function": {"arguments": text}}]} for text in _split(arguments, chunk_chars * 4)]
+
+        for i, delta in enumerate(deltas):
+            if i > 0 and self.server.chunk_delay > 0:
+                time.sleep(self.server.chunk_delay)
+            write_chunk(delta)
+        write_chunk({}, "tool_calls" if response.get("tool_calls") else "stop")
+        if include_usage:
+            write_chunk(usage_dict=self._usage_dict(usage))
+        self._write_event("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_event(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class MockChatServer(ThreadingHTTPServer):
+    """
+    在后台线程中运行的模拟服务，base_url 可以直接传给 OpenAI / AsyncOpenAI 客户端
+
+    Args:
+        responses: 按顺序回放的回复（make_response 或 load_responses_from_session 的结果），
+            或者 responses(最后一条用户消息的文本) -> 回复列表
+        ttft: 收到请求后到发出第一个分块的秒数
+        chunk_delay: 流式分块之间的秒数
+    """
+
+    daemon_threads = True
+
+    def __init__(self, responses: list[dict] | Callable[[str], list[dict]], ttft: float = 0.0, chunk_delay: float = 0.0, chunk_chars: int = default_chunk_chars) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.responses: list[dict] | Callable[[str], list[dict]] = responses
+        self.ttft: float = ttft
+        self.chunk_delay: float = chunk_delay
+        self.chunk_chars: int = chunk_chars
+        self._lock = threading.Lock()
+        self.request_count: int = 0
+        self.request_bytes: list[int] = []
+        self.service_times: list[float] = []
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}/v1"
+
+    def select_response(self, messages: list[dict]) -> dict:
+        last_user_index = max((i for i, message in enumerate(messages) if message.get("role") == "user"), default=-1)
+        turn = sum(1 for message in messages[last_user_index + 1:] if message.get("role") == "assistant")
+        responses = self.responses
+        if callable(responses):
+            responses = responses(_get_text(messages[last_user_index]["content"]) if last_user_index >= 0 else "")
+        return responses[turn] if turn < len(responses) else final_response
+
+    def estimate_usage(self, body: bytes, response: dict) -> dict:
+        completion_chars = len(response.get("content") or "") + len(response.get("reasoning") or "")
+        completion_chars += sum(len(json.dumps(tool_call["arguments"])) for tool_call in response.get("tool_calls") or [])
+        return {"prompt_tokens": len(body) // 4, "completion_tokens": completion_chars // 4 + 1, "cached_tokens": 0}
+
+    def record_request(self, body_size: int, service_time: float) -> None:
+        with self._lock:
+            self.request_count += 1
+            self.request_bytes.append(body_size)
+            self.service_times.append(service_time)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.request_count = 0
+            self.request_bytes = []
+            self.service_times = []
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭空闲的长连接不算错误
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self) -> "MockChatServer":
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-chat-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,192 @@
+"""
+生成基准测试用的合成代码仓库和目录
+
+内容由参数和版本号完全确定，同样参数的目录已经存在时直接复用（10 万个文件的仓库生成一次需要几十秒）。
+"""
+import os
+import json
+import shutil
+
+
+# 生成规则变化时加一，已有的仓库会重新生成
+repo_version = 1
+marker_file_name = ".synthetic_repo.json"
+files_per_dir = 20
+# 每个目录最多的子目录数，目录层级按文件序号的十进制位展开
+dirs_per_dir = 10
+
+
+def get_file_path(root_dir: str, index: int) -> str:
+    """第 index 个文件的路径：pkg_a/pkg_b/.../module_{index}.py"""
+    dir_index = index // files_per_dir
+    parts = []
+    while dir_index > 0:
+        dir_index, digit = divmod(dir_index, dirs_per_dir)
+        parts.append(f"pkg_{digit}")
+    return os.path.join(root_dir, *reversed(parts), f"module_{index}.py")
+
+
+def get_module_text(index: int) -> str:
+    """每个文件约 600 字节：唯一的函数名和常量，以及所有文件共有的 import 和注释（用于搜索时的大量命中）"""
+    return (
+        f'"""合成模块 {index}"""\n'
+        f"import os\n"
+        f"\n"
+        f"MODULE_ID = {index}\n"
+        f"value = 0\n"
+        f"\n"
+        f"\n"
+        f"class Handler{index}:\n"
+        f"    def __init__(self, name):\n"
+        f"        self.name = name\n"
+        f"\n"
+        f"    def run(self, items):\n"
+        f"        # TODO: 合并重复的处理逻辑\n"
+        f"        return [self.name + str(item) for item in items]\n"
+        f"\n"
+        f"\n"
+        f"def compute_{index}(x, y = {index % 97}):\n"
+        f"    total = 0\n"
+        f"    for i in range(x):\n"
+        f"        total += i * y\n"
+        f"    return total + MODULE_ID\n"
+        f"\n"
+        f"\n"
+        f"def load_{index}(path):\n"
+        f"    with open(os.path.join(path, 'data_{index}.txt'), 'r', encoding='utf-8') as f:\n"
+        f"        return f.read()\n"
+    )
+
+
+def _is_generated(root_dir: str, marker: dict) -> bool:
+    """目录已经按同样的参数生成过时返回 True，否则清空目录，由调用方重新生成"""
+    try:
+        with open(os.path.join(root_dir, marker_file_name), 'r', encoding='utf-8') as f:
+            if json.load(f) == marker:
+                return True
+    except (OSError, ValueError):
+        pass
+    if os.path.exists(root_dir):
+        shutil.rmtree(root_dir)
+    os.makedirs(root_dir)
+    return False
+
+
+def _write_marker(root_dir: str, marker: dict) -> None:
+    # 最后写入标记，生成中途中断的目录下次会重新生成
+    with open(os.path.join(root_dir, marker_file_name), 'w', encoding='utf-8') as f:
+        json.dump(marker, f)
+
+
+def create_synthetic_repo(root_dir: str, file_count: int) -> str:
+    """生成（或复用）有 file_count 个 Python 文件的仓库，返回仓库的绝对路径"""
+    root_dir = os.path.abspath(root_dir)
+    marker = {"version": repo_version, "shape": "repo", "file_count": file_count}
+    if _is_generated(root_dir, marker):
+        return root_dir
+
+    created_dirs = set()
+    for index in range(file_count):
+        file_path = get_file_path(root_dir, index)
+        dir_path = os.path.dirname(file_path)
+        if dir_path not in created_dirs:
+            os.makedirs(dir_path, exist_ok=True)
+            created_dirs.add(dir_path)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(get_module_text(index))
+    with open(os.path.join(root_dir, ".gitignore"), 'w', encoding='utf-8') as f:
+        f.write("__pycache__/\n*.pyc\n")
+    _write_marker(root_dir, marker)
+    return root_dir
+
+
+def create_wide_dir(root_dir: str, file_count: int) -> str:
+    """一个目录下直接放 file_count 个小文件"""
+    root_dir = os.path.abspath(root_dir)
+    marker = {"version": repo_version, "shape": "wide", "file_count": file_count}
+    if _is_generated(root_dir, marker):
+        return root_dir
+
+    for index in range(file_count):
+        with open(os.path.join(root_dir, f"module_{index}.py"), 'w', encoding='utf-8') as f:
+            f.write(get_module_text(index))
+    _write_marker(root_dir, marker)
+    return root_dir
+
+
+def create_deep_dir(root_dir: str, depth: int) -> str:
+    """depth 层单链嵌套的目录，每层有两个小文件"""
+    root_dir = os.path.abspath(root_dir)
+    marker = {"version": repo_version, "shape": "deep", "depth": depth}
+    if _is_generated(root_dir, marker):
+        return root_dir
+
+    dir_path = root_dir
+    for level in range(depth):
+        dir_path = os.path.join(dir_path, "d")
+        os.makedirs(dir_path)
+        for index in (level * 2, level * 2 + 1):
+            with open(os.path.join(dir_path, f"module_{index}.py"), 'w', encoding='utf-8') as f:
+                f.write(get_module_text(index))
+    _write_marker(root_dir, marker)
+    return root_dir
+
+
+# 大文件的最后一行，编辑测试中用它作为唯一的旧文本
+large_file_end_line = "END_MARKER = 'end'\n"
+
+
+def create_large_file(file_path: str, size_bytes: int, encoding: str = 'utf-8') -> str:
+    """
+    生成约 size_bytes 字节的代码文件（每行约 60 字节，含中文注释），以 large_file_end_line 结尾
+
+    已存在且编码和大小相同时直接复用。
+    """
+    file_path = os.path.abspath(file_path)
+    line_template = "    total_{index} = compute(x, {index})  # 计算第 {index} 项\n"
+    marker = {"version": repo_version, "shape": "large_file", "size_bytes": size_bytes, "encoding": encoding}
+    marker_path = file_path + ".json"
+    try:
+        with open(marker_path, 'r', encoding='utf-8') as f:
+            if json.load(f) == marker and os.path.isfile(file_path):
+                return file_path
+    except (OSError, ValueError):
+        pass
+
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    written_bytes = 0
+    index = 0
+    with open(file_path, 'w', encoding=encoding, newline='\n') as f:
+        f.write("def compute_all(x):\n")
+        while written_bytes < size_bytes:
+            # 每次写入一批行，避免逐行调用 write
+            lines = "".join(line_template.format(index=index + i) for i in range(1000))
+            f.write(lines)
+            written_bytes += len(lines.encode(encoding))
+            index += 1000
+        f.write(large_file_end_line)
+    with open(marker_path, 'w', encoding='utf-8') as f:
+        json.dump(marker, f)
+    return file_path
+
+
+def create_mixed_encoding_files(root_dir: str) -> dict[str, str]:
+    """不同编码和换行符的小文件，返回 {类型: 路径}"""
+    root_dir = os.path.abspath(root_dir)
+    os.makedirs(root_dir, exist_ok=True)
+    text = "".join(f"# 第 {i} 行：中文注释和 ASCII 代码混合\nvalue_{i} = '数据 {i}'\n" for i in range(2000))
+    contents = {
+        "utf8": text.encode('utf-8'),
+        "utf8_bom": b"\xef\xbb\xbf" + text.encode('utf-8'),
+        "gbk": text.encode('gbk'),
+        "crlf": text.replace("\n", "\r\n").encode('utf-8'),
+        "ascii": get_module_text(0).encode('ascii', errors='replace') * 50,
+        "binary": bytes(range(256)) * 64,
+    }
+    file_paths = {}
+    for kind, data in contents.items():
+        file_path = os.path.join(root_dir, f"{kind}.txt")
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        file_paths[kind] = file_path
+    return file_paths
@@ -0,0 +1,243 @@
+"""
+无界面的命令行入口
+
+单个任务（从文件或标准输入读取，回复流式输出到终端）：
+    python cli.py --root-dir D:/project task.txt
+    echo "解释一下这个项目的结构" | python cli.py --root-dir D:/project
+
+批量任务（JSONL，每行一个任务，多个任务并发运行，结果逐行写入输出文件）：
+    python cli.py --batch tasks.jsonl --output results.jsonl --workers 8
+    任务行：{"id": "t1", "task": "...", "root_dir": "...", "work_dir": "...（可选）", "model": "...（可选）"}
+    格式有误的行不影响其他任务，结果中记录 {"id": ..., "line": 行号, "status": "error", "error": ...}
+
+汇总指标日志（省略文件时汇总 saved_chats/metrics 下的全部日志），结果以 JSON 输出：
+    python cli.py --report
+    python cli.py --report saved_chats/metrics/2025_07_01.jsonl > report.json
+"""
+import os
+import sys
+import glob
+import json
+import time
+import asyncio
+import argparse
+
+from helpers.agent_engine import AgentEngine, AgentEvents
+from helpers.model_api_client import openrouter_model_names
+from helpers.request_retry import get_resilient_requester
+from helpers.telemetry import metrics_dir_path, read_metrics, summarize_metrics
+
+
+default_model_name = openrouter_model_names["anthropic"][0]
+# 终端中工具返回只显示开头的字符数
+max_printed_tool_chars = 200
+
+
+class TerminalEvents(AgentEvents):
+    """把回复正文流式输出到标准输出，思考内容、工具调用和错误输出到标准错误"""
+
+    def __init__(self, is_verbose: bool = True) -> None:
+        self.is_verbose: bool = is_verbose
+        self.last_kind: str | None = None
+
+    def _write(self, stream, text: str) -> None:
+        stream.write(text)
+        stream.flush()
+
+    def on_assistant_delta(self, message_id, kind, text):
+        if kind != self.last_kind and self.last_kind is not None:
+            self._write(sys.stderr, "\n")
+        self.last_kind = kind
+        if kind == "content":
+            self._write(sys.stdout, text)
+        elif self.is_verbose:
+            self._write(sys.stderr, text)
+
+    def on_assistant_message(self, message_id, message_index, message_dict):
+        if self.last_kind is not None:
+            self._write(sys.stdout if self.last_kind == "content" else sys.stderr, "\n")
+        self.last_kind = None
+
+    def on_tool_result(self, message_id, message_index, tool_name, tool_content):
+        if self.is_verbose:
+            preview = " ".join(tool_content[:max_printed_tool_chars].split())
+            self._write(sys.stderr, f"[{tool_name}] {preview}\n")
+
+    def on_retry(self, attempt, delay, error_message):
+        self._write(sys.stderr, f"[重试 {attempt}，{delay:.1f} 秒后] {error_message}\n")
+
+    def on_fallback(self, failed_model, next_model, error_message):
+        self._write(sys.stderr, f"[{failed_model} 不可用，改用 {next_model}] {error_message}\n")
+
+    def on_error(self, error_message):
+        self._write(sys.stderr, f"[错误] {error_message}\n")
+
+
+class BatchTaskEvents(AgentEvents):
+    """批量运行时只记录错误，不输出增量"""
+
+    def __init__(self) -> None:
+        self.error_message: str | None = None
+        self.tool_call_count: int = 0
+
+    def on_tool_result(self, message_id, message_index, tool_name, tool_content):
+        self.tool_call_count += 1
+
+    def on_error(self, error_message):
+        self.error_message = error_message
+
+
+async def run_single_task(args, task: str) -> int:
+    engine = AgentEngine(args.root_dir, args.work_dir or args.root_dir, args.model, TerminalEvents(not args.quiet), args.session, delta_interval=0)
+    try:
+        message_dict = await engine.run(task, args.max_tool_rounds)
+    finally:
+        engine.close()
+    sys.stderr.write(f"会话已保存到：{os.path.abspath(engine.session_log.file_path)}\n")
+    return 0 if message_dict is not None else 1
+
+
+def get_task_line_error(task_line) -> str | None:
+    """检查批量任务的一行，有问题时返回错误信息"""
+    if not isinstance(task_line, dict):
+        return "任务行必须是 JSON 对象"
+    for key in ("task", "root_dir"):
+        if not isinstance(task_line.get(key), str) or not task_line[key].strip():
+            return f"缺少字段 '{key}'，或它不是非空的字符串"
+    for key in ("work_dir", "model"):
+        if task_line.get(key) is not None and not isinstance(task_line[key], str):
+            return f"字段 '{key}' 必须是字符串"
+    return None
+
+
+async def run_batch_task(line_number: int, line: str, args, semaphore: asyncio.Semaphore) -> dict:
+    """运行批量任务的一行；这一行无法解析或缺少字段时只返回这一行的错误结果，不影响其他任务"""
+    try:
+        task_line = json.loads(line)
+    except ValueError as e:
+        return {"id": None, "line": line_number, "status": "error", "error": f"任务行不是合法的 JSON：{e}"}
+    result = {"id": task_line.get("id") if isinstance(task_line, dict) else None, "line": line_number}
+    task_line_error = get_task_line_error(task_line)
+    if task_line_error is not None:
+        result.update({"status": "error", "error": task_line_error})
+        return result
+
+    async with semaphore:
+        started_at = time.monotonic()
+        events = BatchTaskEvents()
+        try:
+            root_dir = os.path.abspath(task_line["root_dir"])
+            work_dir = os.path.abspath(task_line.get("work_dir") or root_dir)
+            engine = AgentEngine(root_dir, work_dir, task_line.get("model") or args.model, events)
+        except (KeyError, OSError, ValueError) as e:
+            result.update({"status": "error", "error": f"无法创建任务：{e!r}"})
+            return result
+        try:
+            message_dict = await engine.run(task_line["task"], args.max_tool_rounds)
+        finally:
+            engine.close()
+
+        result.update({
+            "status": "ok" if message_dict is not None else "error",
+            "model": engine.main_agent.last_model_name,
+            "content": message_dict.get("content") if message_dict is not None else None,
+            "error": events.error_message,
+            "tool_calls": events.tool_call_count,
+            "cost": engine.telemetry.get_totals()["cost"],
+            "elapsed": round(time.monotonic() - started_at, 3),
+            "session_path": os.path.abspath(engine.session_log.file_path),
+        })
+        return result
+
+
+async def run_batch(args) -> int:
+    # 每一行在各自的任务中解析，格式有误的行只记录错误结果
+    with open(args.batch, 'r', encoding='utf-8') as f:
+        task_lines = [(line_number, line) for line_number, line in enumerate(f, 1) if line.strip()]
+
+    # 所有任务的工具调用都在共用的工具线程池中执行，每个任务有自己的并发配额
+    semaphore = asyncio.Semaphore(args.workers)
+    failed_count = 0
+    with open(args.output, 'a', encoding='utf-8') as output_file:
+        tasks = [asyncio.ensure_future(run_batch_task(line_number, line, args, semaphore)) for line_number, line in task_lines]
+        # 按完成顺序写入，中途中断时已完成的结果不会丢失
+        for done_count, task in enumerate(asyncio.as_completed(tasks), 1):
+            result = await task
+            if result["status"] != "ok":
+                failed_count += 1
+            output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output_file.flush()
+            task_name = result["id"] if result["id"] is not None else f"第 {result['line']} 行"
+            sys.stderr.write(f"[{done_count}/{len(tasks)}] {task_name}: {result['status']}\n")
+    return 0 if failed_count == 0 else 1
+
+
+def print_report(metrics_paths: list[str]) -> int:
+    if not metrics_paths:
+        sys.stderr.write("没有找到指标日志\n")
+        return 2
+    summary = summarize_metrics(read_metrics(metrics_paths))
+    sys.stdout.write(json.dumps(summary, ensure_ascii=False, indent=2) + "\n")
+    return 0
+
+
+def parse_args(argv = None):
+    parser = argparse.ArgumentParser(description="无界面运行编程助手")
+    parser.add_argument("task_file", nargs="?", help="任务文件；省略时从标准输入读取")
+    parser.add_argument("--root-dir", help="项目根目录（单个任务时必填）")
+    parser.add_argument("--work-dir", help="工作目录，默认与项目根目录相同")
+    parser.add_argument("--model", default=default_model_name, help=f"模型名称，默认 {default_model_name}")
+    parser.add_argument("--session", help="继续已保存的会话日志")
+    parser.add_argument("--max-tool-rounds", type=int, help="每个任务最多执行的工具调用轮数")
+    parser.add_argument("--quiet", action="store_true", help="只输出回复正文，不输出思考内容和工具调用")
+    parser.add_argument("--batch", help="批量任务文件（JSONL）")
+    parser.add_argument("--output", default="batch_results.jsonl", help="批量结果文件（JSONL，追加写入）")
+    parser.add_argument("--workers", type=int, default=4, help="批量运行时同时进行的任务数")
+    parser.add_argument("--requests-per-second", type=float, help="每个模型每秒最多发出的请求数（令牌桶），批量运行时可以按账户的限额调高")
+    parser.add_argument("--report", nargs="*", metavar="METRICS_FILE", help="汇总指标日志（每个模型的耗时和费用、每个工具的耗时、每个会话的费用）后退出")
+    args = parser.parse_args(argv)
+
+    if args.report is not None:
+        return args
+    if args.batch is None and args.root_dir is None:
+        parser.error("单个任务需要 --root-dir")
+    if args.workers < 1:
+        parser.error("--workers 至少为 1")
+    if args.requests_per_second is not None and args.requests_per_second <= 0:
+        parser.error("--requests-per-second 必须大于 0")
+    return args
+
+
+def main(argv = None) -> int:
+    args = parse_args(argv)
+    if args.report is not None:
+        metrics_paths = args.report or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), metrics_dir_path, "*.jsonl")))
+        return print_report(metrics_paths)
+    # 路径都先转为绝对路径，再切换到程序目录（提示词、会话日志和缓存都使用相对路径）
+    for name in ("root_dir", "work_dir", "session", "task_file", "batch", "output"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    if args.task_file is None and args.batch is None:
+        task = sys.stdin.read()
+    elif args.batch is None:
+        with open(args.task_file, 'r', encoding='utf-8') as f:
+            task = f.read()
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if args.requests_per_second is not None:
+        requester = get_resilient_requester()
+        requester.requests_per_second = args.requests_per_second
+        requester.burst = max(requester.burst, args.requests_per_second)
+
+    try:
+        if args.batch is not None:
+            return asyncio.run(run_batch(args))
+        if not task.strip():
+            sys.stderr.write("任务内容为空\n")
+            return 2
+        return asyncio.run(run_single_task(args, task))
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,20 +1,23 @@
-import json
 import uuid
 import os
+import queue
+import threading
+from bisect import bisect_right
 from datetime import datetime
 
-from PySide6.QtCore import Qt, QObject, QThread, Signal, QSize
+from PySide6.QtCore import Qt, QObject, Signal, QSize, QEvent, QTimer, QPoint, QRect, QMarginsF
 from PySide6.QtSvgWidgets import QSvgWidget
 from PySide6.QtWidgets import (
-    QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QPushButton, QFrame, QLabel, QScrollArea, QTextBrowser, QFileDialog, QComboBox, QLineEdit, QDialog, QMessageBox
+    QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QPushButton, QFrame, QLabel, QAbstractScrollArea, QTextBrowser, QFileDialog, QComboBox, QLineEdit, QDialog, QMessageBox, QProgressDialog, QTabWidget
 )
-from PySide6.QtGui import QFont, QShortcut, QFontDatabase, QIcon, QInputMethodEvent, QPixmap
-
-from helpers.agent import Agent
-from helpers.model_api_client import openrouter_client, openrouter_model_names
-from helpers.get_prompt import get_prompt
-from tools.tools_list import tools_list, tools_mapping
+from PySide6.QtGui import QFont, QShortcut, QFontDatabase, QIcon, QInputMethodEvent, QImage, QRegion, QPdfWriter, QPageSize, QTextCursor, QPainter, QTextDocumentFragment, QTextBlockFormat, QTextCharFormat
 
+from helpers.agent_engine import AgentEngine, AgentEvents
+from helpers.async_runtime import get_event_loop_thread
+from helpers.markdown_renderer import get_markdown_renderer
+from helpers.html_export import write_chat_html
+from helpers.session_store import list_sessions
+from helpers.model_api_client import openrouter_model_names
 
 vertical_scrollBar_style_sheet = """
 QScrollBar:vertical {
@@ -63,6 +66,13 @@ def load_font():
     # print(f"  可用样式: {styles}")
 
 
+def append_plain_text(text_browser, text):
+    """在文本末尾追加内容（不换行），使用独立光标，不影响用户当前的选区"""
+    cursor = QTextCursor(text_browser.document())
+    cursor.movePosition(QTextCursor.End)
+    cursor.insertText(text)
+
+
 class CustomPlainTextEdit(QPlainTextEdit):
     """自定义输入框，解决拼音输入法时占位符不消失的问题"""
     
@@ -132,76 +142,132 @@ class CustomPlainTextEdit(QPlainTextEdit):
                 super().setPlaceholderText("")
 
 
-class AgentWorker(QObject):
+class AgentWorker(QObject, AgentEvents):
+    """把 AgentEngine 的事件转发为 Qt 信号，引擎在共用的后台事件循环线程中运行"""
+
     get_assistant_message_dict = Signal(object, dict)
     get_tool_result = Signal(object, str, str)
     finished = Signal()
     get_message_id = Signal(object, int)
     start_work = Signal(str)
-
-    def __init__(self, root_dir, work_dir, selected_model):
+    start_assistant_message = Signal(object)
+    get_assistant_delta = Signal(object, str, str)
+    # (下一次尝试的序号, 等待秒数, 错误信息)
+    request_retrying = Signal(int, float, str)
+    request_failed = Signal(str)
+    # (失败的模型, 改用的模型, 错误信息)
+    model_fallback = Signal(str, str, str)
+    # 会话的指标合计（SessionTelemetry.get_totals()）
+    metrics_updated = Signal(dict)
+
+    def __init__(self, root_dir, work_dir, selected_model, session_path = None):
         super().__init__()
-        
-        self.main_agent = Agent(
-            agent_name="main_agent",
-            client=openrouter_client,
-            model_name=selected_model,
-            system_prompt=get_prompt(
-                prompt_name="main_system",
-                variables={
-                    "root_dir_path": root_dir,
-                    "cwd_path": work_dir
-                }
-            ),
-            tools=tools_list
-        )
+
+        self.engine = AgentEngine(root_dir, work_dir, selected_model, self, session_path)
+        self.main_agent = self.engine.main_agent
+        self.restored_message_times = self.engine.restored_message_times
+
+        # 所有会话共用一个后台事件循环线程，信号从该线程发出后以排队方式送达界面线程
+        self.event_loop_thread = get_event_loop_thread()
+        self.current_future = None
+        self.idle_event = threading.Event()
+        self.idle_event.set()
+        # 关闭时任务还没有结束，由任务结束时关闭引擎
+        self.close_lock = threading.Lock()
+        self.is_shut_down = False
         
         self.start_work.connect(self.run)
 
+    def on_assistant_start(self, message_id):
+        self.start_assistant_message.emit(message_id)
+
+    def on_assistant_delta(self, message_id, kind, text):
+        self.get_assistant_delta.emit(message_id, kind, text)
+
+    def on_assistant_message(self, message_id, message_index, message_dict):
+        self.get_message_id.emit(message_id, message_index)
+        self.get_assistant_message_dict.emit(message_id, message_dict)
+
+    def on_tool_result(self, message_id, message_index, tool_name, tool_content):
+        self.get_message_id.emit(message_id, message_index)
+        self.get_tool_result.emit(message_id, tool_name, tool_content)
+
+    def on_retry(self, attempt, delay, error_message):
+        self.request_retrying.emit(attempt, delay, error_message)
+
+    def on_fallback(self, failed_model, next_model, error_message):
+        self.model_fallback.emit(failed_model, next_model, error_message)
+
+    def on_error(self, error_message):
+        self.request_failed.emit(error_message)
+
+    def on_metrics(self, totals):
+        self.metrics_updated.emit(totals)
+
+    async def run_async(self, user_content):
+        try:
+            await self.engine.run(user_content)
+        finally:
+            with self.close_lock:
+                self.idle_event.set()
+                is_shut_down = self.is_shut_down
+            if is_shut_down:
+                self.engine.close()
+            self.finished.emit()
+
     def run(self, user_content):
-        message_dict = self.main_agent.user_call(user_content)
-        assistant_message_id = uuid.uuid4()
-        assistant_message_index = len(self.main_agent.messages) - 1
-        self.get_message_id.emit(assistant_message_id, assistant_message_index)
-        self.get_assistant_message_dict.emit(assistant_message_id, message_dict)
-
-        assistant_tool_calls = message_dict.get("tool_calls")
-        while assistant_tool_calls is not None:
-            for assistant_tool_call in assistant_tool_calls:
-                tool_name = assistant_tool_call["function"]["name"]
-                tool = tools_mapping[tool_name]
-                tool_args = json.loads(assistant_tool_call["function"]["arguments"])
-                tool_id = assistant_tool_call["id"]
-                tool_return = tool(**tool_args)
-                tool_content = str(tool_return)
-
-                self.main_agent.messages.append(
-                    {
-                        "role": "tool",
-                        "tool_call_id": tool_id,
-                        "content": tool_content
-                    }
-                )
-                tool_message_id = uuid.uuid4()
-                tool_message_index = len(self.main_agent.messages) - 1
-                self.get_message_id.emit(tool_message_id, tool_message_index)
-
-                self.get_tool_result.emit(tool_message_id, tool_name, tool_content)
-            message_dict = self.main_agent()
-            assistant_message_id = uuid.uuid4()
-            assistant_message_index = len(self.main_agent.messages) - 1
-            self.get_message_id.emit(assistant_message_id, assistant_message_index)
-            self.get_assistant_message_dict.emit(assistant_message_id, message_dict)
-
-            assistant_tool_calls = message_dict.get("tool_calls")
-
-        self.finished.emit()
+        self.idle_event.clear()
+        self.current_future = self.event_loop_thread.submit(self.run_async(user_content))
+
+    def stop(self):
+        """取消正在进行的模型请求和工具循环"""
+        if self.current_future is not None:
+            self.current_future.cancel()
+
+    def shutdown(self, timeout = 3.0):
+        """
+        取消当前任务并最多等待 timeout 秒后关闭引擎
+
+        超时时任务仍在写入消息和会话日志，此时不关闭，改由任务结束时关闭，避免丢失之后的消息。
+        """
+        self.stop()
+        self.idle_event.wait(timeout)
+        with self.close_lock:
+            self.is_shut_down = True
+            if not self.idle_event.is_set():
+                return
+        self.engine.close()
 
 
 class MessageContentWidget(QTextBrowser):
-    def __init__(self):
+    """
+    消息正文
+
+    助手的回复按 Markdown 渲染：解析和代码着色在后台线程中进行，结果到达前先显示纯文本。
+    流式输出时只把已经完整的块（代码块之外的空行、代码块的结束行之前的内容）提交渲染，
+    渲染结果替换文档中对应的纯文本，尚未完整的末尾部分仍以纯文本追加，不会在每次增量时重新解析整条消息。
+    """
+
+    def __init__(self, is_markdown = False):
         super().__init__()
 
+        self.is_markdown = is_markdown
+        self.source_text = ""
+        # 已提交渲染和已完成渲染的源文本长度、已扫描到的源文本位置，以及扫描位置是否在代码块内
+        self.submitted_chars = 0
+        self.rendered_chars = 0
+        self.scanned_chars = 0
+        self.open_fence = None
+        # 文档中纯文本末尾部分的起始位置
+        self.rendered_end = 0
+        # 等待结果的分块：render_key -> 源文本长度
+        self.pending_chunks = {}
+        self.pending_document_key = None
+        self.is_streaming = False
+
+        self.markdown_renderer = get_markdown_renderer()
+        self.markdown_renderer.document_rendered.connect(self.on_document_rendered)
+
         self.document().documentLayout().documentSizeChanged.connect(self.on_document_size_changed)
 
         font = QFont(font_family_name)
@@ -215,112 +281,167 @@ QTextBrowser {
 }
 """
         self.setStyleSheet(style_sheet)
+        self.setOpenExternalLinks(True)
         self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
         self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
 
     def on_document_size_changed(self, new_size):
         self.setFixedHeight(int(new_size.height()))
 
+    def set_rendered_document(self, document):
+        document.setParent(self)
+        document.setDefaultFont(self.font())
+        self.setDocument(document)
+        document.documentLayout().documentSizeChanged.connect(self.on_document_size_changed)
+        self.on_document_size_changed(document.size())
+
+    def set_content(self, text):
+        """显示完整的内容；Markdown 有缓存时直接使用，否则先显示纯文本再等待后台渲染"""
+        self.source_text = text
+        self.setPlainText(text)
+        if not self.is_markdown or not text:
+            return
 
-class MessageReasoningWidget(QWidget):
-    def __init__(self):
-        super().__init__()
+        document = self.markdown_renderer.get_cached(text)
+        if document is not None:
+            self.set_rendered_document(document)
+            return
+        self.pending_document_key = uuid.uuid4()
+        self.markdown_renderer.render_async(text, self.pending_document_key)
+
+    def append_content(self, text):
+        """流式追加内容"""
+        self.is_streaming = True
+        self.source_text += text
+        append_plain_text(self, text)
+        if self.is_markdown:
+            self.submit_completed_chunks()
+
+    def finish_content(self):
+        """流式输出结束，剩余部分作为最后一块提交"""
+        if not self.is_streaming:
+            return
+        self.is_streaming = False
+        if not self.is_markdown:
+            return
+        if self.submitted_chars < len(self.source_text):
+            self.submit_chunk(len(self.source_text))
+        elif not self.pending_chunks:
+            self.markdown_renderer.store(self.source_text, self.document())
+
+    def submit_completed_chunks(self):
+        """扫描新增的完整行，在代码块之外的空行和代码块结束行之后切分并提交渲染"""
+        last_newline = self.source_text.rfind("\n", self.scanned_chars)
+        if last_newline == -1:
+            return
+        boundary = None
+        position = self.scanned_chars
+        for line in self.source_text[self.scanned_chars:last_newline + 1].splitlines(keepends=True):
+            position += len(line)
+            stripped_line = line.strip()
+            if self.open_fence is None:
+                if stripped_line.startswith("```") or stripped_line.startswith("~~~"):
+                    self.open_fence = stripped_line[:3]
+                elif stripped_line == "":
+                    boundary = position
+            elif stripped_line.startswith(self.open_fence) and stripped_line.strip(self.open_fence[0]) == "":
+                self.open_fence = None
+                boundary = position
+        self.scanned_chars = last_newline + 1
+        if boundary is not None and boundary > self.submitted_chars:
+            self.submit_chunk(boundary)
+
+    def submit_chunk(self, end):
+        chunk_text = self.source_text[self.submitted_chars:end]
+        self.submitted_chars = end
+        render_key = uuid.uuid4()
+        self.pending_chunks[render_key] = len(chunk_text)
+        self.markdown_renderer.render_async(chunk_text, render_key, is_cacheable=False)
+
+    def on_document_rendered(self, render_key, document):
+        if render_key == self.pending_document_key:
+            self.pending_document_key = None
+            self.set_rendered_document(document.clone())
+            return
 
-        font = QFont(font_family_name)
-        font.setPixelSize(14)
-        font.setWeight(QFont.Weight.Normal)
+        chunk_chars = self.pending_chunks.pop(render_key, None)
+        if chunk_chars is None:
+            return
+        self.rendered_chars += chunk_chars
+        tail_text = self.source_text[self.rendered_chars:]
+        has_tail = tail_text != "" or self.is_streaming
+
+        if self.rendered_end == 0:
+            # 第一块直接作为整个文档，之后的纯文本另起一个默认格式的块
+            self.set_rendered_document(document.clone())
+            cursor = QTextCursor(self.document())
+            cursor.movePosition(QTextCursor.End)
+            if has_tail:
+                cursor.insertBlock(QTextBlockFormat(), QTextCharFormat())
+            self.rendered_end = cursor.position()
+            cursor.insertText(tail_text)
+        else:
+            # 用渲染结果替换对应的纯文本
+            cursor = QTextCursor(self.document())
+            cursor.setPosition(self.rendered_end)
+            cursor.setPosition(min(self.rendered_end + chunk_chars, self.document().characterCount() - 1), QTextCursor.KeepAnchor)
+            cursor.beginEditBlock()
+            cursor.removeSelectedText()
+            cursor.insertFragment(QTextDocumentFragment(document))
+            fix_cursor = QTextCursor(self.document())
+            if document.begin().textList() is not None:
+                # 片段以列表开头时会另起一块，删掉插入位置留下的空块
+                fix_cursor.setPosition(self.rendered_end - 1)
+                fix_cursor.setPosition(self.rendered_end, QTextCursor.KeepAnchor)
+                fix_cursor.removeSelectedText()
+            else:
+                # 其他情况下片段的第一块沿用了插入位置所在块的格式，恢复为渲染结果中的格式（标题、代码块等）
+                fix_cursor.setPosition(self.rendered_end)
+                fix_cursor.setBlockFormat(document.begin().blockFormat())
+            if has_tail:
+                cursor.insertBlock(QTextBlockFormat(), QTextCharFormat())
+            cursor.endEditBlock()
+            self.rendered_end = cursor.position()
 
-        main_layout = QVBoxLayout(self)
-        main_layout.setContentsMargins(0, 0, 0, 0)
-        main_layout.setSpacing(0)
+        if not self.pending_chunks and not self.is_streaming and self.rendered_chars == len(self.source_text):
+            self.markdown_renderer.store(self.source_text, self.document())
 
-        self.toggle_button = QPushButton("思考内容")
-        self.toggle_button.setLayoutDirection(Qt.RightToLeft)
-        self.toggle_button.setIcon(QIcon("assets/images/icon/message_expand.svg"))
-        self.toggle_button.setIconSize(QSize(24, 24))
-        self.toggle_button.setFont(font)
-        self.toggle_button.setFixedHeight(28)
-        self.toggle_button_style_sheet = """
-QPushButton {
-    border: 1px solid #d9d9d9;
-    border-radius: 8px;
-    background-color: #FFFFFF;
-    text-align: left;
-    padding: 6px
-}
-"""
-        self.expanded_toggle_button_style_sheet = """
-QPushButton {
-    border-top: 1px solid #d9d9d9;
-    border-right: 1px solid #d9d9d9;
-    border-bottom: none;
-    border-left: 1px solid #d9d9d9;
-    border-top-left-radius: 8px;
-    border-top-right-radius: 8px;
-    border-bottom-right-radius: 0;
-    border-bottom-left-radius: 0;
-    background-color: #FFFFFF;
-    text-align: left;
-    padding: 6px
-}
-"""
-        self.toggle_button.setStyleSheet(self.toggle_button_style_sheet)
-        self.toggle_button.clicked.connect(self.toggle_content)
-        main_layout.addWidget(self.toggle_button)
 
-        self.content_widget = QTextBrowser()
-        self.content_widget.setFont(font)
-        self.content_widget.setFixedHeight(100)
-        content_widget_style_sheet = f"""
-QTextBrowser {{
-    background-color: #FFFFFF; 
-    border: 1px solid #d9d9d9;
-}}
+class CollapsibleTextPanel(QWidget):
+    """
+    可折叠的纯文本面板（思考内容、工具调用、工具返回）
 
-{vertical_scrollBar_style_sheet}
-"""
-        self.content_widget.setStyleSheet(content_widget_style_sheet)
+    面板只保存原始字符串，折叠时显示开头几行和大小作为预览；第一次展开时才创建 QTextBrowser 并排版，
+    超长内容按 chunk_chars 分块显示，点击“加载更多”再追加下一块。
+    """
 
-        self.content_widget.hide()
-        self.is_expanded = False
-        main_layout.addWidget(self.content_widget)
-
-        self.setLayout(main_layout)
+    title = ""
+    preview_line_count = 2
+    preview_line_chars = 100
+    chunk_chars = 100_000
 
-    def toggle_content(self):
-        if self.is_expanded:
-            self.content_widget.hide()
-            self.toggle_button.setText("思考内容")
-            self.toggle_button.setIcon(QIcon("assets/images/icon/message_expand.svg"))
-            self.toggle_button.setIconSize(QSize(24, 24))
-            self.toggle_button.setStyleSheet(self.toggle_button_style_sheet)
-            self.is_expanded = False
-        else:
-            self.content_widget.show()
-            self.toggle_button.setText("思考内容")
-            self.toggle_button.setIcon(QIcon("assets/images/icon/message_expanded_down.svg"))
-            self.toggle_button.setIconSize(QSize(24, 24))
-            self.toggle_button.setStyleSheet(self.expanded_toggle_button_style_sheet)
-            self.is_expanded = True
-
-
-class MessageToolsCallWidget(QWidget):
     def __init__(self):
         super().__init__()
 
-        font = QFont(font_family_name)
-        font.setPixelSize(14)
-        font.setWeight(QFont.Weight.Normal)
+        self.raw_text = ""
+        self.shown_chars = 0
+        self.content_widget = None
+        self.load_more_button = None
+
+        self.text_font = QFont(font_family_name)
+        self.text_font.setPixelSize(14)
+        self.text_font.setWeight(QFont.Weight.Normal)
 
         main_layout = QVBoxLayout(self)
         main_layout.setContentsMargins(0, 0, 0, 0)
         main_layout.setSpacing(0)
+        self.main_layout = main_layout
 
-        self.toggle_button = QPushButton("工具调用")
+        self.toggle_button = QPushButton(self.title)
         self.toggle_button.setLayoutDirection(Qt.RightToLeft)
         self.toggle_button.setIcon(QIcon("assets/images/icon/message_expand.svg"))
         self.toggle_button.setIconSize(QSize(24, 24))
-        self.toggle_button.setFont(font)
+        self.toggle_button.setFont(self.text_font)
         self.toggle_button.setFixedHeight(28)
         self.toggle_button_style_sheet = """
 QPushButton {
@@ -350,90 +471,62 @@ QPushButton {
         self.toggle_button.clicked.connect(self.toggle_content)
         main_layout.addWidget(self.toggle_button)
 
-        self.content_widget = QTextBrowser()
-        self.content_widget.setFont(font)
-        self.content_widget.setFixedHeight(100)
-        content_widget_style_sheet = f"""
-QTextBrowser {{
-    background-color: #FFFFFF; 
-    border: 1px solid #d9d9d9;
-}}
+        self.preview_label = QLabel()
+        preview_font = QFont(font_family_name)
+        preview_font.setPixelSize(12)
+        preview_font.setWeight(QFont.Weight.Normal)
+        self.preview_label.setFont(preview_font)
+        self.preview_label.setTextFormat(Qt.PlainText)
+        self.preview_label.setStyleSheet("color: #A0A0A0; padding: 2px 8px;")
+        self.preview_label.hide()
+        main_layout.addWidget(self.preview_label)
 
-{vertical_scrollBar_style_sheet}
-"""
-        self.content_widget.setStyleSheet(content_widget_style_sheet)
-
-        self.content_widget.hide()
         self.is_expanded = False
-        main_layout.addWidget(self.content_widget)
 
         self.setLayout(main_layout)
 
-    def toggle_content(self):
-        if self.is_expanded:
-            self.content_widget.hide()
-            self.toggle_button.setText("工具调用")
-            self.toggle_button.setIcon(QIcon("assets/images/icon/message_expand.svg"))
-            self.toggle_button.setIconSize(QSize(24, 24))
-            self.toggle_button.setStyleSheet(self.toggle_button_style_sheet)
-            self.is_expanded = False
-        else:
-            self.content_widget.show()
-            self.toggle_button.setText("工具调用")
-            self.toggle_button.setIcon(QIcon("assets/images/icon/message_expanded_down.svg"))
-            self.toggle_button.setIconSize(QSize(24, 24))
-            self.toggle_button.setStyleSheet(self.expanded_toggle_button_style_sheet)
-            self.is_expanded = True
-
-
-class ToolMessageWidget(QWidget):
-    def __init__(self):
-        super().__init__()
-
-        font = QFont(font_family_name)
-        font.setPixelSize(14)
-        font.setWeight(QFont.Weight.Normal)
-
-        main_layout = QVBoxLayout(self)
-        main_layout.setContentsMargins(0, 0, 0, 0)
-        main_layout.setSpacing(0)
-
-        self.toggle_button = QPushButton("工具返回")
-        self.toggle_button.setLayoutDirection(Qt.RightToLeft)
-        self.toggle_button.setIcon(QIcon("assets/images/icon/message_expand.svg"))
-        self.toggle_button.setIconSize(QSize(24, 24))
-        self.toggle_button.setFont(font)
-        self.toggle_button.setFixedHeight(28)
-        self.toggle_button_style_sheet = """
-QPushButton {
-    border: 1px solid #d9d9d9;
-    border-radius: 8px;
-    background-color: #FFFFFF;
-    text-align: left;
-    padding: 6px
-}
-"""
-        self.expanded_toggle_button_style_sheet = """
-QPushButton {
-    border-top: 1px solid #d9d9d9;
-    border-right: 1px solid #d9d9d9;
-    border-bottom: none;
-    border-left: 1px solid #d9d9d9;
-    border-top-left-radius: 8px;
-    border-top-right-radius: 8px;
-    border-bottom-right-radius: 0;
-    border-bottom-left-radius: 0;
-    background-color: #FFFFFF;
-    text-align: left;
-    padding: 6px
-}
-"""
-        self.toggle_button.setStyleSheet(self.toggle_button_style_sheet)
-        self.toggle_button.clicked.connect(self.toggle_content)
-        main_layout.addWidget(self.toggle_button)
+    def set_text(self, text):
+        """替换全部内容，已展开时重新显示第一块"""
+        self.raw_text = text
+        if self.content_widget is not None:
+            self.shown_chars = 0
+            self.content_widget.clear()
+            self.show_next_chunk()
+        self.update_summary()
+
+    def append_text(self, text):
+        """流式追加内容，已完整显示时直接追加到文档末尾"""
+        is_fully_shown = self.shown_chars == len(self.raw_text)
+        self.raw_text += text
+        if self.content_widget is not None and is_fully_shown:
+            append_plain_text(self.content_widget, text)
+            self.shown_chars = len(self.raw_text)
+        self.update_summary()
+
+    def update_summary(self):
+        """按钮上显示内容大小，折叠时显示开头几行"""
+        line_count = self.raw_text.count("\n") + (not self.raw_text.endswith("\n")) if self.raw_text else 0
+        self.toggle_button.setText(f"{self.title}（{len(self.raw_text):,} 字符，{line_count:,} 行）")
+
+        preview_lines = self.raw_text[:self.preview_line_count * self.preview_line_chars * 2].split("\n")[:self.preview_line_count]
+        preview_lines = [line if len(line) <= self.preview_line_chars else line[:self.preview_line_chars] + "..." for line in preview_lines]
+        preview_text = "\n".join(preview_lines).rstrip()
+        if preview_text != self.preview_label.text():
+            self.preview_label.setText(preview_text)
+        self.preview_label.setVisible(not self.is_expanded and preview_text != "")
+
+        if self.load_more_button is not None:
+            remaining_chars = len(self.raw_text) - self.shown_chars
+            self.load_more_button.setText(f"加载更多（剩余 {remaining_chars:,} 字符）")
+            self.load_more_button.setVisible(self.is_expanded and remaining_chars > 0)
+
+    def ensure_content_widget(self):
+        """第一次展开时才创建文档"""
+        if self.content_widget is not None:
+            return
 
         self.content_widget = QTextBrowser()
-        self.content_widget.setFont(font)
+        self.content_widget.setFont(self.text_font)
         self.content_widget.setFixedHeight(100)
         content_widget_style_sheet = f"""
 QTextBrowser {{
@@ -444,45 +537,77 @@ QTextBrowser {{
 {vertical_scrollBar_style_sheet}
 """
         self.content_widget.setStyleSheet(content_widget_style_sheet)
+        self.main_layout.addWidget(self.content_widget)
 
-        self.content_widget.hide()
-        self.is_expanded = False
-        main_layout.addWidget(self.content_widget)
-
-        self.setLayout(main_layout)
+        self.load_more_button = QPushButton()
+        self.load_more_button.setFont(self.text_font)
+        self.load_more_button.setFixedHeight(24)
+        self.load_more_button.setStyleSheet("""
+QPushButton {
+    border: 1px solid #d9d9d9;
+    border-top: none;
+    background-color: #FFFFFF;
+    color: #1890ff;
+}
+QPushButton:hover {
+    background-color: #e6f7ff;
+}
+""")
+        self.load_more_button.clicked.connect(self.show_next_chunk)
+        self.main_layout.addWidget(self.load_more_button)
+
+        self.show_next_chunk()
+
+    def show_next_chunk(self):
+        """追加显示下一块内容，尽量在换行处分块"""
+        start = self.shown_chars
+        end = min(start + self.chunk_chars, len(self.raw_text))
+        if end < len(self.raw_text):
+            newline_index = self.raw_text.rfind("\n", start, end)
+            if newline_index > start:
+                end = newline_index + 1
+        if end > start:
+            append_plain_text(self.content_widget, self.raw_text[start:end])
+        self.shown_chars = end
+        self.update_summary()
 
     def toggle_content(self):
         if self.is_expanded:
             self.content_widget.hide()
-            self.toggle_button.setText("工具返回")
             self.toggle_button.setIcon(QIcon("assets/images/icon/message_expand.svg"))
             self.toggle_button.setIconSize(QSize(24, 24))
             self.toggle_button.setStyleSheet(self.toggle_button_style_sheet)
             self.is_expanded = False
         else:
+            self.is_expanded = True
+            self.ensure_content_widget()
             self.content_widget.show()
-            self.toggle_button.setText("工具返回")
             self.toggle_button.setIcon(QIcon("assets/images/icon/message_expanded_down.svg"))
             self.toggle_button.setIconSize(QSize(24, 24))
             self.toggle_button.setStyleSheet(self.expanded_toggle_button_style_sheet)
-            self.is_expanded = True
+        self.update_summary()
+
+
+class MessageReasoningWidget(CollapsibleTextPanel):
+    title = "思考内容"
+
+
+class MessageToolsCallWidget(CollapsibleTextPanel):
+    title = "工具调用"
+
+
+class ToolMessageWidget(CollapsibleTextPanel):
+    title = "工具返回"
 
 
 class MessageWidget(QFrame):
     delete_requested = Signal(object, object)
 
-    def __init__(
-            self,
-            message_id,
-            avatar_path,
-            sender,
-            message_content,
-            reasoning = None,
-            tool_calls = None
-    ):
-        super().__init__()
+    def __init__(self, record, parent = None):
+        super().__init__(parent)
 
-        self.message_id = message_id
+        self.message_id = record.message_id
+        self.role = record.role
 
         self.setStyleSheet("""
 QFrame {
@@ -501,7 +626,7 @@ QFrame {
         header_layout.setContentsMargins(0, 0, 0, 0)
         header_layout.setSpacing(5)
 
-        avatar_svg = QSvgWidget(avatar_path)
+        avatar_svg = QSvgWidget(record.avatar_path)
         avatar_svg.setFixedSize(35, 35)
         header_layout.addWidget(avatar_svg)
 
@@ -515,7 +640,7 @@ QFrame {
         font.setPixelSize(14)
         font.setWeight(QFont.Weight.Bold)
         sender_name.setFont(font)
-        sender_name.setText(sender)
+        sender_name.setText(record.sender)
         info_layout.addWidget(sender_name)
 
         info_layout.addStretch()
@@ -526,7 +651,7 @@ QFrame {
         font.setWeight(QFont.Weight.Normal)
         time_info.setFont(font)
         time_info.setStyleSheet("color: #A0A0A0")
-        time_info.setText(datetime.now().strftime("%m/%d %H:%M"))
+        time_info.setText(record.time_text)
         info_layout.addWidget(time_info)
 
         header_layout.addWidget(info_container)
@@ -555,60 +680,638 @@ QPushButton:pressed {
 
         main_layout.addWidget(header_container)
 
-        if sender in tools_mapping:
-            tool_content_display = ToolMessageWidget()
-            tool_content_display.content_widget.setPlainText(message_content)
-            main_layout.addWidget(tool_content_display)
+        self.main_layout = main_layout
+        self.reasoning_display = None
+        self.content_display = None
+        self.tools_calls_display = None
+
+        self.tool_content_display = None
+
+        if record.role == "tool":
+            self.tool_content_display = ToolMessageWidget()
+            self.tool_content_display.set_text(record.content)
+            main_layout.addWidget(self.tool_content_display)
         else:
-            if reasoning is not None:
-                reasoning_display = MessageReasoningWidget()
-                reasoning_display.content_widget.setPlainText(reasoning)
-                main_layout.addWidget(reasoning_display)
+            if record.reasoning is not None:
+                self.ensure_reasoning_display().set_text(record.reasoning)
 
-            if message_content != "":
-                content_display = MessageContentWidget()
-                content_display.setPlainText(message_content)
-                main_layout.addWidget(content_display)
+            if record.content:
+                # 仍在流式输出的消息按增量方式显示，后续增量可以继续追加
+                if record.is_streaming:
+                    self.ensure_content_display().append_content(record.content)
+                else:
+                    self.ensure_content_display().set_content(record.content)
 
-            if tool_calls is not None:
-                tools_calls_display = MessageToolsCallWidget()
-                tools_calls_display.content_widget.setPlainText(str(tool_calls))
-                main_layout.addWidget(tools_calls_display)
+            if record.tool_calls_text is not None:
+                self.ensure_tools_calls_display().set_text(record.tool_calls_text)
 
         self.setLayout(main_layout)
 
-
-class ChatWidget(QWidget):
-    def __init__(self, root_dir, work_dir, selected_model):
+        # 恢复控件被回收之前的展开状态
+        for panel_name in record.expanded_panels:
+            panel = self.get_panels().get(panel_name)
+            if panel is not None and not panel.is_expanded:
+                panel.toggle_content()
+
+    def get_panels(self):
+        """返回已创建的可折叠面板"""
+        panels = {
+            "tool": self.tool_content_display,
+            "reasoning": self.reasoning_display,
+            "tool_calls": self.tools_calls_display,
+        }
+        return {panel_name: panel for panel_name, panel in panels.items() if panel is not None}
+
+    def get_expanded_panels(self):
+        return {panel_name for panel_name, panel in self.get_panels().items() if panel.is_expanded}
+
+    def ensure_reasoning_display(self):
+        """按 思考内容 -> 正文 -> 工具调用 的顺序，在需要时才创建对应的显示控件"""
+        if self.reasoning_display is None:
+            self.reasoning_display = MessageReasoningWidget()
+            self.main_layout.insertWidget(1, self.reasoning_display)
+        return self.reasoning_display
+
+    def ensure_content_display(self):
+        if self.content_display is None:
+            self.content_display = MessageContentWidget(is_markdown=self.role == "assistant")
+            insert_index = 1 if self.reasoning_display is None else 2
+            self.main_layout.insertWidget(insert_index, self.content_display)
+        return self.content_display
+
+    def ensure_tools_calls_display(self):
+        if self.tools_calls_display is None:
+            self.tools_calls_display = MessageToolsCallWidget()
+            self.main_layout.addWidget(self.tools_calls_display)
+        return self.tools_calls_display
+
+    def append_delta(self, kind, text):
+        """流式输出时追加一段增量"""
+        if kind == "reasoning":
+            self.ensure_reasoning_display().append_text(text)
+        elif kind == "content":
+            self.ensure_content_display().append_content(text)
+        elif kind == "tool_calls":
+            self.ensure_tools_calls_display().append_text(text)
+
+    def finish_streaming(self, tool_calls_text):
+        """流式输出结束后渲染正文的剩余部分，并用完整的工具调用列表替换拼接中的参数片段"""
+        if self.content_display is not None:
+            self.content_display.finish_content()
+        if tool_calls_text is not None:
+            self.ensure_tools_calls_display().set_text(tool_calls_text)
+
+
+class MessageRecord:
+    """一条消息在界面上显示所需的数据；消息控件滚出可见区域后会被销毁，数据和展开状态保存在这里"""
+
+    __slots__ = ("message_id", "role", "avatar_path", "sender", "content", "reasoning", "tool_calls_text", "time_text", "is_streaming", "expanded_panels", "height", "measured_width")
+
+    def __init__(self, message_id, role, avatar_path, sender, content, reasoning = None, tool_calls = None):
+        self.message_id = message_id
+        # "user"、"assistant" 或 "tool"
+        self.role = role
+        self.avatar_path = avatar_path
+        self.sender = sender
+        self.content = content or ""
+        self.reasoning = reasoning
+        self.tool_calls_text = None if tool_calls is None else str(tool_calls)
+        self.time_text = datetime.now().strftime("%m/%d %H:%M")
+        self.is_streaming = False
+        self.expanded_panels = set()
+        # 缓存的行高，以及测量时的宽度（None表示行高是估计值）
+        self.height = 0
+        self.measured_width = None
+
+    def append_delta(self, kind, text):
+        if kind == "reasoning":
+            self.reasoning = (self.reasoning or "") + text
+        elif kind == "content":
+            self.content += text
+        elif kind == "tool_calls":
+            self.tool_calls_text = (self.tool_calls_text or "") + text
+
+    def estimate_height(self, width):
+        """不创建控件时的估计行高：标题栏、折叠面板的按钮和预览，以及按字符数折算的正文行数"""
+        height = 38
+        panel_count = (self.role == "tool") + (self.reasoning is not None) + (self.tool_calls_text is not None)
+        height += panel_count * 73
+        if self.content and self.role != "tool":
+            chars_per_line = max(width // 14, 1)
+            line_count = sum(len(line) // chars_per_line + 1 for line in self.content.split("\n"))
+            height += 5 + line_count * 22
+        return height
+
+
+class MessageListView(QAbstractScrollArea):
+    """
+    虚拟化的消息列表
+
+    只为可见区域（上下各多留 overscan 像素）内的消息创建 MessageWidget，滚出范围的控件立即销毁；
+    每条消息的行高按宽度缓存，未显示过的消息使用估计值，行的起始位置保存为前缀和，按滚动位置二分查找可见行。
+    内存和重新布局的开销只与可见消息的数量有关，与对话长度无关。
+    """
+
+    delete_requested = Signal(object)
+    reached_top = Signal()
+
+    def __init__(self, margin = 5, spacing = 8, overscan = 300):
         super().__init__()
 
-        main_layout = QVBoxLayout()
-
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        scroll_area_style_sheet = f"""
-QScrollArea {{
+        self.margin = margin
+        self.spacing = spacing
+        self.overscan = overscan
+        self.records: list[MessageRecord] = []
+        self.record_indexes = {}
+        # row_offsets[i] 是第 i 行顶部到内容顶部的距离，最后一项是内容总高度
+        self.row_offsets = [margin]
+        self.live_widgets: dict[object, MessageWidget] = {}
+        self.is_layout_pending = False
+
+        self.setStyleSheet(f"""
+QAbstractScrollArea {{
     border: none;
     background-color: #FFFFFF;
 }}
 
 {vertical_scrollBar_style_sheet}
-"""
-        self.scroll_area.setStyleSheet(scroll_area_style_sheet)
-
-        self.messages_display = QWidget()
-        self.messages_display.setStyleSheet("""
-QWidget {
-    background-color: #FFFFFF;
-}
 """)
-        self.messages_layout = QVBoxLayout(self.messages_display)
-        self.messages_layout.setContentsMargins(5, 5, 5, 5)
-        self.messages_layout.setSpacing(8)
-        self.messages_layout.addStretch()
-        self.scroll_area.setWidget(self.messages_display)
+        self.viewport().setStyleSheet("background-color: #FFFFFF;")
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.verticalScrollBar().setSingleStep(20)
+        self.verticalScrollBar().valueChanged.connect(self.on_scroll_value_changed)
+
+    @property
+    def row_width(self):
+        return max(self.viewport().width() - 2 * self.margin, 1)
+
+    def _rebuild_offsets(self, start_index = 0):
+        del self.row_offsets[start_index + 1:]
+        offset = self.row_offsets[start_index]
+        for record in self.records[start_index:]:
+            offset += record.height + self.spacing
+            self.row_offsets.append(offset)
+
+    def _update_scroll_range(self):
+        content_height = self.row_offsets[-1] - self.spacing + self.margin if self.records else 0
+        scroll_bar = self.verticalScrollBar()
+        scroll_bar.setRange(0, max(content_height - self.viewport().height(), 0))
+        scroll_bar.setPageStep(self.viewport().height())
+
+    def is_at_bottom(self):
+        scroll_bar = self.verticalScrollBar()
+        return scroll_bar.value() >= scroll_bar.maximum() - 4
+
+    def scroll_to_bottom(self):
+        self.verticalScrollBar().setValue(self.verticalScrollBar().maximum())
+
+    def append_message(self, record):
+        was_at_bottom = self.is_at_bottom()
+        record.height = record.estimate_height(self.row_width)
+        self.record_indexes[record.message_id] = len(self.records)
+        self.records.append(record)
+        self._rebuild_offsets(len(self.records) - 1)
+        self._update_scroll_range()
+        if was_at_bottom:
+            self.scroll_to_bottom()
+        self.layout_rows()
+        return record
+
+    def prepend_messages(self, records):
+        """在顶部插入更早的消息，保持当前可见的内容不动"""
+        width = self.row_width
+        added_height = 0
+        for record in records:
+            record.height = record.estimate_height(width)
+            added_height += record.height + self.spacing
+        self.records[:0] = records
+        self.record_indexes = {record.message_id: i for i, record in enumerate(self.records)}
+        self._rebuild_offsets()
+
+        scroll_bar = self.verticalScrollBar()
+        scroll_bar.blockSignals(True)
+        self._update_scroll_range()
+        scroll_bar.setValue(scroll_bar.value() + added_height)
+        scroll_bar.blockSignals(False)
+        self.layout_rows()
+
+    def on_scroll_value_changed(self, value):
+        self.layout_rows()
+        if value == 0 and self.records:
+            self.reached_top.emit()
+
+    def get_record(self, message_id):
+        index = self.record_indexes.get(message_id)
+        return None if index is None else self.records[index]
+
+    def append_delta(self, message_id, kind, text):
+        record = self.get_record(message_id)
+        if record is None:
+            return
+        record.append_delta(kind, text)
+        message_widget = self.live_widgets.get(message_id)
+        if message_widget is not None:
+            message_widget.append_delta(kind, text)
+        else:
+            self._update_estimate(record)
+
+    def finish_streaming(self, message_id, tool_calls = None):
+        record = self.get_record(message_id)
+        if record is None:
+            return
+        record.is_streaming = False
+        if tool_calls is not None:
+            record.tool_calls_text = str(tool_calls)
+        message_widget = self.live_widgets.get(message_id)
+        if message_widget is not None:
+            message_widget.finish_streaming(record.tool_calls_text if tool_calls is not None else None)
+        else:
+            self._update_estimate(record)
+
+    def _update_estimate(self, record):
+        """不可见的消息内容变化时只更新估计行高"""
+        if record.measured_width is None:
+            record.height = record.estimate_height(self.row_width)
+            self.schedule_layout()
+
+    def remove_message(self, message_id):
+        index = self.record_indexes.get(message_id)
+        if index is None:
+            return
+        self._release_widget(message_id)
+        del self.records[index]
+        self.record_indexes = {record.message_id: i for i, record in enumerate(self.records)}
+        self._rebuild_offsets(index)
+        self._update_scroll_range()
+        self.layout_rows()
+
+    def clear(self):
+        for message_id in list(self.live_widgets):
+            self._release_widget(message_id)
+        self.records = []
+        self.record_indexes = {}
+        self.row_offsets = [self.margin]
+        self._update_scroll_range()
+
+    def _create_widget(self, record, parent):
+        message_widget = MessageWidget(record, parent)
+        message_widget.delete_requested.connect(lambda message_id, widget: self.delete_requested.emit(message_id))
+        return message_widget
+
+    def _release_widget(self, message_id):
+        message_widget = self.live_widgets.pop(message_id, None)
+        if message_widget is None:
+            return
+        record = self.get_record(message_id)
+        if record is not None:
+            record.expanded_panels = message_widget.get_expanded_panels()
+        message_widget.removeEventFilter(self)
+        message_widget.hide()
+        message_widget.deleteLater()
+
+    def measure_widget(self, message_widget, width):
+        message_widget.resize(width, max(message_widget.height(), 1))
+        message_widget.layout().activate()
+        height = message_widget.heightForWidth(width)
+        if height < 0:
+            height = message_widget.sizeHint().height()
+        return height
+
+    def schedule_layout(self):
+        """合并同一轮事件循环中的多次布局请求（如流式输出时正文高度不断变化）"""
+        if not self.is_layout_pending:
+            self.is_layout_pending = True
+            QTimer.singleShot(0, self.layout_rows)
+
+    def layout_rows(self):
+        """为可见行创建控件并摆放，测量出的行高与缓存不同时更新后续行的位置"""
+        self.is_layout_pending = False
+        if not self.records:
+            return
+
+        width = self.row_width
+        scroll_bar = self.verticalScrollBar()
+        was_at_bottom = self.is_at_bottom()
+
+        # 测量可能改变行高，最多重复几次直到可见行稳定
+        for _ in range(3):
+            top = scroll_bar.value()
+            visible_top = top - self.overscan
+            visible_bottom = top + self.viewport().height() + self.overscan
+            first_index = max(bisect_right(self.row_offsets, visible_top) - 1, 0)
+
+            visible_ids = set()
+            changed_index = None
+            scroll_delta = 0
+            index = first_index
+            while index < len(self.records) and self.row_offsets[index] < visible_bottom:
+                record = self.records[index]
+                visible_ids.add(record.message_id)
+                message_widget = self.live_widgets.get(record.message_id)
+                if message_widget is None:
+                    message_widget = self._create_widget(record, self.viewport())
+                    message_widget.installEventFilter(self)
+                    self.live_widgets[record.message_id] = message_widget
+                    message_widget.show()
+                height = self.measure_widget(message_widget, width)
+                if height != record.height:
+                    # 视口上方的行高变化时同步调整滚动位置，保持可见内容不跳动
+                    if self.row_offsets[index] + record.height <= top:
+                        scroll_delta += height - record.height
+                    record.height = height
+                    if changed_index is None:
+                        changed_index = index
+                record.measured_width = width
+                index += 1
+
+            for message_id in [message_id for message_id in self.live_widgets if message_id not in visible_ids]:
+                self._release_widget(message_id)
+
+            if changed_index is None:
+                break
+            self._rebuild_offsets(changed_index)
+            scroll_bar.blockSignals(True)
+            self._update_scroll_range()
+            if was_at_bottom:
+                scroll_bar.setValue(scroll_bar.maximum())
+            elif scroll_delta:
+                scroll_bar.setValue(top + scroll_delta)
+            scroll_bar.blockSignals(False)
+
+        top = scroll_bar.value()
+        for message_id, message_widget in self.live_widgets.items():
+            index = self.record_indexes[message_id]
+            message_widget.setGeometry(self.margin, self.row_offsets[index] - top, width, self.records[index].height)
+
+    def eventFilter(self, watched, event):
+        # 消息控件内部尺寸变化（展开面板、流式追加正文）时重新测量
+        if event.type() == QEvent.LayoutRequest:
+            self.schedule_layout()
+        return super().eventFilter(watched, event)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if event.size().width() != event.oldSize().width():
+            # 宽度变化后缓存的行高作废，不可见的行退回估计值
+            width = self.row_width
+            for record in self.records:
+                if record.measured_width is not None and record.message_id not in self.live_widgets:
+                    record.height = record.estimate_height(width)
+                    record.measured_width = None
+            self._rebuild_offsets()
+        self._update_scroll_range()
+        self.layout_rows()
+
+
+class ChatExporter(QObject):
+    """
+    分块导出聊天记录
+
+    PNG/PDF：在界面线程中由定时器驱动，每一步只为一条消息创建临时控件，把其中一段渲染到固定高度的页面图片上，
+    页面画满后交给写入线程保存（PNG 每页一个文件，PDF 每页一页）；待写入的页面最多 max_queued_pages 张，
+    内存占用与对话长度无关。HTML：整个过程在后台线程中进行，不需要创建控件。
+    渲染和写入都结束后才发出 finished 或 failed，界面线程不等待写入线程。
+    """
+
+    progress = Signal(int, int)
+    finished = Signal(list)
+    failed = Signal(str)
+    # 写入线程结束时发出，在界面线程中处理
+    writer_finished = Signal()
+
+    max_queued_pages = 2
+    png_page_height = 4096
+
+    def __init__(self, message_list, records, file_path):
+        super().__init__()
+
+        self.message_list = message_list
+        self.file_path = file_path
+        self.records = records
+        self.export_format = os.path.splitext(file_path)[1].lower().lstrip(".")
+        self.output_paths = []
+        self.cancel_event = threading.Event()
+        self.page_queue = queue.Queue(maxsize=self.max_queued_pages)
+        self.writer_thread = None
+        self.writer_error = None
+        self.render_error = None
+        self.is_rendering = False
+        self.is_writing = False
+        self.markdown_renderer = get_markdown_renderer()
+        self.step_timer = QTimer(self)
+        self.step_timer.timeout.connect(self.run_step)
+        self.writer_finished.connect(self.on_writer_finished)
+        self.render_steps = None
+
+    def start(self):
+        if self.export_format == "html":
+            threading.Thread(target=self._export_html, name="chat-export", daemon=True).start()
+            return
+
+        self.is_rendering = True
+        self.is_writing = True
+        self.writer_thread = threading.Thread(target=self._write_pages, name="chat-export", daemon=True)
+        self.writer_thread.start()
+        self.render_steps = self._render_pages()
+        self.step_timer.start(0)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _export_html(self):
+        messages = [
+            {
+                "role": record.role,
+                "sender": record.sender,
+                "time_text": record.time_text,
+                "content": record.content,
+                "reasoning": record.reasoning,
+                "tool_calls_text": record.tool_calls_text,
+            }
+            for record in self.records
+        ]
+        try:
+            is_completed = write_chat_html(messages, self.file_path, on_progress=self.progress.emit, is_cancelled=self.cancel_event.is_set)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.finished.emit([self.file_path] if is_completed else [])
 
-        main_layout.addWidget(self.scroll_area)
+    def run_step(self):
+        try:
+            next(self.render_steps)
+        except StopIteration:
+            self.step_timer.stop()
+            self.is_rendering = False
+            self._emit_result()
+        except Exception as e:
+            self.step_timer.stop()
+            # 写入线程看到取消后自行结束，不需要结束标记
+            self.cancel_event.set()
+            self.render_error = str(e)
+            self.is_rendering = False
+            self._emit_result()
+
+    def on_writer_finished(self):
+        self.is_writing = False
+        self._emit_result()
+
+    def _emit_result(self):
+        """渲染和写入都结束后发出结果"""
+        if self.is_rendering or self.is_writing:
+            return
+        if self.render_error is not None:
+            self.failed.emit(self.render_error)
+        elif self.writer_error is not None:
+            self.failed.emit(self.writer_error)
+        else:
+            self.finished.emit([] if self.cancel_event.is_set() else self.output_paths)
+
+    def _render_pages(self):
+        """逐条、逐段渲染消息，每次 yield 让出界面线程"""
+        margin = self.message_list.margin
+        spacing = self.message_list.spacing
+        width = self.message_list.row_width
+        page_width = width + 2 * margin
+        if self.export_format == "pdf":
+            # 页面比例与 A4 相同
+            page_height = round(page_width * 297 / 210)
+        else:
+            page_height = self.png_page_height
+        content_height = page_height - 2 * margin
+
+        page = None
+        page_y = margin
+
+        def flush_page(used_height):
+            if self.export_format == "png" and used_height + margin < page_height:
+                # 最后一页按实际内容裁剪
+                return page.copy(0, 0, page_width, used_height + margin)
+            return page
+
+        for index, record in enumerate(self.records):
+            if self.cancel_event.is_set() or self.writer_error is not None:
+                break
+
+            # 等待 Markdown 渲染结果进入缓存，临时控件直接使用渲染好的文档
+            if record.role == "assistant" and record.content and not self.markdown_renderer.has_cached(record.content):
+                render_future = self.markdown_renderer.render_async(record.content, None)
+                while not self.markdown_renderer.has_cached(record.content) and not self.cancel_event.is_set():
+                    # 渲染出错时不会进入缓存，把异常交给 run_step 结束导出
+                    if render_future.done() and render_future.exception() is not None:
+                        raise render_future.exception()
+                    yield
+
+            message_widget = MessageWidget(record)
+            message_widget.setAttribute(Qt.WA_DontShowOnScreen)
+            message_widget.show()
+            height = self.message_list.measure_widget(message_widget, width)
+            message_widget.resize(width, height)
+            message_widget.layout().activate()
+
+            # 能放进一整页的消息不跨页
+            if page is not None and height <= content_height and page_y + height > margin + content_height:
+                yield from self._queue_page(flush_page(page_y))
+                page = None
+
+            source_y = 0
+            while source_y < height and not self.cancel_event.is_set():
+                if page is None:
+                    page = QImage(page_width, page_height, QImage.Format_RGB32)
+                    page.fill(Qt.white)
+                    page_y = margin
+                slice_height = min(height - source_y, margin + content_height - page_y)
+                painter = QPainter(page)
+                message_widget.render(painter, QPoint(margin, page_y), QRegion(0, source_y, width, slice_height))
+                painter.end()
+                source_y += slice_height
+                page_y += slice_height
+                if page_y >= margin + content_height:
+                    yield from self._queue_page(flush_page(page_y))
+                    page = None
+                else:
+                    yield
+
+            page_y += spacing
+            message_widget.deleteLater()
+            self.progress.emit(index + 1, len(self.records))
+
+        if page is not None and not self.cancel_event.is_set():
+            yield from self._queue_page(flush_page(page_y - spacing))
+        yield from self._queue_page(None)
+
+    def _queue_page(self, page):
+        """写入线程落后时等待，保证待写入的页面数有上限；写入线程出错或取消后不再等待"""
+        while True:
+            try:
+                self.page_queue.put_nowait(page)
+                return
+            except queue.Full:
+                if self.writer_error is not None or self.cancel_event.is_set():
+                    return
+                yield
+
+    def _write_pages(self):
+        base_path = os.path.splitext(self.file_path)[0]
+        pdf_writer = None
+        painter = None
+        page_number = 0
+        try:
+            while True:
+                # 渲染出错时不会再放入结束标记，定期检查是否已取消
+                try:
+                    page = self.page_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if self.cancel_event.is_set():
+                        break
+                    continue
+                if page is None:
+                    break
+                page_number += 1
+                if self.export_format == "png":
+                    page_path = f"{base_path}_{page_number:03d}.png"
+                    if not page.save(page_path, "PNG"):
+                        raise OSError(f"无法写入 {page_path}")
+                    self.output_paths.append(page_path)
+                    continue
+
+                if pdf_writer is None:
+                    pdf_writer = QPdfWriter(self.file_path)
+                    pdf_writer.setPageSize(QPageSize(QPageSize.A4))
+                    pdf_writer.setPageMargins(QMarginsF(0, 0, 0, 0))
+                    painter = QPainter(pdf_writer)
+                    self.output_paths.append(self.file_path)
+                else:
+                    pdf_writer.newPage()
+                target_width = painter.viewport().width()
+                painter.drawImage(QRect(0, 0, target_width, round(page.height() * target_width / page.width())), page)
+        except Exception as e:
+            # 渲染步骤看到 writer_error 后停止放入页面，不需要继续取出
+            self.writer_error = str(e)
+        finally:
+            if painter is not None:
+                painter.end()
+            self.writer_finished.emit()
+
+
+class ChatWidget(QWidget):
+    # 开始或结束处理一条消息时发出，标签页据此显示会话是否正在运行
+    busy_changed = Signal(bool)
+    # 会话指标变化时发出状态栏显示的文字
+    metrics_text_changed = Signal(str)
+    # 恢复会话时每次创建的消息条数
+    restore_batch_size = 100
+
+    def __init__(self, root_dir, work_dir, selected_model, session_path = None):
+        super().__init__()
+
+        main_layout = QVBoxLayout()
+
+        self.message_list = MessageListView()
+        self.message_list.delete_requested.connect(self.delete_message)
+        self.message_list.reached_top.connect(self.load_earlier_messages)
+
+        main_layout.addWidget(self.message_list)
 
         # 操作按钮栏
         self.action_bar = QWidget()
@@ -646,7 +1349,7 @@ QPushButton:pressed {
         action_bar_layout.addWidget(self.clear_messages_button)
         
         # 记录聊天按钮
-        self.save_chat_button = QPushButton("截图聊天")
+        self.save_chat_button = QPushButton("导出聊天")
         self.save_chat_button.setFont(font)
         self.save_chat_button.setFixedHeight(30)
         save_chat_button_style_sheet = """
@@ -669,7 +1372,7 @@ QPushButton:pressed {
 }
 """
         self.save_chat_button.setStyleSheet(save_chat_button_style_sheet)
-        self.save_chat_button.clicked.connect(self.save_chat_screenshot)
+        self.save_chat_button.clicked.connect(self.export_chat)
         action_bar_layout.addWidget(self.save_chat_button)
 
         action_bar_layout.addStretch()
@@ -753,7 +1456,7 @@ QPushButton:disabled {
 }
 """
         self.send_button.setStyleSheet(send_button_style_sheet)
-        self.send_button.clicked.connect(self.send_message)
+        self.send_button.clicked.connect(self.on_send_button_clicked)
         short_cut = QShortcut(Qt.CTRL | Qt.Key_Return, self.input_text)
         short_cut.activated.connect(self.send_message)
         buttons_layout.addWidget(self.send_button)
@@ -764,39 +1467,117 @@ QPushButton:disabled {
 
         self.setLayout(main_layout)
 
-        self.thread = QThread()
-        self.agent_worker = AgentWorker(root_dir, work_dir, selected_model)
-
-        self.agent_worker.moveToThread(self.thread)
+        self.agent_worker = AgentWorker(root_dir, work_dir, selected_model, session_path)
 
         self.agent_worker.get_assistant_message_dict.connect(self.on_get_assistant_message_dict)
         self.agent_worker.get_tool_result.connect(self.on_get_tool_result)
         self.agent_worker.finished.connect(self.on_finished)
         self.agent_worker.get_message_id.connect(self.on_get_message_id)
+        self.agent_worker.start_assistant_message.connect(self.on_start_assistant_message)
+        self.agent_worker.get_assistant_delta.connect(self.on_get_assistant_delta)
+        self.agent_worker.request_retrying.connect(self.on_request_retrying)
+        self.agent_worker.request_failed.connect(self.on_request_failed)
+        self.agent_worker.model_fallback.connect(self.on_model_fallback)
+        self.agent_worker.metrics_updated.connect(self.on_metrics_updated)
+        self.metrics_text = ""
         self.id_to_index_mapping = {}
+        self.streaming_message_ids = set()
+        self.chat_exporter = None
         
         # 初始状态下禁用发送按钮（因为输入框为空）
         self.send_button.setEnabled(False)
         self.is_processing = False  # 添加处理状态标志
 
-        self.thread.start()
+        self.restore_messages()
+
+    def restore_messages(self):
+        """显示恢复的会话历史：先只显示最近的一批消息，滚动到顶部时再逐批加载更早的消息"""
+        messages = self.agent_worker.main_agent.messages
+        # tool_call_id -> 工具名称，用于显示工具返回消息
+        self.restored_tool_names = {
+            tool_call["id"]: tool_call["function"]["name"]
+            for message in messages if message.get("role") == "assistant"
+            for tool_call in message.get("tool_calls") or []
+        }
+        # messages[1:unloaded_message_end] 还没有显示
+        self.unloaded_message_end = len(messages)
+        self.load_earlier_messages()
+        self.message_list.scroll_to_bottom()
+
+    def load_earlier_messages(self):
+        end = self.unloaded_message_end
+        if end <= 1:
+            return
+        start = max(1, end - self.restore_batch_size)
+        records = self.build_restored_records(start, end)
+        for index, record in zip(range(start, end), records):
+            self.id_to_index_mapping[record.message_id] = index
+
+        self.unloaded_message_end = start
+        self.message_list.prepend_messages(records)
+
+    def build_restored_records(self, start, end):
+        """为 messages[start:end] 创建消息记录（不创建控件）"""
+        messages = self.agent_worker.main_agent.messages
+        message_times = self.agent_worker.restored_message_times
+
+        records = []
+        for index in range(start, end):
+            message = messages[index]
+            role = message.get("role")
+            content = message.get("content")
+            if not isinstance(content, str) and content is not None:
+                content = str(content)
+            message_id = uuid.uuid4()
+            if role == "user":
+                record = MessageRecord(message_id, "user", "./assets/images/avatar/user.svg", "用户", content)
+            elif role == "tool":
+                tool_name = self.restored_tool_names.get(message.get("tool_call_id"), "tool")
+                record = MessageRecord(message_id, "tool", "./assets/images/avatar/tool.svg", tool_name, content)
+            else:
+                record = MessageRecord(message_id, "assistant", "./assets/images/avatar/assistant.svg", self.agent_worker.main_agent.model_name, content, message.get("reasoning"), message.get("tool_calls"))
+            if index - 1 < len(message_times):
+                record.time_text = datetime.fromtimestamp(message_times[index - 1]).strftime("%m/%d %H:%M")
+            records.append(record)
+        return records
 
     def update_send_button_state(self, has_valid_input):
         """更新发送按钮的启用/禁用状态"""
-        # 只有当有有效输入且不在处理中时，才启用发送按钮
-        self.send_button.setEnabled(has_valid_input and not self.is_processing)
+        # 处理中发送按钮作为停止按钮，始终可用
+        if self.is_processing:
+            return
+        self.send_button.setEnabled(has_valid_input)
+
+    def on_send_button_clicked(self):
+        if self.is_processing:
+            self.stop_generation()
+        else:
+            self.send_message()
+
+    def stop_generation(self):
+        """停止当前的模型请求和工具循环"""
+        self.send_button.setEnabled(False)
+        self.agent_worker.stop()
 
     def on_get_message_id(self, message_uid, message_index):
         self.id_to_index_mapping[message_uid] = message_index
         # print(self.id_to_index_mapping)
 
-    def insert_message(self, message_id, avatar_path, sender, message_content, reasoning, tool_calls):
-        message_widget = MessageWidget(message_id, avatar_path, sender, message_content, reasoning, tool_calls)
-        message_widget.delete_requested.connect(self.delete_message)
+    def insert_message(self, message_id, role, avatar_path, sender, message_content, reasoning, tool_calls, is_streaming = False):
+        record = MessageRecord(message_id, role, avatar_path, sender, message_content, reasoning, tool_calls)
+        record.is_streaming = is_streaming
+        return self.message_list.append_message(record)
 
-        self.messages_layout.insertWidget(self.messages_layout.count() - 1, message_widget, 0, Qt.AlignTop)
+    def delete_message(self, message_id):
+        # 仍在流式生成的消息还没有对应的索引，暂不允许删除
+        if message_id in self.streaming_message_ids:
+            return
+
+        # 只存在于界面上的消息（例如被停止的回复）
+        if message_id not in self.id_to_index_mapping:
+            self.message_list.remove_message(message_id)
+            return
 
-    def delete_message(self, message_id ,message_widget):
         deleted_index = self.id_to_index_mapping[message_id]
         del self.agent_worker.main_agent.messages[deleted_index]
         del self.id_to_index_mapping[message_id]
@@ -804,46 +1585,108 @@ QPushButton:disabled {
             if index > deleted_index:
                 self.id_to_index_mapping[id] = index - 1
 
-        self.messages_layout.removeWidget(message_widget)
-        message_widget.deleteLater()
+        self.message_list.remove_message(message_id)
 
     def send_message(self):
-        # 设置处理状态
-        self.is_processing = True
-        self.send_button.setEnabled(False)
+        # 处理中不接受新的消息（快捷键也会走到这里）
+        if self.is_processing:
+            return
 
         raw = self.input_text.toPlainText()
 
         if raw.strip() == "":
-            self.is_processing = False
-            # 根据当前输入状态更新按钮
-            has_valid_input = not self.input_text._has_preedit and self.input_text.toPlainText().strip() != ""
-            self.send_button.setEnabled(has_valid_input)
             return
 
+        # 设置处理状态，发送按钮切换为停止按钮
+        self.is_processing = True
+        self.send_button.setText("停止")
+        self.send_button.setEnabled(True)
+        self.busy_changed.emit(True)
+
         user_message_id = uuid.uuid4()
         user_message_index = len(self.agent_worker.main_agent.messages)
         self.on_get_message_id(user_message_id, user_message_index)
 
-        self.insert_message(user_message_id, "./assets/images/avatar/user.svg", "用户", raw, None, None)
+        self.insert_message(user_message_id, "user", "./assets/images/avatar/user.svg", "用户", raw, None, None)
 
         self.input_text.clear()
 
         self.agent_worker.start_work.emit(raw)
 
+    def on_start_assistant_message(self, message_id):
+        self.insert_message(message_id, "assistant", "./assets/images/avatar/assistant.svg", self.agent_worker.main_agent.model_name, "", None, None, is_streaming=True)
+        self.streaming_message_ids.add(message_id)
+
+    def on_get_assistant_delta(self, message_id, kind, text):
+        if message_id in self.streaming_message_ids:
+            self.message_list.append_delta(message_id, kind, text)
+
     def on_get_assistant_message_dict(self, message_id, message_dict):
+        # 请求已成功，清除重试提示
+        self.send_button.setText("停止")
+        self.send_button.setToolTip("")
+        # 流式输出的消息已经在界面上，只需收尾
+        if message_id in self.streaming_message_ids:
+            self.streaming_message_ids.discard(message_id)
+            self.message_list.finish_streaming(message_id, message_dict.get("tool_calls"))
+            return
+
         reasoning = message_dict.get("reasoning")
         content = message_dict.get('content')
         tool_calls = message_dict.get('tool_calls')
         # print(message_dict)
-        self.insert_message(message_id, "./assets/images/avatar/assistant.svg", self.agent_worker.main_agent.model_name, content, reasoning, tool_calls)
+        self.insert_message(message_id, "assistant", "./assets/images/avatar/assistant.svg", self.agent_worker.main_agent.model_name, content, reasoning, tool_calls)
 
     def on_get_tool_result(self, message_id, tool_name, tool_content):
-        self.insert_message(message_id, "./assets/images/avatar/tool.svg", tool_name, tool_content, None, None)
+        self.insert_message(message_id, "tool", "./assets/images/avatar/tool.svg", tool_name, tool_content, None, None)
+
+    def on_request_retrying(self, attempt, delay, error_message):
+        # 发送按钮此时是停止按钮，在第二行显示重试次数
+        self.send_button.setText(f"停止\n重试{attempt}")
+        self.send_button.setToolTip(f"请求失败，{delay:.1f} 秒后第 {attempt} 次重试：\n{error_message}")
+
+    def on_model_fallback(self, failed_model, next_model, error_message):
+        self.send_button.setText("停止\n换模型")
+        self.send_button.setToolTip(f"{failed_model} 请求失败，改用 {next_model}：\n{error_message}")
+
+    def on_request_failed(self, error_message):
+        QMessageBox.warning(self, "请求失败", f"模型请求失败：\n{error_message}")
+
+    @staticmethod
+    def format_metrics(totals):
+        def format_tokens(count):
+            return f"{count / 1000:.1f}k" if count >= 1000 else str(count)
+
+        parts = []
+        if totals["last_model"] is not None:
+            parts.append(totals["last_model"].split("/")[-1])
+        if totals["last_latency"] is not None:
+            parts.append(f"耗时 {totals['last_latency']:.1f}s")
+        if totals["last_ttft"] is not None:
+            parts.append(f"首字 {totals['last_ttft']:.1f}s")
+        parts.append(f"输入 {format_tokens(totals['prompt_tokens'])}（缓存 {format_tokens(totals['cached_tokens'])}）")
+        parts.append(f"输出 {format_tokens(totals['completion_tokens'])}")
+        parts.append(f"${totals['cost']:.4f}")
+        if totals["tool_calls"]:
+            parts.append(f"工具 {totals['tool_calls']} 次 {totals['tool_time']:.1f}s")
+        return " · ".join(parts)
+
+    def on_metrics_updated(self, totals):
+        # 耗时和首字是最近一次请求的，其余为整个会话（本次打开以来）的合计
+        self.metrics_text = self.format_metrics(totals)
+        self.metrics_text_changed.emit(self.metrics_text)
 
     def on_finished(self):
+        # 被停止时未完成的流式消息保留在界面上，它们不在消息列表中，删除时只移除控件
+        for message_id in self.streaming_message_ids:
+            self.message_list.finish_streaming(message_id)
+        self.streaming_message_ids.clear()
+
         # 重置处理状态
         self.is_processing = False
+        self.send_button.setText("发送")
+        self.send_button.setToolTip("")
+        self.busy_changed.emit(False)
         # 根据当前输入状态更新按钮
         has_valid_input = not self.input_text._has_preedit and self.input_text.toPlainText().strip() != ""
         self.send_button.setEnabled(has_valid_input)
@@ -859,104 +1702,107 @@ QPushButton:disabled {
 
     def clear_messages(self):
         """清空所有消息（保留系统消息）"""
-        # 清空UI中的消息控件
-        while self.messages_layout.count() > 1:  # 保留最后的stretch
-            item = self.messages_layout.takeAt(0)
-            if item.widget():
-                item.widget().deleteLater()
+        # 清空UI中的消息
+        self.message_list.clear()
         
-        # 清空Agent的消息列表（保留系统消息）
-        system_messages = [msg for msg in self.agent_worker.main_agent.messages if msg.get("role") == "system"]
-        self.agent_worker.main_agent.messages = system_messages
+        # 清空Agent的消息列表（保留系统消息），同时写入会话日志
+        self.agent_worker.main_agent.messages.clear_history()
         
         # 清空ID到索引的映射
         self.id_to_index_mapping.clear()
+        self.unloaded_message_end = 1
 
-    def save_chat_screenshot(self):
-        """保存聊天记录为PNG图片"""
-        try:
-            # 创建保存目录
-            save_dir = "saved_chats"
-            if not os.path.exists(save_dir):
-                os.makedirs(save_dir)
-            
-            # 生成时间戳文件名
-            current_time = datetime.now()
-            filename = current_time.strftime("%Y_%m_%d_%H_%M_%S.png")
-            file_path = os.path.join(save_dir, filename)
-            
-            # 获取滚动区域内容的截图
-            scroll_widget = self.scroll_area.widget()
-            if scroll_widget:
-                # 临时保存当前滚动位置
-                scroll_bar = self.scroll_area.verticalScrollBar()
-                original_scroll_position = scroll_bar.value()
-                
-                # 滚动到顶部
-                scroll_bar.setValue(0)
-                
-                # 确保布局更新
-                QApplication.processEvents()
-                
-                # 获取实际内容大小
-                content_size = scroll_widget.sizeHint()
-                actual_size = scroll_widget.size()
-                
-                # 使用较大的尺寸确保包含所有内容
-                width = max(content_size.width(), actual_size.width())
-                height = max(content_size.height(), actual_size.height())
-                
-                # 创建pixmap
-                pixmap = QPixmap(width, height)
-                pixmap.fill(Qt.white)  # 设置白色背景
-                
-                # 渲染内容
-                scroll_widget.render(pixmap)
-                
-                # 恢复原始滚动位置
-                scroll_bar.setValue(original_scroll_position)
-                
-                # 保存为PNG文件
-                success = pixmap.save(file_path, "PNG")
-                
-                if success:
-                    # 显示成功消息
-                    QMessageBox.information(
-                        self, 
-                        "保存成功", 
-                        f"聊天记录已保存到：\n{file_path}"
-                    )
-                else:
-                    QMessageBox.warning(self, "保存失败", "无法保存聊天记录图片。")
-            else:
-                QMessageBox.warning(self, "保存失败", "没有聊天内容可以保存。")
-                    
-        except Exception as e:
-            QMessageBox.critical(
-                self, 
-                "保存失败", 
-                f"保存聊天记录时出现错误：\n{str(e)}"
-            )
+    def export_chat(self):
+        """把聊天记录导出为多页 PNG、PDF 或 HTML，在后台分块进行"""
+        if self.chat_exporter is not None:
+            return
+        # 还没有加载到列表中的历史消息也一并导出
+        records = self.build_restored_records(1, self.unloaded_message_end) + list(self.message_list.records)
+        if not records:
+            QMessageBox.warning(self, "导出失败", "没有聊天内容可以导出。")
+            return
+
+        save_dir = "saved_chats"
+        os.makedirs(save_dir, exist_ok=True)
+        default_path = os.path.join(save_dir, datetime.now().strftime("%Y_%m_%d_%H_%M_%S.png"))
+        file_path, selected_filter = QFileDialog.getSaveFileName(
+            self, "导出聊天", default_path, "PNG 图片 (*.png);;PDF 文档 (*.pdf);;HTML 网页 (*.html)"
+        )
+        if not file_path:
+            return
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension not in (".png", ".pdf", ".html"):
+            file_path += "." + selected_filter.split("*.")[-1].rstrip(")")
+
+        self.progress_dialog = QProgressDialog("正在导出聊天记录…", "取消", 0, len(records), self)
+        self.progress_dialog.setWindowTitle("导出聊天")
+        self.progress_dialog.setWindowModality(Qt.WindowModal)
+        self.progress_dialog.setMinimumDuration(500)
+        self.progress_dialog.setAutoClose(False)
+        self.progress_dialog.setAutoReset(False)
+
+        self.chat_exporter = ChatExporter(self.message_list, records, file_path)
+        self.chat_exporter.progress.connect(self.on_export_progress)
+        self.chat_exporter.finished.connect(self.on_export_finished)
+        self.chat_exporter.failed.connect(self.on_export_failed)
+        self.progress_dialog.canceled.connect(self.chat_exporter.cancel)
+        self.save_chat_button.setEnabled(False)
+        self.chat_exporter.start()
+
+    def on_export_progress(self, done_count, total_count):
+        self.progress_dialog.setMaximum(total_count)
+        self.progress_dialog.setValue(done_count)
+
+    def end_export(self):
+        self.progress_dialog.close()
+        self.progress_dialog.deleteLater()
+        self.chat_exporter.deleteLater()
+        self.chat_exporter = None
+        self.save_chat_button.setEnabled(True)
+
+    def on_export_finished(self, output_paths):
+        self.end_export()
+        if not output_paths:
+            return
+        if len(output_paths) == 1:
+            QMessageBox.information(self, "导出成功", f"聊天记录已保存到：\n{output_paths[0]}")
+        else:
+            QMessageBox.information(self, "导出成功", f"聊天记录已保存为 {len(output_paths)} 页：\n{output_paths[0]}\n…\n{output_paths[-1]}")
+
+    def on_export_failed(self, error_message):
+        self.end_export()
+        QMessageBox.critical(self, "导出失败", f"导出聊天记录时出现错误：\n{error_message}")
+
+    def get_session_path(self):
+        return self.agent_worker.engine.session_log.file_path
+
+    def close_session(self):
+        """停止正在运行的任务并关闭会话日志，可以重复调用"""
+        if self.chat_exporter is not None:
+            self.chat_exporter.cancel()
+        self.agent_worker.shutdown()
 
     def closeEvent(self, event):
-        self.thread.quit()
-        self.thread.wait()
+        self.close_session()
         event.accept()
 
 
 class StartupDialog(QDialog):
-    def __init__(self):
+    def __init__(self, open_session_paths = ()):
         super().__init__()
         
         self.root_dir = ""
         self.work_dir = ""
         self.selected_model = openrouter_model_names["anthropic"][0]
+        self.session_path = None
+        # 已在其他标签页中打开的会话不能再次打开（两个会话同时写入同一个日志）
+        self.open_session_paths = {os.path.abspath(path) for path in open_session_paths}
         
         self.init_ui()
         
     def init_ui(self):
         self.setWindowTitle("AI程序员 - 启动配置")
-        self.setFixedSize(600, 550)
+        self.setFixedSize(600, 630)
         self.setModal(True)
         
         # 设置窗口样式
@@ -1013,6 +1859,10 @@ QDialog {
         model_group = self.create_model_group()
         config_layout.addWidget(model_group)
         
+        # 配置项4：继续之前的会话
+        session_group = self.create_session_group()
+        config_layout.addWidget(session_group)
+        
         main_layout.addWidget(config_widget)
         
         # 添加一些弹性空间
@@ -1090,8 +1940,10 @@ QLineEdit:focus {
         # 连接文本变化信号来更新配置
         if "根目录" in title:
             line_edit.textChanged.connect(lambda text: setattr(self, 'root_dir', text))
+            self.root_dir_edit = line_edit
         elif "工作目录" in title:
             line_edit.textChanged.connect(lambda text: setattr(self, 'work_dir', text))
+            self.work_dir_edit = line_edit
         
         browse_button = QPushButton("浏览")
         browse_button.setFixedSize(70, 32)
@@ -1192,6 +2044,59 @@ QComboBox QAbstractItemView {
         
         return group_widget
         
+    def create_session_group(self):
+        """创建会话选择组件，只读取每个会话日志开头的元信息"""
+        group_widget = QWidget()
+        group_layout = QVBoxLayout(group_widget)
+        group_layout.setContentsMargins(0, 0, 0, 0)
+        group_layout.setSpacing(6)
+        
+        # 标题
+        title_label = QLabel("4. 继续之前的会话（可选）")
+        title_font = QFont(font_family_name)
+        title_font.setPixelSize(14)
+        title_font.setWeight(QFont.Weight.Bold)
+        title_label.setFont(title_font)
+        title_label.setStyleSheet("color: #262626;")
+        title_label.setFixedHeight(25)
+        group_layout.addWidget(title_label)
+        
+        self.session_combo = QComboBox()
+        self.session_combo.setFixedHeight(32)
+        combo_font = QFont(font_family_name)
+        combo_font.setPixelSize(13)
+        self.session_combo.setFont(combo_font)
+        self.session_combo.setStyleSheet(self.model_combo.styleSheet())
+        
+        self.session_combo.addItem("新会话", None)
+        for session in list_sessions():
+            if os.path.abspath(session.file_path) in self.open_session_paths:
+                continue
+            created_at = session.created_at.replace("T", " ")[:16]
+            title = session.title or "（无消息）"
+            self.session_combo.addItem(f"{created_at}  {title}  ({session.size // 1024:,} KB)", session)
+        
+        self.session_combo.currentIndexChanged.connect(self.on_session_changed)
+        group_layout.addWidget(self.session_combo)
+        
+        return group_widget
+        
+    def on_session_changed(self, index):
+        """选择已有会话时填入它的目录和模型"""
+        session = self.session_combo.itemData(index)
+        if session is None:
+            self.session_path = None
+            return
+        self.session_path = session.file_path
+        self.root_dir_edit.setText(session.root_dir)
+        self.work_dir_edit.setText(session.work_dir)
+        for provider, models in openrouter_model_names.items():
+            if session.model_name in models:
+                model_index = self.model_combo.findText(f"{provider}: {session.model_name}")
+                if model_index >= 0:
+                    self.model_combo.setCurrentIndex(model_index)
+                break
+            
     def browse_root_directory(self, line_edit):
         """浏览项目根目录"""
         directory = QFileDialog.getExistingDirectory(
@@ -1245,7 +2150,14 @@ QComboBox QAbstractItemView {
 
 
 class MainWindow(QMainWindow):
-    def __init__(self, root_dir, work_dir, selected_model):
+    """
+    每个标签页是一个独立的会话
+
+    所有会话共用同一个后台事件循环线程、同一个模型 API 客户端（HTTP 连接池）、同一个工具线程池（每个会话有并发配额），
+    以及目录树、文件内容、代码搜索和符号等缓存。
+    """
+
+    def __init__(self, root_dir, work_dir, selected_model, session_path = None):
         super().__init__()
 
         self.setWindowTitle("AI程序员")
@@ -1257,17 +2169,73 @@ class MainWindow(QMainWindow):
         y = (screen.height() - self.height()) // 2
         self.move(x, y-60)
 
-        container = QWidget(self)
-        self.setCentralWidget(container)
+        self.tab_widget = QTabWidget(self)
+        self.tab_widget.setTabsClosable(True)
+        self.tab_widget.setMovable(True)
+        self.tab_widget.setDocumentMode(True)
+        self.tab_widget.tabCloseRequested.connect(self.close_session_tab)
+
+        new_session_button = QPushButton("+")
+        new_session_button.setFixedSize(28, 24)
+        new_session_button.setToolTip("新建或继续会话")
+        new_session_button.clicked.connect(self.open_new_session)
+        self.tab_widget.setCornerWidget(new_session_button, Qt.TopRightCorner)
 
-        main_layout = QVBoxLayout(container)
+        self.setCentralWidget(self.tab_widget)
 
+        # 状态栏显示当前标签页会话的指标
+        self.tab_widget.currentChanged.connect(self.update_status_bar)
+
+        self.add_session_tab(root_dir, work_dir, selected_model, session_path)
+
+    def add_session_tab(self, root_dir, work_dir, selected_model, session_path = None):
         # 传递配置参数给ChatWidget
-        self.chat_widget = ChatWidget(root_dir, work_dir, selected_model)
-        main_layout.addWidget(self.chat_widget)
+        chat_widget = ChatWidget(root_dir, work_dir, selected_model, session_path)
+        chat_widget.tab_title = os.path.basename(os.path.normpath(work_dir)) or work_dir
+        chat_widget.busy_changed.connect(lambda is_busy: self.update_tab_title(chat_widget, is_busy))
+        chat_widget.metrics_text_changed.connect(lambda: self.update_status_bar(self.tab_widget.indexOf(chat_widget)))
+        index = self.tab_widget.addTab(chat_widget, chat_widget.tab_title)
+        self.tab_widget.setTabToolTip(index, f"{work_dir}\n{selected_model}")
+        self.tab_widget.setCurrentIndex(index)
+
+    def update_tab_title(self, chat_widget, is_busy):
+        index = self.tab_widget.indexOf(chat_widget)
+        if index >= 0:
+            self.tab_widget.setTabText(index, f"● {chat_widget.tab_title}" if is_busy else chat_widget.tab_title)
+
+    def update_status_bar(self, index):
+        if index >= 0 and index == self.tab_widget.currentIndex():
+            self.statusBar().showMessage(self.tab_widget.widget(index).metrics_text)
+
+    def get_chat_widgets(self):
+        return [self.tab_widget.widget(index) for index in range(self.tab_widget.count())]
+
+    def open_new_session(self):
+        startup_dialog = StartupDialog([chat_widget.get_session_path() for chat_widget in self.get_chat_widgets()])
+        if startup_dialog.exec() == QDialog.Accepted:
+            self.add_session_tab(
+                startup_dialog.root_dir,
+                startup_dialog.work_dir,
+                startup_dialog.selected_model,
+                startup_dialog.session_path
+            )
+
+    def close_session_tab(self, index):
+        chat_widget = self.tab_widget.widget(index)
+        if chat_widget.is_processing:
+            reply = QMessageBox.question(self, "关闭会话", "该会话正在运行，确定要停止并关闭吗？")
+            if reply != QMessageBox.Yes:
+                return
+        # 会话日志已实时保存，之后可以在启动页中继续
+        self.tab_widget.removeTab(index)
+        chat_widget.close_session()
+        chat_widget.deleteLater()
+        if self.tab_widget.count() == 0:
+            self.close()
 
     def closeEvent(self, event):
-        self.chat_widget.closeEvent(event)
+        for chat_widget in self.get_chat_widgets():
+            chat_widget.close_session()
         event.accept()
 
 
@@ -1283,7 +2251,8 @@ if __name__ == '__main__':
         window = MainWindow(
             startup_dialog.root_dir,
             startup_dialog.work_dir, 
-            startup_dialog.selected_model
+            startup_dialog.selected_model,
+            startup_dialog.session_path
         )
         window.show()
         app.exec()
@@ -1,8 +1,82 @@
+import time
+from collections.abc import Callable
+
 from openai import OpenAI
-from openai.types.chat import ChatCompletion
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
 from openai._types import NotGiven, NOT_GIVEN
 
 from helpers.model_api_client import thinking_model_names
+from helpers.context_compactor import ContextCompactor
+from helpers.prompt_cache import PromptCache, supports_prompt_cache
+from helpers.request_retry import PartialResponseError
+from helpers.model_router import ModelRouter, get_model_router
+
+
+def get_reasoning_effort(model_name: str) -> str | NotGiven:
+    return "high" if model_name in thinking_model_names else NOT_GIVEN
+
+
+class StreamAccumulator:
+    """把流式返回的分块逐步拼接为完整的助手消息字典，并回调每段增量"""
+
+    def __init__(self, on_delta: Callable[[str, str], None] | None = None) -> None:
+        self.on_delta: Callable[[str, str], None] | None = on_delta
+        self.content_parts: list[str] = []
+        self.reasoning_parts: list[str] = []
+        self.tool_calls: dict[int, dict] = {}
+        self.usage = None
+
+    def _emit(self, kind: str, text: str) -> None:
+        if self.on_delta is not None:
+            self.on_delta(kind, text)
+
+    def add_chunk(self, chunk: ChatCompletionChunk) -> None:
+        # 开启 include_usage 后，最后一个分块只携带 usage
+        if chunk.usage is not None:
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return
+        delta = chunk.choices[0].delta
+
+        # OpenRouter 的思考内容放在非标准字段 reasoning 中
+        reasoning = getattr(delta, "reasoning", None)
+        if reasoning:
+            self.reasoning_parts.append(reasoning)
+            self._emit("reasoning", reasoning)
+
+        if delta.content:
+            self.content_parts.append(delta.content)
+            self._emit("content", delta.content)
+
+        for tool_call_delta in delta.tool_calls or []:
+            tool_call = self.tool_calls.setdefault(
+                tool_call_delta.index,
+                {"id": None, "type": "function", "function": {"name": "", "arguments": ""}}
+            )
+            if tool_call_delta.id:
+                tool_call["id"] = tool_call_delta.id
+            function_delta = tool_call_delta.function
+            if function_delta is None:
+                continue
+            if function_delta.name:
+                tool_call["function"]["name"] += function_delta.name
+            if function_delta.arguments:
+                tool_call["function"]["arguments"] += function_delta.arguments
+                self._emit("tool_calls", function_delta.arguments)
+
+    def to_message_dict(self) -> dict:
+        message_dict = {
+            "role": "assistant",
+            "content": "".join(self.content_parts) if self.content_parts else None,
+            "tool_calls": [self.tool_calls[index] for index in sorted(self.tool_calls)] or None
+        }
+        if self.reasoning_parts:
+            message_dict["reasoning"] = "".join(self.reasoning_parts)
+
+        return message_dict
+
+    def has_output(self) -> bool:
+        return bool(self.content_parts or self.reasoning_parts or self.tool_calls)
 
 
 class Agent:
@@ -12,39 +86,132 @@ class Agent:
             client: OpenAI,
             model_name: str,
             system_prompt: str = "",
-            tools: list[dict] | NotGiven = NOT_GIVEN
+            tools: list[dict] | NotGiven = NOT_GIVEN,
+            stream: bool = False,
+            context_compactor: ContextCompactor | None = None,
+            router: ModelRouter | None = None
     ) -> None:
         self.agent_name: str = agent_name
         self.client: OpenAI = client
         self.model_name: str = model_name
-        if self.model_name in thinking_model_names:
-            self.reasoning_effort = "high"
-        else:
-            self.reasoning_effort = NOT_GIVEN
 
         self.messages: list[dict] = []
         if system_prompt != "":
             self.messages.append({"role": "system", "content": system_prompt})
 
         self.tools: list[dict] | NotGiven = tools
+        self.stream: bool = stream
+        self.context_compactor: ContextCompactor | None = context_compactor
+        # 支持缓存断点的模型自动启用提示词缓存
+        self.prompt_cache: PromptCache | None = PromptCache() if supports_prompt_cache(model_name) else None
+        self.last_usage = None
+        # 最近一次调用的总耗时（包括重试和改用备用模型）和首段输出的耗时（TTFT，非流式时为 None），单位为秒
+        self.last_latency: float | None = None
+        self.last_ttft: float | None = None
+        self._call_started_at: float = 0.0
+        # 重试、限流、熔断，以及主模型不可用时改用备用模型
+        self.router: ModelRouter = router or get_model_router()
+        # 最近一次实际给出回复的模型（可能是备用模型）
+        self.last_model_name: str = model_name
+
+    def _prepare_request_messages(self) -> list[dict]:
+        """压缩历史并加上缓存断点，得到本次请求实际发送的消息列表"""
+        if self.context_compactor is not None:
+            self.context_compactor.compact(self.messages)
+
+        if self.prompt_cache is not None:
+            return self.prompt_cache.build_request_messages(self.messages)
+        return self.messages
+
+    def _get_model_request_messages(self, model_name: str, request_messages: list[dict]) -> list[dict]:
+        """改用不支持缓存断点的备用模型时，发送不带断点的消息"""
+        if request_messages is not self.messages and not supports_prompt_cache(model_name):
+            return self.messages
+        return request_messages
+
+    def _start_timing(self, on_delta: Callable[[str, str], None] | None) -> Callable[[str, str], None]:
+        """开始计时，返回的增量回调在收到第一段输出时记录 TTFT，再转发给 on_delta"""
+        self._call_started_at = time.monotonic()
+        self.last_ttft = None
+
+        def timed_delta(kind: str, text: str) -> None:
+            if self.last_ttft is None:
+                self.last_ttft = time.monotonic() - self._call_started_at
+            if on_delta is not None:
+                on_delta(kind, text)
+
+        return timed_delta
+
+    def _finish_call(self, model_name: str, message_dict: dict, usage) -> dict:
+        self.last_latency = time.monotonic() - self._call_started_at
+        self.last_model_name = model_name
+        self.last_usage = usage
+        if self.prompt_cache is not None:
+            self.prompt_cache.record_usage(usage)
+
+        self.messages.append(message_dict)
+
+        return message_dict
+
+    def _send(self, model_name: str, request_messages: list[dict], on_delta: Callable[[str, str], None] | None) -> tuple[dict, object]:
+        """向 model_name 发送一次请求，返回 (助手消息字典, usage)"""
+        if self.stream:
+            stream = self.client.chat.completions.create(
+                model=model_name,
+                reasoning_effort=get_reasoning_effort(model_name),
+                messages=request_messages,  # type: ignore
+                tools=self.tools,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            stream_accumulator = StreamAccumulator(on_delta)
+            try:
+                for chunk in stream:
+                    stream_accumulator.add_chunk(chunk)
+            except Exception as e:
+                if stream_accumulator.has_output():
+                    raise PartialResponseError(e) from e
+                raise
+            return stream_accumulator.to_message_dict(), stream_accumulator.usage
 
-    def __call__(self) -> dict:
         response: ChatCompletion = self.client.chat.completions.create(
-            model=self.model_name,
-            reasoning_effort=self.reasoning_effort,
-            messages=self.messages,  # type: ignore
+            model=model_name,
+            reasoning_effort=get_reasoning_effort(model_name),
+            messages=request_messages,  # type: ignore
             tools=self.tools
         )
+        return response.choices[0].message.model_dump(), response.usage
 
-        message_dict = response.choices[0].message.model_dump()
-        self.messages.append(message_dict)
+    def __call__(
+            self,
+            on_delta: Callable[[str, str], None] | None = None,
+            on_retry: Callable[[int, float, Exception], None] | None = None,
+            on_fallback: Callable[[str, str, Exception], None] | None = None
+    ) -> dict:
+        """
+        调用模型并把返回的助手消息追加到消息列表
 
-        return message_dict
+        Args:
+            on_delta: 流式模式下的增量回调，参数为 (kind, text)，kind 取 "reasoning"、"content" 或 "tool_calls"
+            on_retry: 请求失败、等待重试前的回调，参数为 (下一次尝试的序号, 等待秒数, 错误)
+            on_fallback: 改用备用模型前的回调，参数为 (失败的模型, 下一个模型, 错误)
+        """
+        request_messages = self._prepare_request_messages()
+        timed_delta = self._start_timing(on_delta)
+        model_name, (message_dict, usage) = self.router.call(
+            self.model_name,
+            lambda model_name, on_model_delta: self._send(model_name, self._get_model_request_messages(model_name, request_messages), on_model_delta),
+            timed_delta, on_retry, on_fallback
+        )
+        return self._finish_call(model_name, message_dict, usage)
 
     def user_call(
             self,
             user_content: str | list[dict],
+            on_delta: Callable[[str, str], None] | None = None,
+            on_retry: Callable[[int, float, Exception], None] | None = None,
+            on_fallback: Callable[[str, str, Exception], None] | None = None
     ) -> dict:
         self.messages.append({"role": "user", "content": user_content})
 
-        return self()
\ No newline at end of file
+        return self(on_delta, on_retry, on_fallback)
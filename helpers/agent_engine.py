@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+
+from openai import AsyncOpenAI
+
+from helpers.async_agent import AsyncAgent
+from helpers.context_compactor import ContextCompactor
+from helpers.read_tracker import ReadTracker
+from helpers.session_store import SessionLog, LoggedMessageList, create_session, open_session
+from helpers.model_api_client import openrouter_async_client
+from helpers.model_router import ModelRouter
+from helpers.get_prompt import get_prompt
+from helpers.telemetry import SessionTelemetry, get_metrics_log
+from tools.tools_list import tools_list, tools_mapping, read_only_tool_names
+from tools.tool_scheduler import ToolScheduler
+from tools.code_search import warm_up as warm_up_code_search
+
+
+# 参数不是合法 JSON 的工具调用的返回内容
+invalid_arguments_content = "错误：工具参数不是合法的 JSON"
+
+
+class DeltaCoalescer:
+    """合并流式增量，按固定时间间隔批量发出，避免每个token都触发一次跨线程信号和重新布局"""
+
+    def __init__(self, emit_func, interval = 0.05):
+        self.emit_func = emit_func
+        self.interval = interval
+        self.pending_kind = None
+        self.pending_parts = []
+        self.last_emit_time = time.monotonic()
+
+    def push(self, kind, text):
+        # 增量类型变化时先把旧类型的内容发出去，保证显示顺序
+        if kind != self.pending_kind:
+            self.flush()
+            self.pending_kind = kind
+        self.pending_parts.append(text)
+
+        if time.monotonic() - self.last_emit_time >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending_parts:
+            self.emit_func(self.pending_kind, "".join(self.pending_parts))
+            self.pending_parts = []
+        self.last_emit_time = time.monotonic()
+
+
+class AgentEvents:
+    """
+    AgentEngine 的事件回调，默认什么都不做
+
+    界面（转发为 Qt 信号）和命令行（输出到终端）各自覆盖需要的方法；回调在运行引擎的事件循环线程中调用。
+    """
+
+    def on_assistant_start(self, message_id: uuid.UUID) -> None:
+        pass
+
+    def on_assistant_delta(self, message_id: uuid.UUID, kind: str, text: str) -> None:
+        pass
+
+    def on_assistant_message(self, message_id: uuid.UUID, message_index: int, message_dict: dict) -> None:
+        pass
+
+    def on_tool_result(self, message_id: uuid.UUID, message_index: int, tool_name: str, tool_content: str) -> None:
+        pass
+
+    def on_retry(self, attempt: int, delay: float, error_message: str) -> None:
+        pass
+
+    def on_fallback(self, failed_model: str, next_model: str, error_message: str) -> None:
+        pass
+
+    def on_error(self, error_message: str) -> None:
+        pass
+
+    def on_metrics(self, totals: dict) -> None:
+        """每次模型请求和工具调用结束后调用，totals 为 SessionTelemetry.get_totals() 的会话合计"""
+        pass
+
+
+class AgentEngine:
+    """
+    与界面无关的工具循环：调用主 Agent，执行它请求的工具并把结果交回，直到它不再调用工具
+
+    消息历史实时写入会话日志（可以在图形界面的启动页中继续），事件通过 AgentEvents 回调通知调用方。
+    """
+
+    def __init__(
+            self,
+            root_dir: str,
+            work_dir: str,
+            model_name: str,
+            events: AgentEvents | None = None,
+            session_path: str | None = None,
+            delta_interval: float = 0.05,
+            client: AsyncOpenAI | None = None,
+            router: ModelRouter | None = None
+    ) -> None:
+        """
+        Args:
+            session_path: 要继续的会话日志，None 时新建会话
+            delta_interval: 流式增量合并后发出的时间间隔（秒）
+            client: 模型 API 客户端，默认使用共用的 OpenRouter 客户端（基准测试时指向本地的模拟服务）
+            router: 模型路由，默认使用共用的路由（共用重试、限流和熔断的状态）
+        """
+        self.root_dir: str = root_dir
+        self.work_dir: str = work_dir
+        self.events: AgentEvents = events or AgentEvents()
+        self.delta_interval: float = delta_interval
+
+        self.main_agent: AsyncAgent = AsyncAgent(
+            agent_name="main_agent",
+            client=client or openrouter_async_client,
+            model_name=model_name,
+            system_prompt=get_prompt(
+                prompt_name="main_system",
+                variables={
+                    "root_dir_path": root_dir,
+                    "cwd_path": work_dir
+                }
+            ),
+            tools=tools_list,
+            stream=True,
+            context_compactor=ContextCompactor(),
+            router=router
+        )
+        self.read_tracker: ReadTracker = ReadTracker()
+
+        # 消息历史实时写入会话日志，程序崩溃或重启后可以继续之前的会话
+        if session_path is None:
+            self.session_log: SessionLog = create_session(root_dir, work_dir, model_name)
+            restored_messages = []
+            self.restored_message_times: list[float] = []
+        else:
+            self.session_log, _, restored_messages, self.restored_message_times = open_session(session_path)
+        self.main_agent.messages = LoggedMessageList(self.main_agent.messages + restored_messages, self.session_log)
+        # 模型请求和工具调用的指标写入共用的指标日志，以会话日志的文件名区分会话
+        self.telemetry: SessionTelemetry = SessionTelemetry(
+            os.path.splitext(os.path.basename(self.session_log.file_path))[0],
+            get_metrics_log()
+        )
+        # 工具在所有会话共用的线程池中执行，每个会话有自己的并发配额
+        self.tool_scheduler: ToolScheduler = ToolScheduler(
+            tools_mapping, read_only_tool_names, on_tool_finished=self.telemetry.record_tool
+        )
+        # 上次退出时正在执行的工具调用补上返回，保证消息历史合法
+        self.main_agent.close_pending_tool_calls("错误：工具调用因程序退出而中断")
+        # 在后台为项目根目录建立代码搜索索引
+        warm_up_code_search(root_dir)
+
+    async def call_main_agent(self, user_content = None) -> dict:
+        """流式调用主Agent，增量经合并后发出，结束后再发出完整的消息字典"""
+        assistant_message_id = uuid.uuid4()
+        self.events.on_assistant_start(assistant_message_id)
+
+        delta_coalescer = DeltaCoalescer(
+            lambda kind, text: self.events.on_assistant_delta(assistant_message_id, kind, text),
+            self.delta_interval
+        )
+        on_retry = lambda attempt, delay, error: self.events.on_retry(attempt, delay, str(error))
+        on_fallback = lambda failed_model, next_model, error: self.events.on_fallback(failed_model, next_model, str(error))
+        try:
+            if user_content is None:
+                message_dict = await self.main_agent(delta_coalescer.push, on_retry, on_fallback)
+            else:
+                message_dict = await self.main_agent.user_call(user_content, delta_coalescer.push, on_retry, on_fallback)
+        finally:
+            delta_coalescer.flush()
+
+        self.telemetry.record_completion(
+            self.main_agent.last_model_name, self.main_agent.last_latency, self.main_agent.last_ttft, self.main_agent.last_usage
+        )
+        self.events.on_metrics(self.telemetry.get_totals())
+        self.events.on_assistant_message(assistant_message_id, len(self.main_agent.messages) - 1, message_dict)
+
+        return message_dict
+
+    @staticmethod
+    def parse_tool_call(assistant_tool_call: dict) -> tuple[str, object]:
+        """返回 (工具名, 参数)，参数不是合法的 JSON 时为 None；没有参数的调用可能给出空字符串"""
+        arguments = assistant_tool_call["function"]["arguments"] or "{}"
+        try:
+            return assistant_tool_call["function"]["name"], json.loads(arguments)
+        except ValueError:
+            return assistant_tool_call["function"]["name"], None
+
+    def append_tool_message(self, tool_name: str, tool_id: str, tool_content: str) -> None:
+        self.main_agent.messages.append(
+            {
+                "role": "tool",
+                "tool_call_id": tool_id,
+                "content": tool_content
+            }
+        )
+        self.events.on_tool_result(uuid.uuid4(), len(self.main_agent.messages) - 1, tool_name, tool_content)
+        # 工具的耗时在工具线程中已经记录，这里在事件循环线程中通知合计的变化
+        self.events.on_metrics(self.telemetry.get_totals())
+
+    async def run(self, user_content, max_tool_rounds: int | None = None) -> dict | None:
+        """
+        发送一条用户消息并运行工具循环
+
+        Args:
+            max_tool_rounds: 最多执行多少轮工具调用，超过后停止（最后一条助手消息的工具调用补上错误返回）；None 表示不限制
+
+        Returns:
+            最后一条助手消息；请求失败时通过 on_error 通知并返回 None
+        """
+        tool_futures = {}
+        tool_round = 0
+        try:
+            message_dict = await self.call_main_agent(user_content)
+
+            assistant_tool_calls = message_dict.get("tool_calls")
+            while assistant_tool_calls is not None:
+                if max_tool_rounds is not None and tool_round >= max_tool_rounds:
+                    self.close_pending_tool_calls(tool_futures, f"错误：已达到工具调用轮数上限（{max_tool_rounds}）")
+                    return message_dict
+                tool_round += 1
+
+                # 参数不是合法 JSON 的调用不执行，只给这一个调用返回错误，其余调用照常执行
+                parsed_tool_calls = [self.parse_tool_call(assistant_tool_call) for assistant_tool_call in assistant_tool_calls]
+                scheduled_tool_calls = [
+                    (assistant_tool_call["id"], tool_name, tool_args)
+                    for (tool_name, tool_args), assistant_tool_call in zip(parsed_tool_calls, assistant_tool_calls)
+                    if tool_args is not None
+                ]
+                submitted_futures = self.tool_scheduler.submit([(tool_name, tool_args) for _, tool_name, tool_args in scheduled_tool_calls])
+                # tool_call_id -> Future，中途停止时据此判断每个调用是否已经开始执行
+                tool_futures = {tool_id: future for (tool_id, _, _), future in zip(scheduled_tool_calls, submitted_futures)}
+                # 工具结果按 tool_call_id 的原始顺序追加
+                for (tool_name, tool_args), assistant_tool_call in zip(parsed_tool_calls, assistant_tool_calls):
+                    if tool_args is None:
+                        tool_content = invalid_arguments_content
+                        self.telemetry.record_tool(tool_name, 0.0, len(tool_content), True)
+                    else:
+                        tool_content = await asyncio.wrap_future(tool_futures[assistant_tool_call["id"]])
+                        # 模型已经看过且未变化的文件内容替换为简短提示
+                        tool_content = self.read_tracker.deduplicate(self.main_agent.messages, tool_name, tool_args, assistant_tool_call["id"], tool_content)
+                    self.append_tool_message(tool_name, assistant_tool_call["id"], tool_content)
+                tool_futures = {}
+                message_dict = await self.call_main_agent()
+
+                assistant_tool_calls = message_dict.get("tool_calls")
+            return message_dict
+        except asyncio.CancelledError:
+            self.close_pending_tool_calls(tool_futures, "错误：工具调用已被用户取消")
+            raise
+        except Exception as e:
+            # 重试用尽或不可重试的错误：结束本轮，下一条消息可以继续对话
+            self.close_pending_tool_calls(tool_futures, f"错误：{e}")
+            self.events.on_error(str(e))
+            return None
+
+    def close_pending_tool_calls(self, tool_futures: dict, tool_content: str) -> None:
+        """
+        尚未开始的工具调用不再执行，已发出的工具调用补上返回，保证消息历史合法
+
+        已经开始执行的调用无法取消（编辑、删除等操作仍会完成）：已经完成的记录实际结果，仍在执行的说明操作可能已经生效，
+        避免模型误以为文件没有被修改。
+        """
+        tool_contents = {}
+        for tool_id, tool_future in tool_futures.items():
+            if tool_future.cancel():
+                continue
+            if not tool_future.done():
+                tool_contents[tool_id] = f"{tool_content}（该工具调用在停止前已经开始执行，操作可能已经生效，请先检查结果）"
+            elif tool_future.exception() is None:
+                tool_contents[tool_id] = tool_future.result()
+        for tool_call, tool_message_index in self.main_agent.close_pending_tool_calls(tool_content, tool_contents):
+            self.events.on_tool_result(
+                uuid.uuid4(), tool_message_index, tool_call["function"]["name"], self.main_agent.messages[tool_message_index]["content"]
+            )
+
+    def close(self) -> None:
+        self.tool_scheduler.shutdown()
+        self.session_log.close()
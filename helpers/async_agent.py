@@ -0,0 +1,125 @@
+from collections.abc import Callable
+
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+from openai._types import NotGiven, NOT_GIVEN
+
+from helpers.agent import Agent, StreamAccumulator, get_reasoning_effort
+from helpers.context_compactor import ContextCompactor
+from helpers.request_retry import PartialResponseError
+from helpers.model_router import ModelRouter
+
+
+class AsyncAgent(Agent):
+    """
+    基于 AsyncOpenAI 的 Agent，在事件循环中运行
+
+    取消正在执行的任务（asyncio.Task.cancel）会在下一个await点中断请求或流式接收，
+    未完成的助手消息不会被追加到消息列表。
+    """
+
+    def __init__(
+            self,
+            agent_name: str,
+            client: AsyncOpenAI,
+            model_name: str,
+            system_prompt: str = "",
+            tools: list[dict] | NotGiven = NOT_GIVEN,
+            stream: bool = False,
+            context_compactor: ContextCompactor | None = None,
+            router: ModelRouter | None = None
+    ) -> None:
+        super().__init__(agent_name, client, model_name, system_prompt, tools, stream, context_compactor, router)  # type: ignore
+        self.client: AsyncOpenAI = client  # type: ignore
+
+    async def _send(self, model_name: str, request_messages: list[dict], on_delta: Callable[[str, str], None] | None) -> tuple[dict, object]:  # type: ignore
+        if self.stream:
+            stream = await self.client.chat.completions.create(
+                model=model_name,
+                reasoning_effort=get_reasoning_effort(model_name),
+                messages=request_messages,  # type: ignore
+                tools=self.tools,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            stream_accumulator = StreamAccumulator(on_delta)
+            try:
+                async for chunk in stream:
+                    stream_accumulator.add_chunk(chunk)
+            except Exception as e:
+                if stream_accumulator.has_output():
+                    raise PartialResponseError(e) from e
+                raise
+            finally:
+                # 被取消时及时关闭连接，不再继续接收
+                await stream.close()
+            return stream_accumulator.to_message_dict(), stream_accumulator.usage
+
+        response: ChatCompletion = await self.client.chat.completions.create(
+            model=model_name,
+            reasoning_effort=get_reasoning_effort(model_name),
+            messages=request_messages,  # type: ignore
+            tools=self.tools
+        )
+        return response.choices[0].message.model_dump(), response.usage
+
+    async def __call__(  # type: ignore
+            self,
+            on_delta: Callable[[str, str], None] | None = None,
+            on_retry: Callable[[int, float, Exception], None] | None = None,
+            on_fallback: Callable[[str, str, Exception], None] | None = None
+    ) -> dict:
+        request_messages = self._prepare_request_messages()
+        timed_delta = self._start_timing(on_delta)
+        model_name, (message_dict, usage) = await self.router.call_async(
+            self.model_name,
+            lambda model_name, on_model_delta: self._send(model_name, self._get_model_request_messages(model_name, request_messages), on_model_delta),
+            timed_delta, on_retry, on_fallback
+        )
+        return self._finish_call(model_name, message_dict, usage)
+
+    async def user_call(  # type: ignore
+            self,
+            user_content: str | list[dict],
+            on_delta: Callable[[str, str], None] | None = None,
+            on_retry: Callable[[int, float, Exception], None] | None = None,
+            on_fallback: Callable[[str, str, Exception], None] | None = None
+    ) -> dict:
+        self.messages.append({"role": "user", "content": user_content})
+
+        return await self(on_delta, on_retry, on_fallback)
+
+    def close_pending_tool_calls(
+            self,
+            tool_content: str = "错误：工具调用已被用户取消",
+            tool_contents: dict[str, str] | None = None
+    ) -> list[tuple[dict, int]]:
+        """
+        为最后一条助手消息中尚未得到返回的工具调用补上工具消息
+
+        取消发生在工具循环中途时，消息历史里会留下没有对应返回的 tool_calls，下一次请求会因此被拒绝。
+
+        Args:
+            tool_content: 补上的工具消息内容
+            tool_contents: 按 tool_call_id 指定的工具消息内容，优先于 tool_content
+
+        Returns:
+            [(对应的工具调用, 补上的工具消息在消息列表中的索引), ...]
+        """
+        for index in range(len(self.messages) - 1, -1, -1):
+            message = self.messages[index]
+            if message.get("role") == "assistant":
+                break
+        else:
+            return []
+
+        answered_ids = {message.get("tool_call_id") for message in self.messages[index + 1:]}
+        added_messages = []
+        for tool_call in message.get("tool_calls") or []:
+            if tool_call["id"] not in answered_ids:
+                content = tool_contents.get(tool_call["id"], tool_content) if tool_contents else tool_content
+                tool_message = {"role": "tool", "tool_call_id": tool_call["id"], "content": content}
+                self.messages.append(tool_message)
+                added_messages.append((tool_call, len(self.messages) - 1))
+
+        return added_messages
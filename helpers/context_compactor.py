@@ -0,0 +1,124 @@
+import json
+
+
+compacted_marker = "[已压缩]"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算文本的token数，不依赖具体模型的分词器
+
+    ASCII字符按约4个字符一个token计，其余字符（中文等）按每个字符一个token计。
+    """
+    ascii_count = sum(1 for char in text if ord(char) < 128)
+    return ascii_count // 4 + (len(text) - ascii_count) + 1
+
+
+def estimate_message_tokens(message: dict) -> int:
+    tokens = 4  # 每条消息的角色、分隔符等固定开销
+    content = message.get("content")
+    if isinstance(content, str):
+        tokens += estimate_tokens(content)
+    elif content is not None:
+        tokens += estimate_tokens(json.dumps(content, ensure_ascii=False))
+
+    reasoning = message.get("reasoning")
+    if reasoning:
+        tokens += estimate_tokens(reasoning)
+
+    for tool_call in message.get("tool_calls") or []:
+        tokens += estimate_tokens(tool_call["function"]["name"])
+        tokens += estimate_tokens(tool_call["function"]["arguments"])
+
+    return tokens
+
+
+class ContextCompactor:
+    """
+    消息历史压缩器
+
+    当历史的估算token数超过预算时，从最早的消息开始，把工具返回替换为简短的摘要、把过长的工具调用参数截断，
+    直到降到预算的 target_ratio 以下。系统提示词、用户消息和最近 keep_recent_rounds 轮工具调用保持原样；
+    一轮从一条助手消息开始，包括它请求的工具返回，因此一个很长的任务内部较早的工具返回也会被压缩。
+    压缩只原地修改消息内容，不增删消息，因此界面中消息ID到索引的映射始终有效。
+    """
+
+    def __init__(
+            self,
+            token_budget: int = 100_000,
+            target_ratio: float = 0.7,
+            keep_recent_rounds: int = 3,
+            preview_lines: int = 5,
+            max_argument_chars: int = 200
+    ) -> None:
+        self.token_budget: int = token_budget
+        self.target_ratio: float = target_ratio
+        self.keep_recent_rounds: int = keep_recent_rounds
+        self.preview_lines: int = preview_lines
+        self.max_argument_chars: int = max_argument_chars
+
+    def _get_protected_start(self, messages: list[dict]) -> int:
+        """返回最近 keep_recent_rounds 轮的起始索引（一轮以助手消息开始）"""
+        assistant_message_indexes = [index for index, message in enumerate(messages) if message.get("role") == "assistant"]
+        if len(assistant_message_indexes) < self.keep_recent_rounds:
+            return 0
+        return assistant_message_indexes[-self.keep_recent_rounds]
+
+    def _summarize_tool_content(self, content: str) -> str:
+        lines = content.splitlines()
+        preview = "\n".join(lines[:self.preview_lines])
+        summary = f"{compacted_marker} 较早的工具返回已省略（原文 {len(lines)} 行，{len(content)} 字符），如需要请重新调用工具获取。"
+        if preview:
+            summary += f"\n开头内容：\n{preview}"
+        return summary
+
+    def _truncate_tool_call_arguments(self, arguments: str) -> str:
+        try:
+            tool_args = json.loads(arguments)
+        except json.JSONDecodeError:
+            return arguments
+        if not isinstance(tool_args, dict):
+            return arguments
+
+        for arg_name, arg_value in tool_args.items():
+            if isinstance(arg_value, str) and len(arg_value) > self.max_argument_chars:
+                tool_args[arg_name] = f"{arg_value[:self.max_argument_chars]}... {compacted_marker} 省略 {len(arg_value) - self.max_argument_chars} 字符"
+        return json.dumps(tool_args, ensure_ascii=False)
+
+    def compact(self, messages: list[dict]) -> int:
+        """
+        在超出预算时原地压缩消息历史
+
+        Returns:
+            压缩后历史的估算token数
+        """
+        total_tokens = sum(estimate_message_tokens(message) for message in messages)
+        if total_tokens <= self.token_budget:
+            return total_tokens
+
+        # 一次压到预算以下较多的位置，避免每轮都触发压缩、反复改变历史前缀
+        target_tokens = int(self.token_budget * self.target_ratio)
+        protected_start = self._get_protected_start(messages)
+
+        for message in messages[:protected_start]:
+            if total_tokens <= target_tokens:
+                break
+
+            role = message.get("role")
+            if role == "tool":
+                content = message.get("content")
+                if not isinstance(content, str) or content.startswith(compacted_marker):
+                    continue
+                summary = self._summarize_tool_content(content)
+                if len(summary) >= len(content):
+                    continue
+                old_tokens = estimate_message_tokens(message)
+                message["content"] = summary
+                total_tokens += estimate_message_tokens(message) - old_tokens
+            elif role == "assistant" and message.get("tool_calls"):
+                old_tokens = estimate_message_tokens(message)
+                for tool_call in message["tool_calls"]:
+                    tool_call["function"]["arguments"] = self._truncate_tool_call_arguments(tool_call["function"]["arguments"])
+                total_tokens += estimate_message_tokens(message) - old_tokens
+
+        return total_tokens
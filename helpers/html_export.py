@@ -0,0 +1,80 @@
+import html
+
+from helpers.markdown_renderer import build_markdown_document, create_code_highlighter
+
+
+html_header = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: "Microsoft YaHei", sans-serif; font-size: 14px; max-width: 900px; margin: 20px auto; color: #262626; }}
+.message {{ margin-bottom: 16px; }}
+.sender {{ font-weight: bold; }}
+.time {{ color: #A0A0A0; font-size: 10px; margin-left: 6px; }}
+details {{ border: 1px solid #d9d9d9; border-radius: 8px; margin: 5px 0; padding: 4px 8px; }}
+pre {{ white-space: pre-wrap; word-break: break-all; }}
+</style>
+</head>
+<body>
+"""
+html_footer = """</body>
+</html>
+"""
+
+
+def _markdown_to_html(text, highlighter):
+    """用与界面相同的方式解析 Markdown，只取 <body> 中的内容"""
+    document_html = build_markdown_document(text, highlighter).toHtml()
+    body_start = document_html.find("<body")
+    body_start = document_html.find(">", body_start) + 1
+    body_end = document_html.rfind("</body>")
+    return document_html[body_start:body_end]
+
+
+def _collapsible_block(title, text):
+    return f"<details><summary>{html.escape(title)}</summary><pre>{html.escape(text)}</pre></details>\n"
+
+
+def write_chat_html(messages, file_path, title = "聊天记录", on_progress = None, is_cancelled = None):
+    """
+    把对话逐条写入 HTML 文件，内存中只保留当前这一条消息的内容
+
+    Args:
+        messages: [{"role", "sender", "time_text", "content", "reasoning", "tool_calls_text"}, ...]
+        file_path: 输出文件路径
+        title: 网页标题
+        on_progress: 每写完一条消息调用 on_progress(已完成条数, 总条数)
+        is_cancelled: 返回 True 时停止写入
+
+    Returns:
+        是否写完了所有消息
+    """
+    highlighter = create_code_highlighter()
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write(html_header.format(title=html.escape(title)))
+        for index, message in enumerate(messages):
+            if is_cancelled is not None and is_cancelled():
+                return False
+
+            f.write('<div class="message">\n')
+            f.write(f'<div><span class="sender">{html.escape(message["sender"])}</span><span class="time">{html.escape(message["time_text"])}</span></div>\n')
+            content = message["content"] or ""
+            if message["role"] == "tool":
+                f.write(_collapsible_block("工具返回", content))
+            else:
+                if message["reasoning"] is not None:
+                    f.write(_collapsible_block("思考内容", message["reasoning"]))
+                if content and message["role"] == "assistant":
+                    f.write(_markdown_to_html(content, highlighter))
+                elif content:
+                    f.write(f"<pre>{html.escape(content)}</pre>\n")
+                if message["tool_calls_text"] is not None:
+                    f.write(_collapsible_block("工具调用", message["tool_calls_text"]))
+            f.write('</div>\n')
+
+            if on_progress is not None:
+                on_progress(index + 1, len(messages))
+        f.write(html_footer)
+    return True
@@ -0,0 +1,180 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtCore import QObject, Signal, QCoreApplication
+from PySide6.QtGui import QTextDocument, QTextCursor, QTextCharFormat, QTextBlockFormat, QTextFormat, QColor, QFont
+
+try:
+    from pygments import lex
+    from pygments.lexers import get_lexer_by_name, guess_lexer
+    from pygments.styles import get_style_by_name
+    from pygments.util import ClassNotFound
+except ImportError:  # 未安装 pygments 时代码块只使用等宽字体，不着色
+    lex = None
+
+
+code_block_background_color = "#F6F8FA"
+# 超过该长度的代码块不着色
+max_highlight_chars = 200_000
+
+
+def get_markdown_cache_key(text):
+    return hashlib.sha1(text.encode('utf-8', errors='surrogatepass')).hexdigest()
+
+
+class CodeHighlighter:
+    """用 pygments 给代码块着色，按 token 类型缓存字符格式"""
+
+    def __init__(self, style_name = "default"):
+        self.style = get_style_by_name(style_name)
+        self._formats: dict[object, QTextCharFormat] = {}
+
+    def get_format(self, token_type):
+        char_format = self._formats.get(token_type)
+        if char_format is not None:
+            return char_format
+
+        style = self.style.style_for_token(token_type)
+        char_format = QTextCharFormat()
+        if style["color"]:
+            char_format.setForeground(QColor(f"#{style['color']}"))
+        if style["bold"]:
+            char_format.setFontWeight(QFont.Weight.Bold)
+        if style["italic"]:
+            char_format.setFontItalic(True)
+        self._formats[token_type] = char_format
+        return char_format
+
+    def highlight(self, cursor, start_position, code, language):
+        try:
+            lexer = get_lexer_by_name(language) if language else guess_lexer(code)
+        except ClassNotFound:
+            return
+        position = start_position
+        for token_type, token_text in lex(code, lexer):
+            if token_text and not token_text.isspace():
+                cursor.setPosition(position)
+                cursor.setPosition(position + len(token_text), QTextCursor.KeepAnchor)
+                cursor.mergeCharFormat(self.get_format(token_type))
+            position += len(token_text)
+
+
+def create_code_highlighter():
+    """未安装 pygments 时返回 None"""
+    return CodeHighlighter() if lex is not None else None
+
+
+def _style_code_blocks(document, highlighter):
+    """给连续的代码块设置背景色，并按语言着色"""
+    cursor = QTextCursor(document)
+    background_format = QTextBlockFormat()
+    background_format.setBackground(QColor(code_block_background_color))
+
+    block = document.begin()
+    while block.isValid():
+        if not block.blockFormat().hasProperty(QTextFormat.BlockCodeLanguage):
+            block = block.next()
+            continue
+
+        language = block.blockFormat().property(QTextFormat.BlockCodeLanguage) or ""
+        start_position = block.position()
+        code_lines = []
+        while block.isValid() and block.blockFormat().property(QTextFormat.BlockCodeLanguage) == language and block.blockFormat().hasProperty(QTextFormat.BlockCodeLanguage):
+            cursor.setPosition(block.position())
+            cursor.mergeBlockFormat(background_format)
+            code_lines.append(block.text())
+            block = block.next()
+
+        # 相邻的块在文档中的位置是连续的（块之间的分隔符占一个位置），与用换行符拼接后的偏移一一对应
+        code = "\n".join(code_lines)
+        if highlighter is not None and len(code) <= max_highlight_chars:
+            highlighter.highlight(cursor, start_position, code, language)
+
+
+def build_markdown_document(text, highlighter = None):
+    """把 Markdown 解析为 QTextDocument，可以在非界面线程中调用（不涉及排版）"""
+    document = QTextDocument()
+    document.setMarkdown(text, QTextDocument.MarkdownDialectGitHub)
+    _style_code_blocks(document, highlighter)
+    return document
+
+
+class MarkdownRenderer(QObject):
+    """
+    在后台线程中解析 Markdown 并给代码块着色
+
+    结果文档移交给界面线程后通过 document_rendered 信号发出；整条消息的渲染结果按内容哈希缓存在界面线程中，
+    控件重建（虚拟化列表滚动、重新打开会话）时直接复制缓存的文档，不再重新解析。
+    只用一个后台线程，保证同一条消息的分块渲染结果按提交顺序送达。
+    """
+
+    # (render_key, QTextDocument)
+    document_rendered = Signal(object, object)
+    _document_built = Signal(object, object, object)
+
+    def __init__(self, max_cached_documents = 256):
+        super().__init__()
+        self.max_cached_documents = max_cached_documents
+        self._cache: OrderedDict[str, QTextDocument] = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="markdown-render")
+        self._highlighter = create_code_highlighter()
+        self._document_built.connect(self._on_document_built)
+
+    def get_cached(self, text):
+        """返回缓存文档的副本，没有缓存时返回 None；只能在界面线程中调用"""
+        cache_key = get_markdown_cache_key(text)
+        document = self._cache.get(cache_key)
+        if document is None:
+            return None
+        self._cache.move_to_end(cache_key)
+        return document.clone()
+
+    def has_cached(self, text):
+        return get_markdown_cache_key(text) in self._cache
+
+    def store(self, text, document):
+        """缓存一份文档副本；只能在界面线程中调用"""
+        self._put(get_markdown_cache_key(text), document.clone())
+
+    def _put(self, cache_key, document):
+        self._cache[cache_key] = document
+        self._cache.move_to_end(cache_key)
+        while len(self._cache) > self.max_cached_documents:
+            self._cache.popitem(last=False)[1].deleteLater()
+
+    def render_async(self, text, render_key, is_cacheable = True):
+        """
+        提交后台渲染，完成后以 render_key 发出 document_rendered
+
+        Returns:
+            渲染任务的 Future，渲染出错时它带有异常（不会发出 document_rendered）
+        """
+        cache_key = get_markdown_cache_key(text) if is_cacheable else None
+        return self._executor.submit(self._render, text, render_key, cache_key)
+
+    def _render(self, text, render_key, cache_key):
+        document = build_markdown_document(text, self._highlighter)
+        document.moveToThread(QCoreApplication.instance().thread())
+        self._document_built.emit(render_key, cache_key, document)
+
+    def _on_document_built(self, render_key, cache_key, document):
+        # 接收方需要在槽函数中复制文档或取出片段，不能保留这个对象
+        if cache_key is not None:
+            self._put(cache_key, document)
+        self.document_rendered.emit(render_key, document)
+        if cache_key is None:
+            document.deleteLater()
+
+
+_markdown_renderer: MarkdownRenderer | None = None
+_markdown_renderer_lock = threading.Lock()
+
+
+def get_markdown_renderer() -> MarkdownRenderer:
+    global _markdown_renderer
+    with _markdown_renderer_lock:
+        if _markdown_renderer is None:
+            _markdown_renderer = MarkdownRenderer()
+        return _markdown_renderer
@@ -1,11 +1,21 @@
 import os
 
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 
 openrouter_client: OpenAI = OpenAI(
     base_url="https://openrouter.ai/api/v1",
     api_key=os.getenv("OPENROUTER_API_KEY"),
+    # 重试由 helpers.request_retry 统一处理（带限流和熔断），客户端自身不再重试
+    max_retries=0,
+)
+
+# 所有会话共用这一个异步客户端，也就共用同一个 HTTP 连接池（连接复用，不必每个会话重新握手）
+openrouter_async_client: AsyncOpenAI = AsyncOpenAI(
+    base_url="https://openrouter.ai/api/v1",
+    api_key=os.getenv("OPENROUTER_API_KEY"),
+    # 重试由 helpers.request_retry 统一处理（带限流和熔断），客户端自身不再重试
+    max_retries=0,
 )
 
 openrouter_model_names = {
@@ -24,4 +34,28 @@ openrouter_model_names = {
     ]
 }
 
-thinking_model_names = ["google/gemini-2.5-pro-preview", "anthropic/claude-sonnet-4", "anthropic/claude-opus-4"]
\ No newline at end of file
+thinking_model_names = ["google/gemini-2.5-pro-preview", "anthropic/claude-sonnet-4", "anthropic/claude-opus-4"]
+
+# 支持 cache_control 缓存断点的模型（OpenRouter 对 Anthropic 和 Gemini 模型透传缓存断点）
+prompt_cache_model_prefixes = ("anthropic/", "google/")
+
+# 模型不可用（重试用尽、熔断）时依次改用的同等模型
+model_fallbacks = {
+    "google/gemini-2.5-pro-preview": ["anthropic/claude-sonnet-4"],
+    "anthropic/claude-sonnet-4": ["google/gemini-2.5-pro-preview", "anthropic/claude-opus-4"],
+    "anthropic/claude-opus-4": ["anthropic/claude-sonnet-4", "google/gemini-2.5-pro-preview"],
+    "qwen/qwen3-coder": ["moonshotai/kimi-k2-0905"],
+    "moonshotai/kimi-k2-0905": ["qwen/qwen3-coder"]
+}
+# 请求超过该秒数仍没有任何输出时，同时向第一个备用模型发送同样的请求，采用先开始输出的一方；None 表示不对冲
+# 主模型最近有足够的请求时改用它的 p95 耗时（不超过该值），见 ModelRouter.get_hedge_delay
+hedge_delay_seconds: float | None = None
+
+# 估算费用用的价格（美元 / 百万 token）：(输入, 命中缓存的输入, 输出)，按 OpenRouter 的标价，思考 token 按输出计费
+model_prices = {
+    "google/gemini-2.5-pro-preview": (1.25, 0.31, 10.0),
+    "anthropic/claude-sonnet-4": (3.0, 0.3, 15.0),
+    "anthropic/claude-opus-4": (15.0, 1.5, 75.0),
+    "qwen/qwen3-coder": (0.22, 0.22, 0.95),
+    "moonshotai/kimi-k2-0905": (0.39, 0.39, 1.9)
+}
@@ -0,0 +1,201 @@
+import asyncio
+import threading
+from collections.abc import Callable, Awaitable
+
+from helpers.model_api_client import model_fallbacks, hedge_delay_seconds
+from helpers.request_retry import ResilientRequester, CircuitOpenError, is_retryable, get_resilient_requester
+
+
+# 计算滚动统计的时间窗口（秒）
+stats_window_seconds = 300.0
+# 窗口内错误率超过该值（且至少有 min_samples 次尝试）的模型视为不健康，排到备用模型之后
+max_error_rate = 0.5
+min_samples = 5
+# 窗口内 p95 耗时超过同组最快模型的该倍数（都至少有 min_samples 次尝试）的模型视为过慢，排到其他健康模型之后
+max_p95_ratio = 3.0
+# 按主模型的 p95 推算对冲延迟时的下限（秒）
+min_hedge_delay_seconds = 1.0
+
+
+def can_fail_over(error: Exception) -> bool:
+    """重试用尽后仍是服务端或网络问题时改用备用模型；请求本身的错误（如参数错误）换模型也没有用"""
+    return isinstance(error, CircuitOpenError) or is_retryable(error)
+
+
+class ModelRouter:
+    """
+    在主模型和 model_fallbacks 中配置的同等模型之间路由请求
+
+    每个模型的请求都经过 ResilientRequester（重试、限流、熔断），并用它记录的每次尝试计算滚动的 p50/p95 耗时和错误率。
+    主模型熔断或错误率过高时直接先用备用模型，p95 耗时远高于同组其他模型时排在它们之后；一个模型重试用尽后依次改用下一个。
+    设置了 hedge_delay 时（只支持异步调用），超过对冲延迟仍没有输出就同时向下一个模型发送同样的请求，
+    采用先开始输出的一方，另一方被取消。对冲延迟在主模型样本足够时取它的滚动 p95，hedge_delay 是上限。
+    """
+
+    def __init__(
+            self,
+            requester: ResilientRequester | None = None,
+            fallbacks: dict[str, list[str]] | None = None,
+            hedge_delay: float | None = hedge_delay_seconds
+    ) -> None:
+        self.requester: ResilientRequester = requester or get_resilient_requester()
+        self.fallbacks: dict[str, list[str]] = model_fallbacks if fallbacks is None else fallbacks
+        self.hedge_delay: float | None = hedge_delay
+
+    def get_stats(self, model_name: str) -> dict:
+        """{"attempts", "p50", "p95", "error_rate"}"""
+        return self.requester.metrics.get_rolling_stats(model_name, stats_window_seconds)
+
+    def is_healthy(self, model_name: str) -> bool:
+        if self.requester.get_circuit_breaker(model_name).is_open():
+            return False
+        stats = self.get_stats(model_name)
+        return stats["attempts"] < min_samples or stats["error_rate"] <= max_error_rate
+
+    def route(self, model_name: str) -> list[str]:
+        """按尝试顺序返回候选模型：健康的在前，其中过慢的靠后，其余保持配置的顺序（主模型在最前）"""
+        candidates = [model_name] + [name for name in self.fallbacks.get(model_name, []) if name != model_name]
+        p95s = {}
+        for name in candidates:
+            stats = self.get_stats(name)
+            if stats["attempts"] >= min_samples and stats["p95"] is not None:
+                p95s[name] = stats["p95"]
+        fastest_p95 = min(p95s.values(), default=None)
+
+        def is_slow(name):
+            return name in p95s and p95s[name] > fastest_p95 * max_p95_ratio
+
+        return sorted(candidates, key=lambda name: (not self.is_healthy(name), is_slow(name)))
+
+    def get_hedge_delay(self, model_name: str) -> float | None:
+        """
+        主模型超过多少秒仍没有输出时对冲，None 表示不对冲
+
+        主模型在窗口内有足够样本时取它的 p95 耗时（不低于 min_hedge_delay_seconds），即只对慢于平常 95% 请求的那部分对冲；
+        样本不足时使用 hedge_delay。结果不超过 hedge_delay。
+        """
+        if self.hedge_delay is None:
+            return None
+        stats = self.get_stats(model_name)
+        if stats["attempts"] < min_samples or stats["p95"] is None:
+            return self.hedge_delay
+        return min(self.hedge_delay, max(min_hedge_delay_seconds, stats["p95"]))
+
+    async def call_async(
+            self,
+            model_name: str,
+            send: Callable[[str, Callable[[str, str], None] | None], Awaitable],
+            on_delta: Callable[[str, str], None] | None = None,
+            on_retry: Callable[[int, float, Exception], None] | None = None,
+            on_fallback: Callable[[str, str, Exception], None] | None = None
+    ) -> tuple[str, object]:
+        """
+        Args:
+            send: send(实际使用的模型, 增量回调) 完成一次请求并返回结果
+            on_fallback: 改用备用模型前调用 on_fallback(失败的模型, 下一个模型, 错误)
+
+        Returns:
+            (实际给出结果的模型, 结果)
+        """
+        candidates = self.route(model_name)
+        index = 0
+        while True:
+            try:
+                if self.hedge_delay is not None and index + 1 < len(candidates):
+                    hedge_delay = self.get_hedge_delay(candidates[index])
+                    return await self._call_hedged(candidates[index], candidates[index + 1], hedge_delay, send, on_delta, on_retry, on_fallback)
+                result = await self.requester.call_async(candidates[index], lambda: send(candidates[index], on_delta), on_retry)
+                return candidates[index], result
+            except Exception as e:
+                # 对冲时两个模型都已失败
+                step = 2 if self.hedge_delay is not None and index + 1 < len(candidates) else 1
+                if not can_fail_over(e) or index + step >= len(candidates):
+                    raise
+                if on_fallback is not None:
+                    on_fallback(candidates[index], candidates[index + step], e)
+                index += step
+
+    async def _call_hedged(self, primary_model, secondary_model, hedge_delay, send, on_delta, on_retry, on_fallback) -> tuple[str, object]:
+        winner = None
+        tasks: dict[str, asyncio.Task] = {}
+
+        def make_gated_delta(model_name):
+            # 第一个产生输出的模型胜出，另一个立即取消，它的增量不会送到界面
+            def gated_delta(kind, text):
+                nonlocal winner
+                if winner is None:
+                    winner = model_name
+                    for other_model, task in tasks.items():
+                        if other_model != model_name:
+                            task.cancel()
+                if winner == model_name and on_delta is not None:
+                    on_delta(kind, text)
+            return gated_delta
+
+        def start(model_name):
+            gated_delta = make_gated_delta(model_name)
+            tasks[model_name] = asyncio.ensure_future(
+                self.requester.call_async(model_name, lambda: send(model_name, gated_delta), on_retry)
+            )
+
+        try:
+            start(primary_model)
+            done, _ = await asyncio.wait([tasks[primary_model]], timeout=hedge_delay)
+            if not done and winner is None:
+                start(secondary_model)
+            elif done and tasks[primary_model].exception() is not None and can_fail_over(tasks[primary_model].exception()):
+                # 还没到对冲时间主模型就失败了，直接改用下一个模型
+                if on_fallback is not None:
+                    on_fallback(primary_model, secondary_model, tasks[primary_model].exception())
+                start(secondary_model)
+
+            last_error = None
+            pending = set(tasks.values())
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for model_name, task in tasks.items():
+                    if task not in done or task.cancelled():
+                        continue
+                    # 已经有一方开始输出时，只接受它的结果
+                    if winner is not None and model_name != winner:
+                        continue
+                    if task.exception() is None:
+                        return model_name, task.result()
+                    last_error = task.exception()
+                    if winner == model_name:
+                        raise last_error
+            raise last_error
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    def call(
+            self,
+            model_name: str,
+            send: Callable[[str, Callable[[str, str], None] | None], object],
+            on_delta: Callable[[str, str], None] | None = None,
+            on_retry: Callable[[int, float, Exception], None] | None = None,
+            on_fallback: Callable[[str, str, Exception], None] | None = None
+    ) -> tuple[str, object]:
+        """call_async 的同步版本，只做故障转移，不做对冲"""
+        candidates = self.route(model_name)
+        for index, candidate in enumerate(candidates):
+            try:
+                return candidate, self.requester.call(candidate, lambda: send(candidate, on_delta), on_retry)
+            except Exception as e:
+                if not can_fail_over(e) or index + 1 >= len(candidates):
+                    raise
+                if on_fallback is not None:
+                    on_fallback(candidate, candidates[index + 1], e)
+
+
+_model_router: ModelRouter | None = None
+_model_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    global _model_router
+    with _model_router_lock:
+        if _model_router is None:
+            _model_router = ModelRouter()
+        return _model_router
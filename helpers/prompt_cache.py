@@ -0,0 +1,116 @@
+import hashlib
+import json
+
+from helpers.model_api_client import prompt_cache_model_prefixes
+
+
+# 可以携带 cache_control 的消息角色（内容需为字符串）
+cacheable_roles = ("system", "user", "tool")
+
+
+def supports_prompt_cache(model_name: str) -> bool:
+    return model_name.startswith(prompt_cache_model_prefixes)
+
+
+def _with_cache_control(message: dict) -> dict:
+    """返回内容被改写为带 cache_control 的文本块的消息副本，原消息不变"""
+    cached_message = dict(message)
+    cached_message["content"] = [
+        {
+            "type": "text",
+            "text": message["content"],
+            "cache_control": {"type": "ephemeral"}
+        }
+    ]
+    return cached_message
+
+
+def _hash_messages(messages: list[dict]) -> str:
+    serialized = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """
+    提示词缓存断点管理
+
+    每次请求最多放置3个断点（Anthropic 最多支持4个）：
+    1. 系统消息：工具定义位于系统提示词之前，这个断点同时缓存了 tools 和系统提示词；
+    2. 历史深处的移动断点：按 stride 对齐，连续多轮保持不动，让长前缀稳定命中；
+    3. 最后一条消息：让下一次请求（例如工具循环中的下一轮）可以读取到这里为止的缓存。
+
+    同时根据返回的 usage 统计命中/未命中，并检查上一次请求的缓存前缀在本次请求中是否逐字节一致。
+    """
+
+    def __init__(self, stride: int = 16) -> None:
+        self.stride: int = stride
+        self.hits: int = 0
+        self.misses: int = 0
+        self.cached_tokens: int = 0
+        self.prompt_tokens: int = 0
+        self.prefix_changes: int = 0
+        self._last_prefix_length: int = 0
+        self._last_prefix_hash: str = ""
+
+    def _find_breakpoints(self, messages: list[dict]) -> list[int]:
+        eligible_indexes = [
+            index for index, message in enumerate(messages)
+            if message.get("role") in cacheable_roles and isinstance(message.get("content"), str) and message["content"] != ""
+        ]
+        if not eligible_indexes:
+            return []
+
+        breakpoints = []
+        if messages[eligible_indexes[0]].get("role") == "system":
+            breakpoints.append(eligible_indexes[0])
+
+        aligned_limit = (len(messages) // self.stride) * self.stride
+        stable_indexes = [index for index in eligible_indexes if index < aligned_limit]
+        if stable_indexes:
+            breakpoints.append(stable_indexes[-1])
+
+        breakpoints.append(eligible_indexes[-1])
+
+        return sorted(set(breakpoints))
+
+    def build_request_messages(self, messages: list[dict]) -> list[dict]:
+        """生成带缓存断点的请求消息列表，不修改 Agent 中保存的消息"""
+        # 上一次缓存的前缀在本次请求中应当原样存在，否则缓存必然失效
+        if self._last_prefix_length and len(messages) >= self._last_prefix_length:
+            if _hash_messages(messages[:self._last_prefix_length]) != self._last_prefix_hash:
+                self.prefix_changes += 1
+
+        breakpoints = self._find_breakpoints(messages)
+        if breakpoints:
+            self._last_prefix_length = breakpoints[-1] + 1
+            self._last_prefix_hash = _hash_messages(messages[:self._last_prefix_length])
+
+        breakpoint_set = set(breakpoints)
+        return [
+            _with_cache_control(message) if index in breakpoint_set else message
+            for index, message in enumerate(messages)
+        ]
+
+    def record_usage(self, usage) -> None:
+        """根据 ChatCompletion 的 usage 统计缓存命中情况"""
+        if usage is None:
+            return
+
+        prompt_tokens_details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(prompt_tokens_details, "cached_tokens", None) or 0
+
+        self.prompt_tokens += usage.prompt_tokens or 0
+        self.cached_tokens += cached_tokens
+        if cached_tokens > 0:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get_stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached_tokens": self.cached_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "prefix_changes": self.prefix_changes,
+        }
@@ -0,0 +1,55 @@
+import hashlib
+import os
+
+
+class ReadTracker:
+    """
+    记录本会话中模型已经看过的 read_file 结果
+
+    同一文件、同一读取区间的内容与模型上一次看到的完全相同，且那条工具消息仍完整地保留在历史中时，
+    用一条简短的提示代替重复的全文，节省提示词token。
+    """
+
+    def __init__(self, tool_names: tuple[str, ...] = ("read_file",)) -> None:
+        self.tool_names: tuple[str, ...] = tool_names
+        # (文件绝对路径, offset, limit) -> (内容哈希, tool_call_id)
+        self._seen: dict[tuple, tuple[str, str]] = {}
+
+    @staticmethod
+    def _hash_content(content: str) -> str:
+        return hashlib.sha1(content.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+    @staticmethod
+    def _find_tool_message(messages: list[dict], tool_call_id: str) -> dict | None:
+        for message in reversed(messages):
+            if message.get("role") == "tool" and message.get("tool_call_id") == tool_call_id:
+                return message
+        return None
+
+    def deduplicate(
+            self,
+            messages: list[dict],
+            tool_name: str,
+            tool_args: dict,
+            tool_call_id: str,
+            tool_content: str
+    ) -> str:
+        """返回应当追加到消息历史中的工具返回内容"""
+        if tool_name not in self.tool_names or tool_content.startswith("错误："):
+            return tool_content
+
+        file_path = tool_args.get("file_path")
+        if not isinstance(file_path, str):
+            return tool_content
+        read_key = (os.path.normcase(os.path.abspath(file_path)), tool_args.get("offset"), tool_args.get("limit"))
+        content_hash = self._hash_content(tool_content)
+
+        seen = self._seen.get(read_key)
+        if seen is not None and seen[0] == content_hash:
+            # 之前的结果可能已被删除或压缩，只有仍然完整保留时才能引用
+            previous_message = self._find_tool_message(messages, seen[1])
+            if previous_message is not None and previous_message.get("content") == tool_content:
+                return f"[文件 '{file_path}' 的内容自 tool_call_id 为 {seen[1]} 的读取结果以来没有变化，请直接参考该结果]"
+
+        self._seen[read_key] = (content_hash, tool_call_id)
+        return tool_content
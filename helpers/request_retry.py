@@ -0,0 +1,329 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from collections.abc import Callable, Awaitable
+from email.utils import parsedate_to_datetime
+
+import openai
+
+from helpers.stats import percentile
+
+
+# 这些状态码表示服务端暂时不可用或限流，可以重试
+retryable_status_codes = {408, 409, 429, 500, 502, 503, 504}
+# 每个模型默认的请求速率（令牌桶）：每秒补充的令牌数和桶容量
+default_requests_per_second = 2.0
+default_burst = 10
+# 每个模型保留的最近请求记录条数
+max_recorded_attempts = 500
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开期间直接拒绝请求"""
+
+    def __init__(self, model_name: str, retry_in: float) -> None:
+        super().__init__(f"模型 {model_name} 连续请求失败，已暂停请求，{retry_in:.0f} 秒后重试")
+        self.model_name: str = model_name
+        self.retry_in: float = retry_in
+
+
+class PartialResponseError(Exception):
+    """流式返回已经输出了部分内容后中断，不能再重试（否则界面上的内容会重复）"""
+
+    def __init__(self, error: Exception) -> None:
+        super().__init__(f"流式返回中断：{error}")
+        self.error: Exception = error
+
+
+def is_retryable(error: Exception) -> bool:
+    # APITimeoutError 是 APIConnectionError 的子类
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in retryable_status_codes
+    return False
+
+
+def get_retry_after(error: Exception) -> float | None:
+    """从响应头 Retry-After（秒数或 HTTP 日期）或 retry-after-ms 中读取服务端要求的等待时间"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return max(float(retry_after_ms) / 1000, 0.0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return max(float(retry_after), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_error_type(error: Exception) -> str:
+    if isinstance(error, openai.APIStatusError):
+        return f"http_{error.status_code}"
+    return type(error).__name__
+
+
+class RetryPolicy:
+    """带抖动的指数退避：第 n 次重试等待 [0, min(max_delay, base_delay * 2^n)] 之间的随机时间，服务端给出 Retry-After 时以其为准"""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 30.0, max_retry_after: float = 120.0) -> None:
+        self.max_attempts: int = max_attempts
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        # Retry-After 超过该值时不再等待，直接报错
+        self.max_retry_after: float = max_retry_after
+
+    def get_delay(self, attempt: int, error: Exception) -> float | None:
+        """attempt 从 0 开始；返回 None 表示不再重试"""
+        if attempt + 1 >= self.max_attempts or not is_retryable(error):
+            return None
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_retry_after else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class TokenBucket:
+    """令牌桶限流，线程安全；reserve 预先扣除令牌并返回需要等待的时间"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.tokens: float = capacity
+        self.updated_at: float = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            # 令牌可以欠下，之后的请求依次排在后面
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续 failure_threshold 次可重试的失败后打开，reset_timeout 秒内的请求直接失败；
+    之后进入半开状态，只放行一个试探请求，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold: int = failure_threshold
+        self.reset_timeout: float = reset_timeout
+        self.failure_count: int = 0
+        self.opened_at: float | None = None
+        self.is_probing: bool = False
+        self._lock = threading.Lock()
+
+    def before_request(self, model_name: str) -> None:
+        with self._lock:
+            if self.opened_at is None:
+                return
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if retry_in > 0 or self.is_probing:
+                raise CircuitOpenError(model_name, max(retry_in, 0.0))
+            self.is_probing = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failure_count = 0
+            self.opened_at = None
+            self.is_probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failure_count += 1
+            if self.is_probing or self.failure_count >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.is_probing = False
+
+    def is_open(self) -> bool:
+        """熔断器是否正在拒绝请求（不会占用半开状态的试探机会）"""
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            return self.is_probing or time.monotonic() < self.opened_at + self.reset_timeout
+
+    def release_probe(self) -> None:
+        """试探请求因不计入熔断的原因结束（如被取消、请求参数错误）时释放半开状态"""
+        with self._lock:
+            self.is_probing = False
+
+
+class AttemptRecord:
+    __slots__ = ("model_name", "started_at", "latency", "error_type")
+
+    def __init__(self, model_name, started_at, latency, error_type):
+        self.model_name = model_name
+        self.started_at = started_at
+        self.latency = latency
+        # 成功时为 None
+        self.error_type = error_type
+
+
+class RequestMetrics:
+    """记录每次请求尝试的耗时和错误类型，每个模型只保留最近 max_recorded_attempts 条"""
+
+    def __init__(self) -> None:
+        self._attempts: dict[str, deque[AttemptRecord]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name: str, started_at: float, latency: float, error: Exception | None) -> None:
+        attempt = AttemptRecord(model_name, started_at, latency, None if error is None else get_error_type(error))
+        with self._lock:
+            self._attempts.setdefault(model_name, deque(maxlen=max_recorded_attempts)).append(attempt)
+
+    def get_attempts(self, model_name: str) -> list[AttemptRecord]:
+        with self._lock:
+            return list(self._attempts.get(model_name, ()))
+
+    def get_rolling_stats(self, model_name: str, window_seconds: float) -> dict:
+        """最近 window_seconds 秒内成功请求耗时的 p50、p95（没有成功请求时为 None）以及错误率"""
+        since = time.monotonic() - window_seconds
+        attempts = [attempt for attempt in self.get_attempts(model_name) if attempt.started_at >= since]
+        latencies = sorted(attempt.latency for attempt in attempts if attempt.error_type is None)
+        error_count = len(attempts) - len(latencies)
+        return {
+            "attempts": len(attempts),
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "error_rate": error_count / len(attempts) if attempts else 0.0,
+        }
+
+    def summary(self, model_name: str) -> dict:
+        attempts = self.get_attempts(model_name)
+        error_counts = {}
+        for attempt in attempts:
+            if attempt.error_type is not None:
+                error_counts[attempt.error_type] = error_counts.get(attempt.error_type, 0) + 1
+        latencies = [attempt.latency for attempt in attempts if attempt.error_type is None]
+        return {
+            "attempts": len(attempts),
+            "errors": sum(error_counts.values()),
+            "error_counts": error_counts,
+            "average_latency": sum(latencies) / len(latencies) if latencies else None,
+        }
+
+
+class ResilientRequester:
+    """
+    模型请求的重试层：按模型限流和熔断，可重试的错误按 RetryPolicy 退避后重试，每次尝试记录到 RequestMetrics
+
+    send 是完成一次完整请求（包括接收流式返回）的函数；流式返回已输出部分内容后的失败应包装为 PartialResponseError，不会重试。
+    """
+
+    def __init__(self, retry_policy: RetryPolicy | None = None, requests_per_second: float = default_requests_per_second, burst: float = default_burst) -> None:
+        self.retry_policy: RetryPolicy = retry_policy or RetryPolicy()
+        self.requests_per_second: float = requests_per_second
+        self.burst: float = burst
+        self.metrics: RequestMetrics = RequestMetrics()
+        self._rate_limiters: dict[str, TokenBucket] = {}
+        self._circuit_breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get_rate_limiter(self, model_name: str) -> TokenBucket:
+        with self._lock:
+            if model_name not in self._rate_limiters:
+                self._rate_limiters[model_name] = TokenBucket(self.requests_per_second, self.burst)
+            return self._rate_limiters[model_name]
+
+    def get_circuit_breaker(self, model_name: str) -> CircuitBreaker:
+        with self._lock:
+            if model_name not in self._circuit_breakers:
+                self._circuit_breakers[model_name] = CircuitBreaker()
+            return self._circuit_breakers[model_name]
+
+    def _finish_attempt(self, model_name: str, started_at: float, error: Exception | None) -> None:
+        self.metrics.record(model_name, started_at, time.monotonic() - started_at, error)
+        circuit_breaker = self.get_circuit_breaker(model_name)
+        original_error = error.error if isinstance(error, PartialResponseError) else error
+        if error is None:
+            circuit_breaker.record_success()
+        elif is_retryable(original_error):
+            circuit_breaker.record_failure()
+        else:
+            circuit_breaker.release_probe()
+
+    async def call_async(self, model_name: str, send: Callable[[], Awaitable], on_retry: Callable[[int, float, Exception], None] | None = None):
+        """
+        Args:
+            on_retry: 每次重试前调用 on_retry(下一次尝试的序号, 等待秒数, 错误)
+        """
+        attempt = 0
+        while True:
+            self.get_circuit_breaker(model_name).before_request(model_name)
+            await asyncio.sleep(self.get_rate_limiter(model_name).reserve())
+
+            started_at = time.monotonic()
+            try:
+                result = await send()
+            except asyncio.CancelledError:
+                self.get_circuit_breaker(model_name).release_probe()
+                raise
+            except Exception as e:
+                self._finish_attempt(model_name, started_at, e)
+                delay = self.retry_policy.get_delay(attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                if on_retry is not None:
+                    on_retry(attempt, delay, e)
+                await asyncio.sleep(delay)
+                continue
+            self._finish_attempt(model_name, started_at, None)
+            return result
+
+    def call(self, model_name: str, send: Callable[[], object], on_retry: Callable[[int, float, Exception], None] | None = None):
+        """call_async 的同步版本"""
+        attempt = 0
+        while True:
+            self.get_circuit_breaker(model_name).before_request(model_name)
+            time.sleep(self.get_rate_limiter(model_name).reserve())
+
+            started_at = time.monotonic()
+            try:
+                result = send()
+            except Exception as e:
+                self._finish_attempt(model_name, started_at, e)
+                delay = self.retry_policy.get_delay(attempt, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                if on_retry is not None:
+                    on_retry(attempt, delay, e)
+                time.sleep(delay)
+                continue
+            self._finish_attempt(model_name, started_at, None)
+            return result
+
+
+_resilient_requester: ResilientRequester | None = None
+_resilient_requester_lock = threading.Lock()
+
+
+def get_resilient_requester() -> ResilientRequester:
+    global _resilient_requester
+    with _resilient_requester_lock:
+        if _resilient_requester is None:
+            _resilient_requester = ResilientRequester()
+        return _resilient_requester
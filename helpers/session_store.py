@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import uuid
+import threading
+from datetime import datetime
+
+
+# 会话日志的保存目录（相对于程序工作目录）
+sessions_dir_path = os.path.join("saved_chats", "sessions")
+# 列出会话时，为了找到第一条用户消息作为标题，最多读取的字节数
+title_scan_bytes = 256 * 1024
+max_title_chars = 40
+
+
+class SessionLog:
+    """
+    追加写入的会话日志（JSONL）
+
+    第一行是会话的元信息，之后每一行是对消息列表的一次修改：
+        {"op": "append", "time": ..., "message": {...}}
+        {"op": "insert", "index": 3, "time": ..., "message": {...}}
+        {"op": "delete", "index": 3}
+        {"op": "clear"}（只保留系统消息）
+    写入只进入文件缓冲区，由后台线程每隔 fsync_interval 秒统一 flush 和 fsync 一次，
+    程序崩溃时最多丢失最后一个间隔内的修改。系统消息不写入日志，恢复时使用新生成的系统提示词；
+    日志中的索引按消息列表开头有一条系统消息计算。
+    """
+
+    def __init__(self, file_path: str, fsync_interval: float = 1.0) -> None:
+        self.file_path: str = file_path
+        self.fsync_interval: float = fsync_interval
+        self._file = open(file_path, 'ab')
+        # 上次写入时崩溃留下的不完整行单独成行，不影响之后的记录
+        if self._file.tell() > 0:
+            with open(file_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write(b"\n")
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._has_pending_writes = False
+        self._is_closed = False
+        self._flush_thread = threading.Thread(target=self._flush_loop, name="session-log-flush", daemon=True)
+        self._flush_thread.start()
+
+    def write(self, record: dict) -> None:
+        # 在调用方线程中立即序列化，之后对消息字典的原地修改（如上下文压缩）不会影响日志
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8', errors='surrogatepass')
+        with self._condition:
+            if self._is_closed:
+                return
+            self._file.write(line)
+            self._has_pending_writes = True
+            self._condition.notify()
+
+    def _sync(self) -> None:
+        """调用方需持有锁"""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._has_pending_writes = False
+
+    def _flush_loop(self) -> None:
+        while True:
+            with self._condition:
+                while not self._has_pending_writes and not self._is_closed:
+                    self._condition.wait()
+                if self._is_closed:
+                    return
+            # 等待一个间隔，让这段时间内的写入合并为一次 fsync；关闭时立即结束等待，close 不必等满一个间隔
+            with self._condition:
+                self._condition.wait_for(lambda: self._is_closed, timeout=self.fsync_interval)
+                if self._is_closed:
+                    return
+                self._sync()
+
+    def close(self) -> None:
+        with self._condition:
+            if self._is_closed:
+                return
+            if self._has_pending_writes:
+                self._sync()
+            self._is_closed = True
+            self._file.close()
+            self._condition.notify()
+        self._flush_thread.join(timeout=1.0)
+
+
+class LoggedMessageList(list):
+    """
+    每次增删都写入会话日志的消息列表，用来替换 Agent.messages
+
+    覆盖了 Agent、AgentWorker 和界面实际用到的修改方法（append、insert、按索引删除、clear_history）；
+    消息字典的原地修改（上下文压缩）不写入日志，恢复的会话仍是完整的原始内容。
+    """
+
+    def __init__(self, messages: list[dict], session_log: SessionLog) -> None:
+        # 初始消息（系统消息和恢复的历史）已经在日志中或不需要记录
+        super().__init__(messages)
+        self.session_log: SessionLog = session_log
+
+    def extend(self, messages) -> None:
+        for message in messages:
+            self.append(message)
+
+    def append(self, message: dict) -> None:
+        super().append(message)
+        if message.get("role") != "system":
+            self.session_log.write({"op": "append", "time": time.time(), "message": message})
+
+    def insert(self, index: int, message: dict) -> None:
+        index = min(index if index >= 0 else max(len(self) + index, 0), len(self))
+        super().insert(index, message)
+        self.session_log.write({"op": "insert", "index": index, "time": time.time(), "message": message})
+
+    def __delitem__(self, index) -> None:
+        if isinstance(index, slice):
+            for i in sorted(range(*index.indices(len(self))), reverse=True):
+                del self[i]
+            return
+        if index < 0:
+            index += len(self)
+        super().__delitem__(index)
+        self.session_log.write({"op": "delete", "index": index})
+
+    def clear_history(self) -> None:
+        """删除所有非系统消息"""
+        system_messages = [message for message in self if message.get("role") == "system"]
+        super().clear()
+        super().extend(system_messages)
+        self.session_log.write({"op": "clear"})
+
+
+class SessionInfo:
+    """会话列表中的一项，只包含元信息和标题，不加载消息"""
+
+    __slots__ = ("file_path", "created_at", "root_dir", "work_dir", "model_name", "title", "size")
+
+    def __init__(self, file_path, created_at, root_dir, work_dir, model_name, title, size):
+        self.file_path = file_path
+        self.created_at = created_at
+        self.root_dir = root_dir
+        self.work_dir = work_dir
+        self.model_name = model_name
+        self.title = title
+        self.size = size
+
+
+def create_session(root_dir: str, work_dir: str, model_name: str) -> SessionLog:
+    """新建会话日志并写入元信息"""
+    os.makedirs(sessions_dir_path, exist_ok=True)
+    created_at = datetime.now()
+    file_name = f"{created_at.strftime('%Y_%m_%d_%H_%M_%S')}_{uuid.uuid4().hex[:8]}.jsonl"
+    session_log = SessionLog(os.path.join(sessions_dir_path, file_name))
+    session_log.write({
+        "op": "meta",
+        "version": 1,
+        "created_at": created_at.isoformat(timespec="seconds"),
+        "root_dir": root_dir,
+        "work_dir": work_dir,
+        "model_name": model_name,
+    })
+    return session_log
+
+
+def _read_meta(f) -> dict | None:
+    try:
+        meta = json.loads(f.readline())
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return meta if isinstance(meta, dict) and meta.get("op") == "meta" else None
+
+
+def list_sessions() -> list[SessionInfo]:
+    """列出已保存的会话（新的在前），每个会话只读取开头的元信息和第一条用户消息"""
+    if not os.path.isdir(sessions_dir_path):
+        return []
+
+    sessions = []
+    for file_name in os.listdir(sessions_dir_path):
+        if not file_name.endswith(".jsonl"):
+            continue
+        file_path = os.path.join(sessions_dir_path, file_name)
+        try:
+            with open(file_path, 'rb') as f:
+                meta = _read_meta(f)
+                if meta is None:
+                    continue
+                title = ""
+                while f.tell() < title_scan_bytes:
+                    line = f.readline()
+                    if not line:
+                        break
+                    # 只解析追加用户消息的行
+                    if b'"role": "user"' not in line:
+                        continue
+                    try:
+                        content = json.loads(line)["message"]["content"]
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    if isinstance(content, str):
+                        title = " ".join(content.split())[:max_title_chars]
+                        break
+            size = os.path.getsize(file_path)
+        except OSError:
+            continue
+        sessions.append(SessionInfo(file_path, meta.get("created_at", ""), meta.get("root_dir", ""), meta.get("work_dir", ""), meta.get("model_name", ""), title, size))
+
+    sessions.sort(key=lambda session: session.created_at, reverse=True)
+    return sessions
+
+
+def load_session(file_path: str) -> tuple[dict, list[dict], list[float]]:
+    """
+    重放会话日志，得到元信息、系统消息之外的消息列表以及每条消息的时间
+
+    末尾不完整的一行（写入时崩溃）会被忽略。
+    """
+    messages = []
+    message_times = []
+    with open(file_path, 'rb') as f:
+        meta = _read_meta(f)
+        if meta is None:
+            raise ValueError(f"'{file_path}' 不是会话日志")
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            op = record.get("op")
+            # 日志中的索引包含开头的系统消息
+            if op == "append":
+                messages.append(record["message"])
+                message_times.append(record.get("time", 0.0))
+            elif op == "insert":
+                index = max(record["index"] - 1, 0)
+                messages.insert(index, record["message"])
+                message_times.insert(index, record.get("time", 0.0))
+            elif op == "delete":
+                index = record["index"] - 1
+                if 0 <= index < len(messages):
+                    del messages[index]
+                    del message_times[index]
+            elif op == "clear":
+                messages = []
+                message_times = []
+    return meta, messages, message_times
+
+
+def open_session(file_path: str) -> tuple[SessionLog, dict, list[dict], list[float]]:
+    """加载已有的会话并继续向同一个日志追加"""
+    meta, messages, message_times = load_session(file_path)
+    return SessionLog(file_path), meta, messages, message_times
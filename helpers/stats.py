@@ -0,0 +1,5 @@
+def percentile(sorted_values: list[float], fraction: float) -> float | None:
+    """最近秩法求分位数，sorted_values 需已按升序排序；没有数据时返回 None"""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(len(sorted_values) * fraction + 0.5) - 1))]
@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import threading
+from collections.abc import Iterable
+from datetime import datetime
+
+from helpers.model_api_client import model_prices
+from helpers.stats import percentile
+
+
+# 指标日志的保存目录（相对于程序工作目录），每天一个 JSONL 文件
+metrics_dir_path = os.path.join("saved_chats", "metrics")
+
+
+def get_usage_tokens(usage) -> dict:
+    """从 ChatCompletion 的 usage 中取出各类 token 数，缺少的字段记为 0"""
+    prompt_tokens_details = getattr(usage, "prompt_tokens_details", None)
+    completion_tokens_details = getattr(usage, "completion_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+        "cached_tokens": getattr(prompt_tokens_details, "cached_tokens", None) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+        "reasoning_tokens": getattr(completion_tokens_details, "reasoning_tokens", None) or 0,
+    }
+
+
+def estimate_cost(model_name: str, tokens: dict) -> float | None:
+    """按 model_prices 估算一次请求的费用（美元）；没有价格的模型返回 None"""
+    prices = model_prices.get(model_name)
+    if prices is None:
+        return None
+    input_price, cached_input_price, output_price = prices
+    uncached_tokens = max(0, tokens["prompt_tokens"] - tokens["cached_tokens"])
+    return (
+        uncached_tokens * input_price
+        + tokens["cached_tokens"] * cached_input_price
+        + tokens["completion_tokens"] * output_price
+    ) / 1_000_000
+
+
+class MetricsLog:
+    """
+    追加写入的指标日志（JSONL），所有会话共用
+
+    每一行是一条记录：
+        {"type": "completion", "time": ..., "session": ..., "model": ..., "latency": ..., "ttft": ..., "prompt_tokens": ..., ...}
+        {"type": "tool", "time": ..., "session": ..., "tool": ..., "wall_time": ..., "output_chars": ..., "is_error": ...}
+    按日期分文件，可以用 summarize_metrics（或 python cli.py --report）离线汇总。
+    """
+
+    def __init__(self, dir_path: str = metrics_dir_path) -> None:
+        self.dir_path: str = dir_path
+        self._file = None
+        self._file_date: str | None = None
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        date = datetime.fromtimestamp(record["time"]).strftime("%Y_%m_%d")
+        with self._lock:
+            try:
+                if date != self._file_date:
+                    if self._file is not None:
+                        self._file.close()
+                    os.makedirs(self.dir_path, exist_ok=True)
+                    self._file = open(os.path.join(self.dir_path, f"{date}.jsonl"), 'a', encoding='utf-8')
+                    self._file_date = date
+                self._file.write(line)
+                self._file.flush()
+            except OSError:
+                # 指标写入失败不影响对话
+                pass
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                self._file_date = None
+
+
+class SessionTelemetry:
+    """
+    一个会话的指标：每次模型请求的耗时、TTFT、token 数和费用，以及每次工具调用的耗时和返回大小
+
+    每条记录写入指标日志并累加到会话的合计中。工具记录在工具线程中写入，合计的读写都持有锁。
+    """
+
+    def __init__(self, session_id: str, metrics_log: MetricsLog | None = None) -> None:
+        self.session_id: str = session_id
+        self.metrics_log: MetricsLog | None = metrics_log
+        self._lock = threading.Lock()
+        self._totals = {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+            "reasoning_tokens": 0,
+            "cost": 0.0,
+            "last_model": None,
+            "last_latency": None,
+            "last_ttft": None,
+            "tool_calls": 0,
+            "tool_errors": 0,
+            "tool_time": 0.0,
+        }
+
+    def record_completion(self, model_name: str, latency: float | None, ttft: float | None, usage) -> dict:
+        tokens = get_usage_tokens(usage)
+        cost = estimate_cost(model_name, tokens)
+        record = {
+            "type": "completion",
+            "time": time.time(),
+            "session": self.session_id,
+            "model": model_name,
+            "latency": round(latency, 4) if latency is not None else None,
+            "ttft": round(ttft, 4) if ttft is not None else None,
+            **tokens,
+            "cost": cost,
+        }
+        with self._lock:
+            self._totals["requests"] += 1
+            for name, count in tokens.items():
+                self._totals[name] += count
+            self._totals["cost"] += cost or 0.0
+            self._totals["last_model"] = model_name
+            self._totals["last_latency"] = latency
+            self._totals["last_ttft"] = ttft
+        if self.metrics_log is not None:
+            self.metrics_log.write(record)
+        return record
+
+    def record_tool(self, tool_name: str, wall_time: float, output_chars: int, is_error: bool) -> dict:
+        record = {
+            "type": "tool",
+            "time": time.time(),
+            "session": self.session_id,
+            "tool": tool_name,
+            "wall_time": round(wall_time, 4),
+            "output_chars": output_chars,
+            "is_error": is_error,
+        }
+        with self._lock:
+            self._totals["tool_calls"] += 1
+            self._totals["tool_errors"] += int(is_error)
+            self._totals["tool_time"] += wall_time
+        if self.metrics_log is not None:
+            self.metrics_log.write(record)
+        return record
+
+    def get_totals(self) -> dict:
+        with self._lock:
+            return dict(self._totals)
+
+
+def read_metrics(paths: Iterable[str]) -> Iterable[dict]:
+    """逐行读取指标日志，跳过损坏的行"""
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def summarize_metrics(records: Iterable[dict]) -> dict:
+    """
+    离线汇总指标记录
+
+    Returns:
+        {
+            "models": {模型: {"requests", "p50_latency", "p95_latency", "p50_ttft", "p95_ttft", "prompt_tokens", "cached_tokens", "completion_tokens", "cost"}},
+            "tools": {工具: {"calls", "errors", "p50", "p95", "total_time", "mean_output_chars"}},
+            "sessions": {会话: {"requests", "tool_calls", "cost"}}
+        }
+    """
+    latencies: dict[str, list[float]] = {}
+    ttfts: dict[str, list[float]] = {}
+    wall_times: dict[str, list[float]] = {}
+    models: dict[str, dict] = {}
+    tools: dict[str, dict] = {}
+    sessions: dict[str, dict] = {}
+
+    for record in records:
+        session = sessions.setdefault(record.get("session"), {"requests": 0, "tool_calls": 0, "cost": 0.0})
+        if record.get("type") == "completion":
+            model_name = record["model"]
+            model = models.setdefault(model_name, {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+            model["requests"] += 1
+            for name in ("prompt_tokens", "cached_tokens", "completion_tokens"):
+                model[name] += record.get(name) or 0
+            model["cost"] += record.get("cost") or 0.0
+            if record.get("latency") is not None:
+                latencies.setdefault(model_name, []).append(record["latency"])
+            if record.get("ttft") is not None:
+                ttfts.setdefault(model_name, []).append(record["ttft"])
+            session["requests"] += 1
+            session["cost"] += record.get("cost") or 0.0
+        elif record.get("type") == "tool":
+            tool_name = record["tool"]
+            tool = tools.setdefault(tool_name, {"calls": 0, "errors": 0, "total_time": 0.0, "total_output_chars": 0})
+            tool["calls"] += 1
+            tool["errors"] += int(bool(record.get("is_error")))
+            tool["total_time"] += record["wall_time"]
+            tool["total_output_chars"] += record.get("output_chars") or 0
+            wall_times.setdefault(tool_name, []).append(record["wall_time"])
+            session["tool_calls"] += 1
+
+    for model_name, model in models.items():
+        sorted_latencies = sorted(latencies.get(model_name, []))
+        sorted_ttfts = sorted(ttfts.get(model_name, []))
+        model["p50_latency"] = percentile(sorted_latencies, 0.5)
+        model["p95_latency"] = percentile(sorted_latencies, 0.95)
+        model["p50_ttft"] = percentile(sorted_ttfts, 0.5)
+        model["p95_ttft"] = percentile(sorted_ttfts, 0.95)
+    for tool_name, tool in tools.items():
+        sorted_wall_times = sorted(wall_times[tool_name])
+        tool["p50"] = percentile(sorted_wall_times, 0.5)
+        tool["p95"] = percentile(sorted_wall_times, 0.95)
+        tool["mean_output_chars"] = tool.pop("total_output_chars") / tool["calls"]
+
+    return {"models": models, "tools": tools, "sessions": sessions}
+
+
+_metrics_log: MetricsLog | None = None
+_metrics_log_lock = threading.Lock()
+
+
+def get_metrics_log() -> MetricsLog:
+    global _metrics_log
+    with _metrics_log_lock:
+        if _metrics_log is None:
+            _metrics_log = MetricsLog()
+        return _metrics_log
@@ -0,0 +1,380 @@
+import os
+import re
+import fnmatch
+import hashlib
+import pickle
+import threading
+import time
+from array import array
+
+try:
+    from re import _parser as regex_parser, _constants as regex_constants
+except ImportError:  # Python 3.10 及更早版本
+    import sre_parse as regex_parser
+    import sre_constants as regex_constants
+
+from tools.ignore_rules import ignore_matcher, iter_files
+from tools.text_files import read_text
+
+
+# 索引文件的保存目录（相对于程序工作目录）
+index_dir_path = os.path.join(".cache", "code_search")
+# 超过该大小的文件不建立索引，搜索时也跳过
+max_indexed_file_bytes = 512 * 1024
+# 增量更新后两次保存索引的最短间隔（秒）
+save_interval_seconds = 30
+# 单条结果中代码片段的最大长度
+max_snippet_chars = 200
+# 上次增量更新的耗时超过该值（秒）时开始限制更新频率，更快的小仓库每次搜索前都更新
+min_throttled_refresh_seconds = 0.05
+# 限制频率时两次更新的最短间隔为上次更新耗时的多少倍，大仓库（一次更新要遍历并 stat 所有文件）
+# 的更新开销因此不超过搜索总耗时的一小部分；间隔最长不超过 max_refresh_interval_seconds 秒
+refresh_cost_ratio = 10
+max_refresh_interval_seconds = 10
+
+
+def _get_trigrams(text):
+    """小写后的 UTF-8 字节三元组集合，大小写不敏感的查询同样可以使用"""
+    data = text.lower().encode('utf-8', errors='surrogatepass')
+    return set(zip(data, data[1:], data[2:]))
+
+
+def _get_required_literals(pattern, is_literal):
+    """
+    提取匹配结果中一定会出现的字面量片段，用于按三元组筛选候选文件
+
+    只分析正则最顶层的顺序结构，遇到分支、重复、分组等就断开当前片段；无法分析时返回空列表（不筛选）。
+    """
+    if is_literal:
+        return [pattern]
+
+    try:
+        parsed_pattern = regex_parser.parse(pattern)
+    except Exception:
+        return []
+
+    literals = []
+    current_chars = []
+    for op, argument in parsed_pattern:
+        if op == regex_constants.LITERAL:
+            current_chars.append(chr(argument))
+            continue
+        if op == regex_constants.BRANCH:
+            return []
+        if current_chars:
+            literals.append("".join(current_chars))
+            current_chars = []
+    if current_chars:
+        literals.append("".join(current_chars))
+
+    return [literal for literal in literals if len(literal.encode('utf-8')) >= 3]
+
+
+class TrigramIndex:
+    """
+    某个根目录下所有未被忽略的文本文件的三元组倒排索引
+
+    每个文件分配一个递增的编号，倒排表是按编号递增的 array；文件变化时旧编号作废、分配新编号，
+    查询时跳过作废的编号，作废的编号过多时在后台整体重建。索引保存在磁盘上，下次启动时只需按 mtime 增量更新。
+    """
+
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.index_file_path = os.path.join(index_dir_path, hashlib.sha1(root_path.encode('utf-8')).hexdigest() + ".pickle")
+        # 文件路径 -> (编号, mtime, 大小)
+        self.files: dict[str, tuple[int, int, int]] = {}
+        # 三元组 -> 文件编号的 array
+        self.postings: dict[tuple, array] = {}
+        self.next_file_id = 0
+        self.stale_file_count = 0
+        self.is_ready = False
+        self.is_building = False
+        self.is_refreshing = False
+        self.last_save_time = 0.0
+        self.last_refresh_time = 0.0
+        self.last_refresh_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def _add_file(self, file_path, stat_result):
+        """为单个文件建立索引，调用方需持有锁"""
+        file_id = self.next_file_id
+        self.next_file_id += 1
+        self.files[file_path] = (file_id, stat_result.st_mtime_ns, stat_result.st_size)
+
+        if stat_result.st_size > max_indexed_file_bytes:
+            return
+        try:
+            text = read_text(file_path)
+        except OSError:
+            return
+        if text is None:
+            return
+        for trigram in _get_trigrams(text):
+            posting = self.postings.get(trigram)
+            if posting is None:
+                posting = self.postings[trigram] = array('I')
+            posting.append(file_id)
+
+    def _load(self):
+        try:
+            with open(self.index_file_path, 'rb') as f:
+                saved_index = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return False
+        if saved_index.get("root_path") != self.root_path:
+            return False
+        self.files = saved_index["files"]
+        self.postings = saved_index["postings"]
+        self.next_file_id = saved_index["next_file_id"]
+        self.stale_file_count = saved_index["stale_file_count"]
+        return True
+
+    def _save(self):
+        """原子地写入磁盘，调用方需持有锁"""
+        os.makedirs(index_dir_path, exist_ok=True)
+        temp_path = self.index_file_path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump(
+                {
+                    "root_path": self.root_path,
+                    "files": self.files,
+                    "postings": self.postings,
+                    "next_file_id": self.next_file_id,
+                    "stale_file_count": self.stale_file_count,
+                },
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(temp_path, self.index_file_path)
+        self.last_save_time = time.monotonic()
+
+    def _rebuild(self):
+        """丢弃作废的编号，重新为所有文件建立索引"""
+        with self.lock:
+            self.files = {}
+            self.postings = {}
+            self.next_file_id = 0
+            self.stale_file_count = 0
+            for file_path in iter_files(self.root_path, ignore_matcher):
+                try:
+                    self._add_file(file_path, os.stat(file_path))
+                except OSError:
+                    continue
+            self._save()
+            # 重建还要读取所有文件，耗时不代表增量更新的开销，下一次搜索时照常更新
+            self.last_refresh_time = time.monotonic()
+            self.last_refresh_seconds = 0.0
+
+    def _build(self, force_rebuild):
+        try:
+            with self.lock:
+                is_loaded = not force_rebuild and self._load()
+            if is_loaded:
+                self.refresh(force=True)
+            else:
+                self._rebuild()
+            self.is_ready = True
+        finally:
+            self.is_building = False
+
+    def start_build(self, force_rebuild = False):
+        """在后台线程中加载或建立索引，建立期间搜索会直接遍历文件"""
+        with self.lock:
+            if self.is_building or (self.is_ready and not force_rebuild):
+                return
+            self.is_building = True
+            self.is_ready = False
+        threading.Thread(target=self._build, args=(force_rebuild,), name="code-search-index", daemon=True).start()
+
+    def refresh(self, force = False):
+        """
+        按 mtime 和大小增量更新变化、新增和删除的文件
+
+        上次更新较慢且距上次更新不到其耗时的 refresh_cost_ratio 倍（最多 max_refresh_interval_seconds 秒）时直接返回，
+        已有其他线程在更新时也直接返回、使用当前的索引；force 为 True 时不限制频率。
+        遍历和 stat 在锁外进行，不阻塞同时进行的查询。
+        """
+        with self.lock:
+            if self.is_refreshing:
+                return
+            elapsed = time.monotonic() - self.last_refresh_time
+            min_interval = min(self.last_refresh_seconds * refresh_cost_ratio, max_refresh_interval_seconds)
+            if not force and self.last_refresh_seconds >= min_throttled_refresh_seconds and elapsed < min_interval:
+                return
+            self.is_refreshing = True
+            indexed_files = dict(self.files)
+
+        try:
+            started_at = time.monotonic()
+            current_paths = set()
+            changed_files = []
+            for file_path in iter_files(self.root_path, ignore_matcher):
+                current_paths.add(file_path)
+                try:
+                    stat_result = os.stat(file_path)
+                except OSError:
+                    continue
+                indexed = indexed_files.get(file_path)
+                if indexed is None or indexed[1] != stat_result.st_mtime_ns or indexed[2] != stat_result.st_size:
+                    changed_files.append((file_path, stat_result))
+
+            with self.lock:
+                for file_path, stat_result in changed_files:
+                    if file_path in self.files:
+                        self.stale_file_count += 1
+                    self._add_file(file_path, stat_result)
+
+                deleted_paths = [file_path for file_path in self.files if file_path not in current_paths]
+                for file_path in deleted_paths:
+                    del self.files[file_path]
+                    self.stale_file_count += 1
+
+                changed_count = len(changed_files) + len(deleted_paths)
+                needs_rebuild = self.stale_file_count > max(1000, len(self.files))
+                if changed_count and not needs_rebuild and time.monotonic() - self.last_save_time >= save_interval_seconds:
+                    self._save()
+                self.last_refresh_time = time.monotonic()
+                self.last_refresh_seconds = self.last_refresh_time - started_at
+        finally:
+            with self.lock:
+                self.is_refreshing = False
+
+        if needs_rebuild:
+            self.start_build(force_rebuild=True)
+
+    def get_candidates(self, literals):
+        """返回可能包含所有字面量片段的文件路径列表（已排序）"""
+        with self.lock:
+            live_paths = {file_id: file_path for file_path, (file_id, _, _) in self.files.items()}
+            candidate_ids = None
+            for literal in literals:
+                for trigram in _get_trigrams(literal):
+                    posting = self.postings.get(trigram)
+                    if posting is None:
+                        return []
+                    if candidate_ids is None:
+                        candidate_ids = set(posting)
+                    else:
+                        candidate_ids.intersection_update(posting)
+                    if not candidate_ids:
+                        return []
+
+        if candidate_ids is None:
+            return sorted(live_paths.values())
+        return sorted(live_paths[file_id] for file_id in candidate_ids if file_id in live_paths)
+
+
+_indexes: dict[str, TrigramIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_trigram_index(dir_path):
+    """
+    返回覆盖 dir_path 的索引，没有时返回 None
+
+    只有 warm_up 登记的项目根目录（及其子目录）使用持久的索引；模型传入的其他目录（如 / 或用户目录）
+    直接遍历搜索，不会为它们在后台建立索引、把很大的索引文件写到磁盘上。
+    """
+    dir_path = os.path.abspath(dir_path)
+    with _indexes_lock:
+        for root_path, trigram_index in _indexes.items():
+            if dir_path == root_path or dir_path.startswith(root_path.rstrip(os.sep) + os.sep):
+                return trigram_index
+    return None
+
+
+def search_code(pattern, dir_path, literal = False, ignore_case = False, file_pattern = None, max_results = 100):
+    """
+    对应Search工具
+    在目录下所有未被忽略的文本文件中搜索正则表达式或字面量，返回 "路径:行号: 代码片段" 形式的结果
+
+    在项目根目录下且索引就绪时只在三元组索引筛选出的候选文件中逐行匹配；索引仍在后台建立或目录不在项目中时直接遍历所有文件。
+    大仓库中索引按上次更新的耗时限制更新频率，刚刚修改的文件可能要稍后才能搜索到新内容。
+
+    Args:
+        pattern: 正则表达式（literal 为 True 时作为普通文本）
+        dir_path: 搜索的目录
+        literal: 是否把 pattern 当作普通文本
+        ignore_case: 是否忽略大小写
+        file_pattern: 文件名通配符（如 "*.py"），None表示不限制
+        max_results: 最多返回的结果条数
+    """
+    # 检查路径是否存在
+    if not os.path.exists(dir_path):
+        return f"错误：路径 '{dir_path}' 不存在"
+
+    # 检查是否是目录
+    if not os.path.isdir(dir_path):
+        return f"错误：'{dir_path}' 不是一个目录"
+
+    flags = re.IGNORECASE if ignore_case else 0
+    try:
+        regex = re.compile(re.escape(pattern) if literal else pattern, flags)
+        # 整个文件的预筛选：^ 和 $ 要能匹配每一行的开头和结尾，与逐行匹配的结果一致
+        file_regex = re.compile(re.escape(pattern) if literal else pattern, flags | re.MULTILINE)
+    except re.error as e:
+        return f"错误：无效的正则表达式 - {str(e)}"
+
+    dir_path = os.path.abspath(dir_path)
+    trigram_index = get_trigram_index(dir_path)
+    if trigram_index is not None and trigram_index.is_ready:
+        trigram_index.refresh()
+        candidate_paths = trigram_index.get_candidates(_get_required_literals(pattern, literal))
+        dir_prefix = dir_path.rstrip(os.sep) + os.sep
+        candidate_paths = [file_path for file_path in candidate_paths if file_path.startswith(dir_prefix)]
+    else:
+        candidate_paths = sorted(iter_files(dir_path, ignore_matcher))
+
+    results = []
+    is_truncated = False
+    for file_path in candidate_paths:
+        if file_pattern is not None and not fnmatch.fnmatch(os.path.basename(file_path), file_pattern):
+            continue
+        try:
+            if os.path.getsize(file_path) > max_indexed_file_bytes:
+                continue
+            text = read_text(file_path)
+        except OSError:
+            continue
+        if text is None:
+            continue
+        # CRLF 文件的行尾 \r 不属于行内容，否则 $ 无法在行尾匹配
+        text = text.replace('\r\n', '\n')
+        if file_regex.search(text) is None:
+            continue
+
+        # 只按 \n 分行（splitlines 还会在 \x0c、\u2028 等字符处分行），行号与 read_file 的 offset 一致
+        lines = text.split('\n')
+        if lines[-1] == "":
+            lines.pop()
+        for line_number, line in enumerate(lines, start=1):
+            if regex.search(line) is None:
+                continue
+            snippet = line.strip()
+            if len(snippet) > max_snippet_chars:
+                snippet = snippet[:max_snippet_chars] + "..."
+            results.append(f"{file_path}:{line_number}: {snippet}")
+            if len(results) >= max_results:
+                is_truncated = True
+                break
+        if is_truncated:
+            break
+
+    if not results:
+        return f"未找到匹配 '{pattern}' 的内容"
+    if is_truncated:
+        results.append(f"[结果已达到 {max_results} 条的上限，请使用更具体的模式或 file_pattern 缩小范围]")
+    return "\n".join(results)
+
+
+def warm_up(dir_path):
+    """把项目根目录登记为使用索引的目录，并在后台开始建立索引（已被登记的目录覆盖时复用）"""
+    if not os.path.isdir(dir_path):
+        return None
+    dir_path = os.path.abspath(dir_path)
+    trigram_index = get_trigram_index(dir_path)
+    if trigram_index is None:
+        with _indexes_lock:
+            trigram_index = _indexes.setdefault(dir_path, TrigramIndex(dir_path))
+    trigram_index.start_build()
+    return trigram_index
@@ -0,0 +1,349 @@
+import os
+import threading
+from collections import OrderedDict, deque
+
+from tools.ignore_rules import ignore_matcher
+
+
+# 折叠目录的文件数摘要（如 " (3,412 files)"）预留的字符数
+summary_estimate_chars = 16
+# 统计折叠目录文件数的上限，超过时显示为 "10,000+ files"
+summary_count_limit = 10000
+
+
+class DirListing:
+    """单个目录的一级内容快照，按目录自身的 mtime 判断是否过期"""
+
+    __slots__ = ("mtime_ns", "dirs", "files")
+
+    def __init__(self, mtime_ns, dirs, files):
+        self.mtime_ns = mtime_ns
+        self.dirs = dirs
+        self.files = files
+
+
+class RenderedTree:
+    """一次渲染的结果，以及渲染时访问过的每个目录的 mtime，用于快速校验是否仍然有效"""
+
+    __slots__ = ("text", "visited", "size")
+
+    def __init__(self, text, visited):
+        self.text = text
+        self.visited = visited
+        # 计入缓存上限的字符数：渲染结果和校验用的目录路径
+        self.size = len(text) + sum(len(path) for path, _ in visited)
+
+
+class DirIndex:
+    """
+    目录索引
+
+    每个目录只在自身 mtime 变化时才重新 scandir（增删、重命名子项都会改变所在目录的 mtime），
+    整棵树的渲染结果按参数缓存，再次调用时只需要对渲染时访问过的目录各做一次 stat 校验。
+    目录快照最多保留 max_listings 个，渲染结果按总字符数做LRU淘汰；快照对象创建后不再修改，
+    只有缓存字典的读写需要持有锁。
+    """
+
+    def __init__(self, max_listings = 100_000, max_render_chars = 16 * 1024 * 1024):
+        self.max_listings = max_listings
+        self.max_render_chars = max_render_chars
+        self._listings: OrderedDict[str, DirListing] = OrderedDict()
+        self._renders: OrderedDict[tuple, RenderedTree] = OrderedDict()
+        self._render_chars = 0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """清空所有目录快照和渲染结果（基准测试测量冷启动时使用）"""
+        with self._lock:
+            self._listings.clear()
+            self._renders.clear()
+            self._render_chars = 0
+
+    def _get_listing(self, path):
+        with self._lock:
+            listing = self._listings.get(path)
+            if listing is not None:
+                self._listings.move_to_end(path)
+            return listing
+
+    def _put_listing(self, path, listing):
+        with self._lock:
+            self._listings[path] = listing
+            self._listings.move_to_end(path)
+            while len(self._listings) > self.max_listings:
+                self._listings.popitem(last=False)
+
+    def _get_render(self, render_key):
+        with self._lock:
+            rendered_tree = self._renders.get(render_key)
+            if rendered_tree is not None:
+                self._renders.move_to_end(render_key)
+            return rendered_tree
+
+    def _put_render(self, render_key, rendered_tree):
+        if rendered_tree.size > self.max_render_chars:
+            return
+        with self._lock:
+            old_tree = self._renders.pop(render_key, None)
+            if old_tree is not None:
+                self._render_chars -= old_tree.size
+            self._renders[render_key] = rendered_tree
+            self._render_chars += rendered_tree.size
+            while self._render_chars > self.max_render_chars:
+                _, evicted_tree = self._renders.popitem(last=False)
+                self._render_chars -= evicted_tree.size
+
+    def list_dir(self, path):
+        """返回目录的一级内容（目录和文件分别排序），过期时重新扫描"""
+        # 先取 mtime 再扫描：扫描期间发生的修改会让下一次调用看到新的 mtime 而重新扫描
+        mtime_ns = os.stat(path).st_mtime_ns
+        listing = self._get_listing(path)
+        if listing is not None and listing.mtime_ns == mtime_ns:
+            return listing
+
+        dirs = []
+        files = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    dirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+        dirs.sort()
+        files.sort()
+
+        listing = DirListing(mtime_ns, tuple(dirs), tuple(files))
+        self._put_listing(path, listing)
+        return listing
+
+    def _is_unchanged(self, visited):
+        try:
+            return all(os.stat(path).st_mtime_ns == mtime_ns for path, mtime_ns in visited)
+        except OSError:
+            return False
+
+    def render_tree(self, dir_path, show_hidden, max_depth, ignore_set, skip_dirs, respect_ignore_files = True, max_chars = None, offset = 0):
+        """
+        渲染 dir_path 之下的树形结构（不含根目录本身那一行）
+
+        超出 max_chars 时按广度优先展开目录，放不下的目录折叠为 "name/ (N files)" 一行；
+        dir_path 自身的直接子项过多时只显示从 offset 开始的一页，末尾给出继续查看用的 cursor。
+
+        Args:
+            dir_path: 目录路径
+            show_hidden: 是否显示隐藏文件/目录
+            max_depth: 最大递归深度，None表示无限制
+            ignore_set: 完全不显示的文件/目录名称集合
+            skip_dirs: 显示但不展开的目录名称集合
+            respect_ignore_files: 是否按 .gitignore/.ignore/全局忽略规则隐藏文件，被忽略的目录不会被展开
+            max_chars: 输出的字符数上限，None表示无限制
+            offset: dir_path 直接子项的起始位置（分页用）
+        """
+        root_path = os.path.abspath(dir_path)
+        render_key = (root_path, show_hidden, max_depth, frozenset(ignore_set), frozenset(skip_dirs), respect_ignore_files, max_chars, offset)
+
+        rendered_tree = self._get_render(render_key)
+        if rendered_tree is not None and self._is_unchanged(rendered_tree.visited):
+            return rendered_tree.text
+
+        context = _RenderContext(show_hidden, ignore_set, skip_dirs, respect_ignore_files)
+        root_rules = ignore_matcher.rules_for_root(root_path, context.visited) if respect_ignore_files else None
+
+        expanded, has_collapsed = self._plan_expansion(root_path, root_rules, max_depth, max_chars, offset, context)
+        lines = []
+        root_end = root_entry_count = 0
+        if root_path in expanded:
+            self._render(root_path, "", 0, max_depth, expanded, context, lines)
+            root_entry_count = context.get_item_count(root_path)
+            root_end = expanded[root_path][1]
+
+        if has_collapsed:
+            lines.append(f"\n[输出已达到 {max_chars:,} 字符的上限，标注了文件数的目录已折叠，可将其路径作为 dir_path 再次调用以展开]\n")
+        if root_end < root_entry_count:
+            lines.append(f"[本目录还有 {root_entry_count - root_end:,} 项未显示，可传入 cursor=\"{root_end}\" 继续查看]\n")
+
+        text = "".join(lines)
+        # 出错的目录不参与校验，出现错误时不缓存结果
+        if context.is_cacheable:
+            self._put_render(render_key, RenderedTree(text, tuple(context.visited)))
+        return text
+
+    def _collect(self, path, parent_rules, context):
+        """列出目录并应用各项过滤，返回 (dirs, files, rules, error)，同一次渲染中只计算一次"""
+        collected = context.entries.get(path)
+        if collected is not None:
+            return collected
+
+        try:
+            listing = self.list_dir(path)
+        except PermissionError:
+            context.is_cacheable = False
+            collected = ((), (), None, "[权限被拒绝]")
+            context.entries[path] = collected
+            return collected
+        except Exception as e:
+            context.is_cacheable = False
+            collected = ((), (), None, f"[错误: {str(e)}]")
+            context.entries[path] = collected
+            return collected
+        # 访问过的目录和读取过的规则文件都记录 mtime，任一变化都会使缓存失效
+        context.visited.append((path, listing.mtime_ns))
+
+        dirs = listing.dirs
+        files = listing.files
+
+        # 过滤隐藏文件/目录
+        if not context.show_hidden:
+            dirs = [item for item in dirs if not item.startswith('.')]
+            files = [item for item in files if not item.startswith('.')]
+
+        # 过滤要忽略的文件/目录（完全不显示）
+        dirs = [item for item in dirs if item not in context.ignore_set]
+        files = [item for item in files if item not in context.ignore_set]
+
+        # 按忽略规则过滤，被忽略的目录直接剪枝，不再向下遍历
+        rules = None
+        if context.respect_ignore_files:
+            rules = ignore_matcher.rules_for_dir(path, parent_rules, context.visited, listing.files)
+            if rules is not None:
+                dirs = [item for item in dirs if item in context.skip_dirs or not rules.is_ignored(os.path.join(path, item), True)]
+                files = [item for item in files if not rules.is_ignored(os.path.join(path, item), False)]
+
+        collected = (dirs, files, rules, None)
+        context.entries[path] = collected
+        return collected
+
+    def _plan_expansion(self, root_path, root_rules, max_depth, max_chars, offset, context):
+        """
+        按广度优先决定哪些目录展开
+
+        Returns:
+            ({目录路径: (起始项, 结束项)}, 是否有目录因字符上限被折叠)
+        """
+        expanded = {}
+        has_collapsed = False
+        used_chars = 0
+        queue = deque([(root_path, 0, root_rules)])
+
+        while queue:
+            path, depth, parent_rules = queue.popleft()
+            if max_depth is not None and depth >= max_depth:
+                continue
+
+            dirs, files, rules, error = self._collect(path, parent_rules, context)
+            if error is not None:
+                expanded[path] = (0, 0)
+                used_chars += 4 * depth + len(error) + 5
+                continue
+
+            # 子项每行的长度：缩进 + 树形字符 + 名称 + 换行；可能被折叠的目录预留文件数摘要的长度
+            item_costs = []
+            for item in dirs:
+                cost = 4 * depth + len(item) + 6
+                if item in context.skip_dirs:
+                    cost += 4 * (depth + 1) + 4
+                elif max_depth is None or depth + 1 < max_depth:
+                    cost += summary_estimate_chars
+                item_costs.append(cost)
+            item_costs.extend(4 * depth + len(item) + 5 for item in files)
+
+            if path == root_path:
+                # 根目录总是展开，子项过多时分页；每页至少显示一项，续页标记总能向前推进
+                start = min(offset, len(item_costs))
+                end = start
+                while end < len(item_costs) and (max_chars is None or end == start or used_chars + item_costs[end] <= max_chars):
+                    used_chars += item_costs[end]
+                    end += 1
+            else:
+                children_chars = sum(item_costs)
+                if max_chars is not None and used_chars + children_chars > max_chars:
+                    has_collapsed = True
+                    continue
+                # 展开后这一目录不再显示文件数摘要
+                used_chars += children_chars - summary_estimate_chars
+                start, end = 0, len(item_costs)
+
+            expanded[path] = (start, end)
+            for item in dirs[start:end]:
+                if item not in context.skip_dirs:
+                    queue.append((os.path.join(path, item), depth + 1, rules))
+
+        return expanded, has_collapsed
+
+    def _count_files(self, path, parent_rules, context):
+        """统计折叠目录下未被忽略的文件数，超过 summary_count_limit 时提前停止"""
+        count = 0
+        stack = [(path, parent_rules)]
+        while stack and count < summary_count_limit:
+            dir_path, rules = stack.pop()
+            dirs, files, child_rules, error = self._collect(dir_path, rules, context)
+            count += len(files)
+            stack.extend((os.path.join(dir_path, item), child_rules) for item in dirs if item not in context.skip_dirs)
+        return count
+
+    def _render(self, path, prefix, depth, max_depth, expanded, context, lines):
+        """按展开计划递归输出树形结构"""
+        dirs, files, rules, error = context.entries[path]
+        if error is not None:
+            lines.append(f"{prefix}└── {error}\n")
+            return
+
+        start, end = expanded[path]
+        is_paginated = end < len(dirs) + len(files)
+        last_index = end - 1
+
+        for i in range(start, end):
+            is_last_item = i == last_index and not is_paginated
+            if is_last_item:
+                current_prefix = "└── "
+                next_prefix = prefix + "    "
+            else:
+                current_prefix = "├── "
+                next_prefix = prefix + "│   "
+
+            if i >= len(dirs):
+                lines.append(f"{prefix}{current_prefix}{files[i - len(dirs)]}\n")
+                continue
+
+            item = dirs[i]
+            item_path = os.path.join(path, item)
+            if item in context.skip_dirs:
+                # 处理跳过的目录（显示但不展开）
+                lines.append(f"{prefix}{current_prefix}{item}/\n")
+                lines.append(f"{next_prefix}...\n")
+            elif item_path in expanded:
+                lines.append(f"{prefix}{current_prefix}{item}/\n")
+                self._render(item_path, next_prefix, depth + 1, max_depth, expanded, context, lines)
+            elif max_depth is not None and depth + 1 >= max_depth:
+                lines.append(f"{prefix}{current_prefix}{item}/\n")
+            else:
+                file_count = self._count_files(item_path, rules, context)
+                count_text = f"{summary_count_limit:,}+" if file_count >= summary_count_limit else f"{file_count:,}"
+                lines.append(f"{prefix}{current_prefix}{item}/ ({count_text} files)\n")
+
+        if is_paginated:
+            lines.append(f"{prefix}└── ...\n")
+
+
+class _RenderContext:
+    """一次渲染过程中共享的过滤参数和中间结果"""
+
+    def __init__(self, show_hidden, ignore_set, skip_dirs, respect_ignore_files):
+        self.show_hidden = show_hidden
+        self.ignore_set = ignore_set
+        self.skip_dirs = skip_dirs
+        self.respect_ignore_files = respect_ignore_files
+        self.visited = []
+        self.entries = {}
+        self.is_cacheable = True
+
+    def get_item_count(self, path):
+        dirs, files, rules, error = self.entries[path]
+        return len(dirs) + len(files)
+
+
+dir_index = DirIndex()
@@ -1,8 +1,19 @@
 import os
 import shutil
+import bisect
+import tempfile
 
+from tools.dir_index import dir_index
+from tools.line_index import line_index_cache
+from tools.read_cache import file_content_cache
+from tools.text_files import binary_sniff_bytes, decode_text
 
-def get_dir_tree(dir_path, show_hidden = True, max_depth = None, ignore_set = None):
+
+# get_dir_tree 的 max_chars 允许的最小值，太小时放不下任何一项
+min_dir_tree_chars = 200
+
+
+def get_dir_tree(dir_path, show_hidden = True, max_depth = None, ignore_set = None, respect_ignore_files = True, max_chars = 30000, cursor = None):
     """
     对应LS工具
     生成标准树形结构的目录显示
@@ -12,6 +23,9 @@ def get_dir_tree(dir_path, show_hidden = True, max_depth = None, ignore_set = No
         show_hidden: 是否显示隐藏文件/目录，通常显示
         max_depth: 最大递归深度，None表示无限制，通常无限制
         ignore_set: 要忽略的文件/目录名称集合，这些项目完全不显示在结果中
+        respect_ignore_files: 是否遵循 .gitignore、.ignore 和 git 全局忽略规则，被忽略的项目不显示，通常遵循
+        max_chars: 输出的字符数上限，超出时较大的目录折叠为 "name/ (N files)"，None表示无限制
+        cursor: 上一次输出末尾给出的续页标记，用于继续查看 dir_path 中未显示的直接子项
     """
     # 检查路径是否存在
     if not os.path.exists(dir_path):
@@ -21,6 +35,19 @@ def get_dir_tree(dir_path, show_hidden = True, max_depth = None, ignore_set = No
     if not os.path.isdir(dir_path):
         return f"错误：'{dir_path}' 不是一个目录"
 
+    if max_chars is not None and max_chars < min_dir_tree_chars:
+        return f"错误：max_chars 不能小于 {min_dir_tree_chars}"
+
+    # 解析续页标记（dir_path 直接子项的起始位置）
+    offset = 0
+    if cursor:
+        try:
+            offset = int(cursor)
+        except (TypeError, ValueError):
+            return f"错误：无效的 cursor '{cursor}'"
+        if offset < 0:
+            return f"错误：无效的 cursor '{cursor}'"
+
     # 跳过的目录（显示但不展开内容）
     skip_dirs = {'.git', '.idea', '.vscode'}
 
@@ -28,98 +55,33 @@ def get_dir_tree(dir_path, show_hidden = True, max_depth = None, ignore_set = No
     if ignore_set is None:
         ignore_set = {'__pycache__', 'ttt.txt', 'ttt.py', 'ttt.ipynb'}
 
-    def _build_tree(path, prefix = "", current_depth = 0):
-        """递归构建树形结构"""
-        if max_depth is not None and current_depth >= max_depth:
-            return ""
-
-        tree_str = ""
-
-        try:
-            # 获取目录内容
-            items = os.listdir(path)
-
-            # 过滤隐藏文件/目录
-            if not show_hidden:
-                items = [item for item in items if not item.startswith('.')]
-
-            # 过滤要忽略的文件/目录（完全不显示）
-            items = [item for item in items if item not in ignore_set]
-
-            # 分离目录和文件
-            dirs = []
-            files = []
-
-            for item in items:
-                item_path = os.path.join(path, item)
-                if os.path.isdir(item_path):
-                    dirs.append(item)
-                else:
-                    files.append(item)
-
-            # 排序
-            dirs.sort()
-            files.sort()
-
-            # 合并目录和文件（目录在前）
-            all_items = dirs + files
-
-            for i, item in enumerate(all_items):
-                is_last_item = (i == len(all_items) - 1)
-                item_path = os.path.join(path, item)
-
-                # 选择合适的树形字符
-                if is_last_item:
-                    current_prefix = "└── "
-                    next_prefix = prefix + "    "
-                else:
-                    current_prefix = "├── "
-                    next_prefix = prefix + "│   "
-
-                # 处理跳过的目录（显示但不展开）
-                if item in skip_dirs and os.path.isdir(item_path):
-                    tree_str += f"{prefix}{current_prefix}{item}/\n"
-                    tree_str += f"{next_prefix}...\n"
-                    continue
-
-                # 显示当前项
-                if os.path.isdir(item_path):
-                    tree_str += f"{prefix}{current_prefix}{item}/\n"
-                    # 递归处理子目录（跳过的目录不会到达这里）
-                    try:
-                        tree_str += _build_tree(item_path, next_prefix, current_depth + 1)
-                    except Exception as e:
-                        error_prefix = "└── " if is_last_item else "├── "
-                        tree_str += f"{next_prefix}{error_prefix}[子目录错误: {str(e)}]\n"
-                else:
-                    tree_str += f"{prefix}{current_prefix}{item}\n"
-
-        except PermissionError:
-            tree_str += f"{prefix}└── [权限被拒绝]\n"
-        except Exception as e:
-            tree_str += f"{prefix}└── [错误: {str(e)}]\n"
-
-        return tree_str
-
     # 构建完整的树形结构
     root_name = os.path.basename(os.path.abspath(dir_path))
     if not root_name:  # 处理根目录情况
         root_name = os.path.abspath(dir_path)
 
-    result = f"{root_name}/\n"
-
     try:
-        result += _build_tree(dir_path)
+        # 目录索引按目录 mtime 增量刷新，树未变化时直接返回缓存的结果
+        return f"{root_name}/\n" + dir_index.render_tree(dir_path, show_hidden, max_depth, ignore_set, skip_dirs, respect_ignore_files, max_chars, offset)
     except Exception as e:
         return f"错误：{str(e)}"
 
-    return result
 
+def _decode_text(data, final = True):
+    """按 UTF-8、GBK 的顺序解码字节，并与文本模式读取一样统一换行符"""
+    return decode_text(data, final).replace('\r\n', '\n').replace('\r', '\n')
 
-def read_file(file_path):
+
+def read_file(file_path, offset = None, limit = None, max_bytes = 100000):
     """
     对应View工具
-    读取指定文件的全部内容
+    读取指定文件的内容，可以按行区间读取
+
+    Args:
+        file_path: 文件路径
+        offset: 起始行号（从1开始），None表示从第一行开始
+        limit: 读取的行数，None表示读到文件末尾
+        max_bytes: 单次返回内容的字节数上限，超出时按整行截断并提示如何继续读取
     """
     # 检查文件是否存在
     if not os.path.exists(file_path):
@@ -129,19 +91,66 @@ def read_file(file_path):
     if not os.path.isfile(file_path):
         return f"错误：'{file_path}' 不是一个文件"
 
+    if offset is not None and offset < 1:
+        return f"错误：offset 必须大于等于1"
+    if limit is not None and limit < 1:
+        return f"错误：limit 必须大于等于1"
+
     try:
-        # 尝试读取文件内容
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        stat_result = os.stat(file_path)
+        cache_path = os.path.abspath(file_path)
+        # 文件未变化时直接使用缓存的内容，不再读盘和解码
+        if offset is None and limit is None and stat_result.st_size <= max_bytes:
+            content = file_content_cache.get(cache_path, stat_result)
+            if content is not None:
+                return content
+
+        with open(file_path, 'rb') as f:
+            # 只看开头几KB判断是否为二进制文件
+            head = f.read(binary_sniff_bytes)
+            if b'\0' in head:
+                return f"错误：无法解码文件 '{file_path}'，可能是二进制文件"
+
+            # 小文件且不指定区间时整体读取，只解码一次
+            if offset is None and limit is None and stat_result.st_size <= max_bytes:
+                content = _decode_text(head + f.read())
+                file_content_cache.put(cache_path, stat_result, content)
+                return content
+
+            line_index = line_index_cache.get(cache_path, stat_result)
+            line_count = line_index.line_count
+            start_line = (offset or 1) - 1
+            if start_line >= line_count and line_count > 0:
+                return f"错误：offset 超出范围，文件 '{file_path}' 共 {line_count} 行"
+            end_line = line_count if limit is None else min(start_line + limit, line_count)
+
+            start_byte, end_byte = line_index.get_byte_range(start_line, end_line)
+            is_line_cut = False
+            if end_byte - start_byte > max_bytes:
+                # 在字节上限内按整行截断；单独一行就超出上限时截断该行
+                cut_line = bisect.bisect_right(line_index.line_offsets, start_byte + max_bytes, start_line) - 1
+                if cut_line > start_line:
+                    end_line = cut_line
+                    start_byte, end_byte = line_index.get_byte_range(start_line, end_line)
+                else:
+                    end_line = start_line + 1
+                    end_byte = start_byte + max_bytes
+                    is_line_cut = True
+
+            f.seek(start_byte)
+            content = _decode_text(f.read(end_byte - start_byte), final=not is_line_cut)
+
+        # 内容与提示之间空一行
+        separator = "\n" if content.endswith("\n") else "\n\n"
+        if is_line_cut:
+            return content + f"{separator}[文件共 {line_count} 行，第 {start_line + 1} 行过长，仅显示了前 {max_bytes} 字节]"
+        if end_line < line_count:
+            return content + f"{separator}[文件共 {line_count} 行，以上为第 {start_line + 1}-{end_line} 行，可传入 offset={end_line + 1} 继续读取]"
+        if offset is not None or limit is not None:
+            return content + f"{separator}[文件共 {line_count} 行，以上为第 {start_line + 1}-{end_line} 行]"
         return content
     except UnicodeDecodeError:
-        # 如果UTF-8解码失败，尝试其他编码
-        try:
-            with open(file_path, 'r', encoding='gbk') as f:
-                content = f.read()
-            return content
-        except UnicodeDecodeError:
-            return f"错误：无法解码文件 '{file_path}'，可能是二进制文件"
+        return f"错误：无法解码文件 '{file_path}'，可能是二进制文件"
     except PermissionError:
         return f"错误：没有权限访问文件 '{file_path}'"
     except Exception as e:
@@ -218,6 +227,75 @@ def edit_file(file_path, new_text, old_text):
         return f"错误：编辑文件时发生错误 - {str(e)}"
 
 
+def _atomic_write_text(file_path, content):
+    """先写入同目录下的临时文件再用 os.replace 替换，进程中途崩溃时原文件不会只写了一半"""
+    dir_path = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(dir=dir_path, prefix=f".{os.path.basename(file_path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def multi_edit(file_path, edits):
+    """
+    对应MultiEdit工具
+    对同一个文件按顺序应用多处替换，只读取一次、写入一次
+
+    每一处的旧文本必须在（应用前面各处替换后的）内容中恰好出现一次；任何一处失败时整个文件保持不变。
+
+    Args:
+        file_path: 文件路径
+        edits: [{"old_text": 旧文本, "new_text": 新文本}, ...]
+    """
+    # 检查文件是否存在
+    if not os.path.exists(file_path):
+        return f"错误：文件 '{file_path}' 不存在"
+
+    # 检查是否是文件
+    if not os.path.isfile(file_path):
+        return f"错误：'{file_path}' 不是一个文件"
+
+    if not edits:
+        return f"错误：没有提供任何修改"
+
+    try:
+        # 读取原文件内容
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        for i, edit in enumerate(edits, start=1):
+            old_text = edit.get("old_text", "")
+            new_text = edit.get("new_text", "")
+            if old_text == "":
+                return f"错误：第 {i} 处修改的旧文本为空，文件未被修改"
+
+            occurrence_count = content.count(old_text)
+            if occurrence_count == 0:
+                return f"错误：在文件中未找到第 {i} 处修改的旧文本，文件未被修改"
+            if occurrence_count > 1:
+                return f"错误：第 {i} 处修改的旧文本在文件中出现了 {occurrence_count} 次，请提供更多上下文使其唯一，文件未被修改"
+
+            content = content.replace(old_text, new_text, 1)
+
+        # 一次性写入新内容
+        _atomic_write_text(file_path, content)
+
+        return f"成功：文件 '{file_path}' 已编辑（共 {len(edits)} 处修改）"
+
+    except UnicodeDecodeError:
+        return f"错误：无法解码文件 '{file_path}'，可能是二进制文件"
+    except PermissionError:
+        return f"错误：没有权限编辑文件 '{file_path}'"
+    except Exception as e:
+        return f"错误：编辑文件时发生错误 - {str(e)}"
+
+
 def delete_file_or_dir(path):
     """
     对应Delete工具
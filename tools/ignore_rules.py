@@ -0,0 +1,281 @@
+import os
+import re
+import configparser
+
+
+# 每个目录中读取的忽略规则文件，靠后的文件优先级更高
+ignore_file_names = (".gitignore", ".ignore")
+
+
+def _translate_glob(pattern):
+    """把 gitignore 的通配符模式（不含前导/尾随斜杠）翻译为正则表达式"""
+    regex_parts = []
+    i = 0
+    length = len(pattern)
+    while i < length:
+        char = pattern[i]
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            # 开头或中间的 "**/"：匹配零个或多个目录
+            regex_parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i) and i + 2 == length and (i == 0 or pattern[i - 1] == "/"):
+            # 结尾的 "/**"：匹配其下的所有内容
+            regex_parts.append(".*")
+            i += 2
+        elif char == "*":
+            regex_parts.append("[^/]*")
+            i += 1
+        elif char == "?":
+            regex_parts.append("[^/]")
+            i += 1
+        elif char == "[":
+            end = pattern.find("]", i + 2 if pattern.startswith("[!", i) or pattern.startswith("[^", i) else i + 1)
+            if end == -1:
+                regex_parts.append(re.escape(char))
+                i += 1
+                continue
+            char_class = pattern[i + 1:end]
+            if char_class.startswith("!"):
+                char_class = "^" + char_class[1:]
+            regex_parts.append(f"[{char_class.replace(chr(92), chr(92) * 2)}]")
+            i = end + 1
+        elif char == "\\" and i + 1 < length:
+            regex_parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            regex_parts.append(re.escape(char))
+            i += 1
+    return "".join(regex_parts)
+
+
+class IgnoreRule:
+    __slots__ = ("regex", "is_negated", "is_dir_only")
+
+    def __init__(self, regex, is_negated, is_dir_only):
+        self.regex = regex
+        self.is_negated = is_negated
+        self.is_dir_only = is_dir_only
+
+
+def compile_rule(line):
+    """编译一行 gitignore 规则，空行和注释返回 None"""
+    line = line.rstrip("\n").rstrip("\r")
+    # 去掉未转义的尾随空格
+    while line.endswith(" ") and not line.endswith("\\ "):
+        line = line[:-1]
+    if line == "" or line.startswith("#"):
+        return None
+
+    is_negated = line.startswith("!")
+    if is_negated:
+        line = line[1:]
+    elif line.startswith("\\!") or line.startswith("\\#"):
+        line = line[1:]
+
+    is_dir_only = line.endswith("/")
+    line = line.rstrip("/")
+    if line == "":
+        return None
+
+    # 含有斜杠（不计尾随斜杠）的模式相对于规则文件所在目录锚定，否则可以匹配任意层级
+    is_anchored = "/" in line
+    line = line.lstrip("/")
+
+    body = _translate_glob(line)
+    if is_anchored:
+        regex = re.compile(f"^{body}$")
+    else:
+        regex = re.compile(f"^(?:.*/)?{body}$")
+    return IgnoreRule(regex, is_negated, is_dir_only)
+
+
+def compile_rules(lines):
+    return [rule for rule in map(compile_rule, lines) if rule is not None]
+
+
+class IgnoreRules:
+    """
+    某个目录生效的忽略规则
+
+    每一层只保存本目录规则文件中的规则，并指向父目录的规则；判断时从最深的一层开始，
+    同一层内后面的规则优先，遇到第一条匹配的规则即得出结论（"!" 规则表示不忽略）。
+    """
+
+    __slots__ = ("parent", "base_path", "rules", "_combined_regex", "_combined_dir_regex")
+
+    def __init__(self, parent, base_path, rules):
+        self.parent = parent
+        self.base_path = base_path
+        self.rules = rules
+
+        # 没有否定规则时把整层规则合并为一个正则，一次匹配完成判断
+        if rules and not any(rule.is_negated for rule in rules):
+            self._combined_regex = re.compile("|".join(f"(?:{rule.regex.pattern})" for rule in rules if not rule.is_dir_only) or "(?!)")
+            self._combined_dir_regex = re.compile("|".join(f"(?:{rule.regex.pattern})" for rule in rules))
+        else:
+            self._combined_regex = None
+            self._combined_dir_regex = None
+
+    def _match_level(self, relative_path, is_dir):
+        """返回 True（忽略）、False（明确不忽略）或 None（本层没有规则匹配）"""
+        if self._combined_regex is not None:
+            regex = self._combined_dir_regex if is_dir else self._combined_regex
+            return True if regex.match(relative_path) else None
+
+        for rule in reversed(self.rules):
+            if rule.is_dir_only and not is_dir:
+                continue
+            if rule.regex.match(relative_path):
+                return not rule.is_negated
+        return None
+
+    def is_ignored(self, path, is_dir):
+        rules = self
+        while rules is not None:
+            if rules.rules:
+                relative_path = path[len(rules.base_path):].lstrip(os.sep)
+                if os.sep != "/":
+                    relative_path = relative_path.replace(os.sep, "/")
+                result = rules._match_level(relative_path, is_dir)
+                if result is not None:
+                    return result
+            rules = rules.parent
+        return False
+
+
+def _get_global_excludes_path():
+    """git 全局忽略文件：core.excludesFile，未配置时为 $XDG_CONFIG_HOME/git/ignore"""
+    git_config_path = os.path.join(os.path.expanduser("~"), ".gitconfig")
+    if os.path.isfile(git_config_path):
+        config = configparser.ConfigParser(strict=False, interpolation=None)
+        try:
+            config.read(git_config_path, encoding="utf-8")
+            excludes_file = config.get("core", "excludesfile", fallback=None)
+        except (configparser.Error, UnicodeDecodeError):
+            excludes_file = None
+        if excludes_file:
+            return os.path.expanduser(excludes_file)
+
+    xdg_config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(xdg_config_home, "git", "ignore")
+
+
+def find_repo_root(path):
+    """向上查找包含 .git 的目录，找不到时返回 None"""
+    current_path = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(current_path, ".git")):
+            return current_path
+        parent_path = os.path.dirname(current_path)
+        if parent_path == current_path:
+            return None
+        current_path = parent_path
+
+
+class IgnoreMatcher:
+    """
+    忽略规则的加载与缓存
+
+    规则文件按 (路径, mtime) 缓存编译结果；rules_for_dir 返回某个目录生效的规则链，
+    并记录读取过的规则文件及其 mtime，供调用方校验缓存。
+    """
+
+    def __init__(self):
+        self._compiled_files: dict[str, tuple[int, list]] = {}
+
+    def _load_rule_file(self, file_path, loaded_files):
+        try:
+            mtime_ns = os.stat(file_path).st_mtime_ns
+        except OSError:
+            return []
+        if loaded_files is not None:
+            loaded_files.append((file_path, mtime_ns))
+
+        cached = self._compiled_files.get(file_path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+
+        try:
+            with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                rules = compile_rules(f.readlines())
+        except OSError:
+            rules = []
+        self._compiled_files[file_path] = (mtime_ns, rules)
+        return rules
+
+    def rules_for_dir(self, dir_path, parent_rules, loaded_files = None, file_names = None):
+        """
+        返回 dir_path 生效的规则（在 parent_rules 基础上叠加本目录的规则文件）
+
+        Args:
+            dir_path: 目录的绝对路径
+            parent_rules: 父目录生效的规则，可以为 None
+            loaded_files: 若提供，追加读取过的 (规则文件路径, mtime)
+            file_names: 若提供（目录中的文件名集合），只尝试读取其中存在的规则文件，省去 stat
+        """
+        rules = []
+        for ignore_file_name in ignore_file_names:
+            if file_names is not None and ignore_file_name not in file_names:
+                continue
+            rules.extend(self._load_rule_file(os.path.join(dir_path, ignore_file_name), loaded_files))
+        if not rules:
+            return parent_rules
+        return IgnoreRules(parent_rules, dir_path, rules)
+
+    def rules_for_root(self, root_path, loaded_files = None):
+        """
+        返回 root_path 生效的规则：全局忽略文件、仓库的 .git/info/exclude，以及从仓库根目录到 root_path 的各级规则文件
+        """
+        root_path = os.path.abspath(root_path)
+        repo_root = find_repo_root(root_path) or root_path
+
+        base_rules = []
+        for file_path in (_get_global_excludes_path(), os.path.join(repo_root, ".git", "info", "exclude")):
+            base_rules.extend(self._load_rule_file(file_path, loaded_files))
+        rules = IgnoreRules(None, repo_root, base_rules) if base_rules else None
+
+        # 从仓库根目录逐级向下叠加到 root_path 的父目录，root_path 本身的规则由调用方遍历时加载
+        relative_parts = os.path.relpath(root_path, repo_root).split(os.sep)
+        current_path = repo_root
+        if relative_parts != ["."]:
+            rules = self.rules_for_dir(current_path, rules, loaded_files)
+            for part in relative_parts[:-1]:
+                current_path = os.path.join(current_path, part)
+                rules = self.rules_for_dir(current_path, rules, loaded_files)
+        return rules
+
+
+def iter_files(root_path, ignore_matcher, skip_dirs = frozenset({".git"})):
+    """
+    遍历 root_path 下未被忽略的文件，被忽略的目录在进入之前就被剪枝
+
+    Returns:
+        产出文件绝对路径的生成器
+    """
+    root_path = os.path.abspath(root_path)
+    stack = [(root_path, ignore_matcher.rules_for_root(root_path))]
+    while stack:
+        dir_path, parent_rules = stack.pop()
+        try:
+            with os.scandir(dir_path) as entries:
+                entries = list(entries)
+        except OSError:
+            continue
+
+        rules = ignore_matcher.rules_for_dir(dir_path, parent_rules, file_names={entry.name for entry in entries})
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir and entry.name in skip_dirs:
+                continue
+            if rules is not None and rules.is_ignored(entry.path, is_dir):
+                continue
+            if is_dir:
+                stack.append((entry.path, rules))
+            else:
+                yield entry.path
+
+
+ignore_matcher = IgnoreMatcher()
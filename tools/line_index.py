@@ -0,0 +1,76 @@
+import mmap
+import threading
+from array import array
+from collections import OrderedDict
+
+
+class LineIndex:
+    """
+    文件的行偏移索引
+
+    通过 mmap 只扫描换行符的字节位置，不解码文件内容；取任意行区间时只需要读取并解码对应的字节切片。
+    """
+
+    __slots__ = ("mtime_ns", "size", "line_offsets")
+
+    def __init__(self, file_path, mtime_ns, size):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        # line_offsets[i] 是第 i 行（从0开始）的起始字节位置
+        self.line_offsets = array("Q", [0])
+
+        if size == 0:
+            return
+        with open(file_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+                find = mapped_file.find
+                append = self.line_offsets.append
+                position = find(b"\n")
+                while position != -1:
+                    append(position + 1)
+                    position = find(b"\n", position + 1)
+
+        # 文件以换行符结尾时，最后一个偏移指向文件末尾，不构成新的一行
+        if self.line_offsets[-1] == size:
+            self.line_offsets.pop()
+
+    @property
+    def line_count(self):
+        return len(self.line_offsets) if self.size > 0 else 0
+
+    def get_byte_range(self, start_line, end_line):
+        """返回第 start_line 行到第 end_line 行（从0开始，不含 end_line）对应的字节区间"""
+        start = self.line_offsets[start_line] if start_line < self.line_count else self.size
+        end = self.line_offsets[end_line] if end_line < self.line_count else self.size
+        return start, end
+
+
+class LineIndexCache:
+    """按 (路径, mtime, 大小) 缓存行偏移索引，最多保留 max_entries 个文件"""
+
+    def __init__(self, max_entries = 64):
+        self.max_entries = max_entries
+        self._line_indexes: OrderedDict[str, LineIndex] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._line_indexes.clear()
+
+    def get(self, file_path, stat_result):
+        with self._lock:
+            line_index = self._line_indexes.get(file_path)
+            if line_index is not None and line_index.mtime_ns == stat_result.st_mtime_ns and line_index.size == stat_result.st_size:
+                self._line_indexes.move_to_end(file_path)
+                return line_index
+
+        line_index = LineIndex(file_path, stat_result.st_mtime_ns, stat_result.st_size)
+        with self._lock:
+            self._line_indexes[file_path] = line_index
+            self._line_indexes.move_to_end(file_path)
+            while len(self._line_indexes) > self.max_entries:
+                self._line_indexes.popitem(last=False)
+        return line_index
+
+
+line_index_cache = LineIndexCache()
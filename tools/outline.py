@@ -0,0 +1,319 @@
+import os
+import re
+import ast
+import pickle
+import threading
+import time
+
+from tools.ignore_rules import ignore_matcher, iter_files
+from tools import code_search
+from tools.text_files import read_text
+
+
+# 符号缓存的保存路径（相对于程序工作目录）；解析规则变化时改变文件名中的版本号，旧的缓存不再使用
+outline_cache_path = os.path.join(".cache", "outline", "symbols_v2.pickle")
+# 超过该大小的文件不解析
+max_outline_file_bytes = 1024 * 1024
+# 两次保存缓存的最短间隔（秒）
+save_interval_seconds = 30
+
+# 花括号语言中不会是函数名的关键字
+brace_keywords = {"if", "for", "while", "switch", "catch", "return", "else", "do", "try", "new", "sizeof", "with", "using", "lock", "foreach"}
+
+# 各语言的定义识别规则：(种类, 正则)，正则的 name 分组为符号名
+_js_patterns = [
+    ("class", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:abstract\s+)?class\s+(?P<name>[A-Za-z_$][\w$]*)")),
+    ("interface", re.compile(r"^\s*(?:export\s+)?interface\s+(?P<name>[A-Za-z_$][\w$]*)")),
+    ("function", re.compile(r"^\s*(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*(?P<name>[A-Za-z_$][\w$]*)")),
+    ("function", re.compile(r"^\s*(?:export\s+)?(?:const|let|var)\s+(?P<name>[A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)")),
+    ("method", re.compile(r"^\s*(?:(?:public|private|protected|static|async|get|set|override|readonly)\s+)*(?P<name>[A-Za-z_$][\w$]*)\s*\([^)]*\)\s*(?::\s*[^{]+)?\{")),
+]
+_java_patterns = [
+    ("class", re.compile(r"^\s*(?:(?:public|private|protected|internal|static|abstract|final|sealed|partial)\s+)*(?:class|interface|enum|record|struct)\s+(?P<name>\w+)")),
+    ("method", re.compile(r"^\s*(?:(?:public|private|protected|internal|static|abstract|final|virtual|override|async|synchronized)\s+)*[\w<>\[\],.?]+\s+(?P<name>\w+)\s*\([^;]*$")),
+]
+_go_patterns = [
+    ("type", re.compile(r"^type\s+(?P<name>\w+)\s+(?:struct|interface)\b")),
+    ("func", re.compile(r"^func\s+(?:\([^)]*\)\s*)?(?P<name>\w+)")),
+]
+_rust_patterns = [
+    ("type", re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:struct|enum|trait|union)\s+(?P<name>\w+)")),
+    ("impl", re.compile(r"^\s*impl(?:<[^>]*>)?\s+(?:[\w:<>]+\s+for\s+)?(?P<name>[\w:]+)")),
+    ("fn", re.compile(r"^\s*(?:pub(?:\([^)]*\))?\s+)?(?:const\s+)?(?:async\s+)?(?:unsafe\s+)?fn\s+(?P<name>\w+)")),
+]
+_c_patterns = [
+    ("class", re.compile(r"^\s*(?:template\s*<[^>]*>\s*)?(?:class|struct|namespace|enum)\s+(?P<name>\w+)")),
+    ("function", re.compile(r"^[\w:*&<>,\s]*?\b(?P<name>[A-Za-z_~][\w:~]*)\s*\([^;]*$")),
+]
+
+brace_language_patterns = {
+    ".js": _js_patterns, ".jsx": _js_patterns, ".ts": _js_patterns, ".tsx": _js_patterns, ".mjs": _js_patterns,
+    ".java": _java_patterns, ".cs": _java_patterns, ".kt": _java_patterns,
+    ".go": _go_patterns,
+    ".rs": _rust_patterns,
+    ".c": _c_patterns, ".h": _c_patterns, ".cpp": _c_patterns, ".cc": _c_patterns, ".hpp": _c_patterns,
+}
+outline_extensions = {".py", *brace_language_patterns}
+
+_string_or_comment_regex = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`(?:\\.|[^`\\])*`|//.*$')
+
+
+# 可能包含定义的复合语句的子节点（if/try/with/for 等的语句体、except 分支、match 的 case）
+_python_block_nodes = (ast.stmt, ast.excepthandler, *((ast.match_case,) if hasattr(ast, "match_case") else ()))
+
+
+def _outline_python(text):
+    """用 ast 提取类、函数和方法，包括写在 if、try、with、for 等语句块中的定义"""
+    symbols = []
+
+    def visit(node, parent_names, level):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.ClassDef):
+                kind = "class"
+            elif isinstance(child, ast.AsyncFunctionDef):
+                kind = "async def"
+            elif isinstance(child, ast.FunctionDef):
+                kind = "def"
+            else:
+                # 语句块中的定义与块外的定义属于同一个父级
+                if isinstance(child, _python_block_nodes):
+                    visit(child, parent_names, level)
+                continue
+            qualified_name = ".".join([*parent_names, child.name])
+            start_line = child.decorator_list[0].lineno if child.decorator_list else child.lineno
+            symbols.append((kind, qualified_name, start_line, child.end_lineno, level))
+            visit(child, [*parent_names, child.name], level + 1)
+
+    visit(ast.parse(text), [], 0)
+    return symbols
+
+
+def _outline_brace_language(text, patterns):
+    """
+    轻量的花括号语言解析：去掉字符串和注释后按行匹配定义，再根据花括号深度确定定义的结束行
+    """
+    symbols = []
+    # 已打开（遇到了左花括号）的定义：[种类, 限定名, 起始行, 结束行, 层级, 打开前的深度]
+    open_symbols = []
+    # 已识别但还没遇到左花括号的定义
+    pending_symbol = None
+    depth = 0
+    in_block_comment = False
+
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        # 去掉块注释
+        code_parts = []
+        position = 0
+        while position < len(line):
+            if in_block_comment:
+                end = line.find("*/", position)
+                if end == -1:
+                    position = len(line)
+                else:
+                    in_block_comment = False
+                    position = end + 2
+            else:
+                start = line.find("/*", position)
+                if start == -1:
+                    code_parts.append(line[position:])
+                    position = len(line)
+                else:
+                    code_parts.append(line[position:start])
+                    in_block_comment = True
+                    position = start + 2
+        code = _string_or_comment_regex.sub('""', "".join(code_parts))
+
+        if pending_symbol is None and code.strip():
+            for kind, regex in patterns:
+                match = regex.match(code)
+                if match is None or match.group("name") in brace_keywords:
+                    continue
+                parent_names = [symbol[1].rsplit(".", 1)[-1] for symbol in open_symbols]
+                qualified_name = ".".join([*parent_names, match.group("name")])
+                pending_symbol = [kind, qualified_name, line_number, line_number, len(open_symbols), depth]
+                break
+
+        for char in code:
+            if char == "{":
+                if pending_symbol is not None and depth == pending_symbol[5]:
+                    open_symbols.append(pending_symbol)
+                    symbols.append(pending_symbol)
+                    pending_symbol = None
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                while open_symbols and depth <= open_symbols[-1][5]:
+                    open_symbols.pop()[3] = line_number
+            elif char == ";" and pending_symbol is not None and depth == pending_symbol[5]:
+                # 只有声明没有定义（如函数原型）
+                pending_symbol = None
+
+        # 定义行之后几行内都没有出现左花括号，不是定义
+        if pending_symbol is not None and line_number - pending_symbol[2] >= 3:
+            pending_symbol = None
+
+    return [tuple(symbol[:5]) for symbol in symbols]
+
+
+def _parse_symbols(file_path, text):
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".py":
+        return _outline_python(text)
+    return _outline_brace_language(text, brace_language_patterns[extension])
+
+
+class OutlineCache:
+    """
+    每个文件的符号列表缓存，按 (mtime, 大小) 校验，保存在磁盘上供以后的会话复用
+
+    符号为 (种类, 限定名, 起始行, 结束行, 嵌套层级) 元组。
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._entries: dict[str, tuple[int, int, list]] | None = None
+        self._is_dirty = False
+        self._last_save_time = 0.0
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._entries is not None:
+            return
+        try:
+            with open(self.cache_path, 'rb') as f:
+                self._entries = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            self._entries = {}
+
+    def get_symbols(self, file_path):
+        """返回文件的符号列表，文件变化时重新解析；无法解析时抛出异常"""
+        file_path = os.path.abspath(file_path)
+        stat_result = os.stat(file_path)
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(file_path)
+        if entry is not None and entry[0] == stat_result.st_mtime_ns and entry[1] == stat_result.st_size:
+            return entry[2]
+
+        if stat_result.st_size > max_outline_file_bytes:
+            raise ValueError(f"文件超过 {max_outline_file_bytes} 字节，不解析结构")
+        text = read_text(file_path)
+        if text is None:
+            raise ValueError("无法解码，可能是二进制文件")
+        symbols = _parse_symbols(file_path, text)
+
+        with self._lock:
+            self._entries[file_path] = (stat_result.st_mtime_ns, stat_result.st_size, symbols)
+            self._is_dirty = True
+        return symbols
+
+    def save(self, force = False):
+        with self._lock:
+            if not self._is_dirty or (not force and time.monotonic() - self._last_save_time < save_interval_seconds):
+                return
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            temp_path = self.cache_path + ".tmp"
+            with open(temp_path, 'wb') as f:
+                pickle.dump(self._entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.cache_path)
+            self._is_dirty = False
+            self._last_save_time = time.monotonic()
+
+
+outline_cache = OutlineCache(outline_cache_path)
+
+
+def _save_outline_cache():
+    """保存符号缓存，写入失败（磁盘已满、目录只读等）不影响工具的结果，下次调用时再尝试"""
+    try:
+        outline_cache.save()
+    except (OSError, pickle.PicklingError):
+        pass
+
+
+def outline(file_path):
+    """
+    对应Outline工具
+    返回文件中的类、函数和方法及其起止行号
+    """
+    # 检查文件是否存在
+    if not os.path.exists(file_path):
+        return f"错误：文件 '{file_path}' 不存在"
+
+    # 检查是否是文件（而不是目录）
+    if not os.path.isfile(file_path):
+        return f"错误：'{file_path}' 不是一个文件"
+
+    if os.path.splitext(file_path)[1].lower() not in outline_extensions:
+        return f"错误：不支持解析 '{file_path}' 的结构，支持的扩展名：{', '.join(sorted(outline_extensions))}"
+
+    try:
+        symbols = outline_cache.get_symbols(file_path)
+    except SyntaxError as e:
+        return f"错误：解析文件时发生语法错误 - {str(e)}"
+    except Exception as e:
+        return f"错误：解析文件结构时发生错误 - {str(e)}"
+    _save_outline_cache()
+
+    if not symbols:
+        return f"文件 '{file_path}' 中没有找到类或函数定义"
+
+    lines = [f"文件 '{file_path}' 的结构（括号内为起止行号）："]
+    for kind, qualified_name, start_line, end_line, level in symbols:
+        name = qualified_name.rsplit(".", 1)[-1]
+        lines.append(f"{'    ' * level}{kind} {name} ({start_line}-{end_line})")
+    return "\n".join(lines)
+
+
+def find_symbol(name, dir_path, max_results = 50):
+    """
+    对应FindSymbol工具
+    在目录下查找名称为 name 的类、函数或方法的定义位置
+
+    name 可以是简单名称（如 "run"），也可以是限定名称（如 "AgentWorker.run"）。
+    代码搜索索引就绪时只解析包含该名称的文件。
+    """
+    # 检查路径是否存在
+    if not os.path.exists(dir_path):
+        return f"错误：路径 '{dir_path}' 不存在"
+
+    # 检查是否是目录
+    if not os.path.isdir(dir_path):
+        return f"错误：'{dir_path}' 不是一个目录"
+
+    dir_path = os.path.abspath(dir_path)
+    simple_name = name.rsplit(".", 1)[-1]
+
+    trigram_index = code_search.get_trigram_index(dir_path)
+    if trigram_index is not None and trigram_index.is_ready and len(simple_name.encode('utf-8')) >= 3:
+        trigram_index.refresh()
+        dir_prefix = dir_path.rstrip(os.sep) + os.sep
+        candidate_paths = [file_path for file_path in trigram_index.get_candidates([simple_name]) if file_path.startswith(dir_prefix)]
+    else:
+        candidate_paths = sorted(iter_files(dir_path, ignore_matcher))
+
+    results = []
+    is_truncated = False
+    for file_path in candidate_paths:
+        if os.path.splitext(file_path)[1].lower() not in outline_extensions:
+            continue
+        try:
+            symbols = outline_cache.get_symbols(file_path)
+        except Exception:
+            continue
+        for kind, qualified_name, start_line, end_line, level in symbols:
+            if qualified_name != name and not qualified_name.endswith("." + name):
+                continue
+            results.append(f"{file_path}:{start_line}: {kind} {qualified_name} ({start_line}-{end_line})")
+            if len(results) >= max_results:
+                is_truncated = True
+                break
+        if is_truncated:
+            break
+    _save_outline_cache()
+
+    if not results:
+        return f"未找到名为 '{name}' 的定义"
+    if is_truncated:
+        results.append(f"[结果已达到 {max_results} 条的上限]")
+    return "\n".join(results)
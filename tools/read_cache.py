@@ -0,0 +1,48 @@
+import threading
+from collections import OrderedDict
+
+
+class FileContentCache:
+    """
+    已解码文件内容的缓存，在所有会话和工具调用之间共享
+
+    以绝对路径为键，按 (mtime, 大小) 校验是否仍然有效；按内容总字符数做LRU淘汰。
+    """
+
+    def __init__(self, max_chars = 64 * 1024 * 1024):
+        self.max_chars = max_chars
+        self._entries: OrderedDict[str, tuple[int, int, str]] = OrderedDict()
+        self._total_chars = 0
+        self._lock = threading.Lock()
+
+    def get(self, file_path, stat_result):
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is None:
+                return None
+            mtime_ns, size, content = entry
+            if mtime_ns != stat_result.st_mtime_ns or size != stat_result.st_size:
+                return None
+            self._entries.move_to_end(file_path)
+            return content
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_chars = 0
+
+    def put(self, file_path, stat_result, content):
+        if len(content) > self.max_chars:
+            return
+        with self._lock:
+            old_entry = self._entries.pop(file_path, None)
+            if old_entry is not None:
+                self._total_chars -= len(old_entry[2])
+            self._entries[file_path] = (stat_result.st_mtime_ns, stat_result.st_size, content)
+            self._total_chars += len(content)
+            while self._total_chars > self.max_chars:
+                _, (_, _, evicted_content) = self._entries.popitem(last=False)
+                self._total_chars -= len(evicted_content)
+
+
+file_content_cache = FileContentCache()
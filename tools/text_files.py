@@ -0,0 +1,25 @@
+import codecs
+
+
+# 判断二进制文件时检查的开头字节数
+binary_sniff_bytes = 8192
+
+
+def decode_text(data, final = True):
+    """按 UTF-8、GBK 的顺序解码字节，都无法解码时抛出 UnicodeDecodeError；final 为 False 时允许末尾是不完整的字符"""
+    try:
+        return codecs.getincrementaldecoder('utf-8')().decode(data, final)
+    except UnicodeDecodeError:
+        return codecs.getincrementaldecoder('gbk')().decode(data, final)
+
+
+def read_text(file_path):
+    """读取整个文本文件，解码方式与 read_file 相同；二进制文件或无法解码时返回 None"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    if b'\0' in data[:binary_sniff_bytes]:
+        return None
+    try:
+        return decode_text(data)
+    except UnicodeDecodeError:
+        return None
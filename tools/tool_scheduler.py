@@ -0,0 +1,171 @@
+import os
+import time
+import inspect
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+
+
+# 工具参数中表示操作路径的字段名
+path_arg_names = ("dir_path", "file_path", "path")
+# 所有会话共用的工具线程池大小，以及每个会话最多同时占用的线程数
+shared_pool_workers = 16
+default_max_concurrent = 6
+
+# 所有会话共用的工具线程池，线程在第一次提交任务时才创建
+shared_tool_executor = ThreadPoolExecutor(max_workers=shared_pool_workers, thread_name_prefix="tool")
+
+
+def _get_tool_path(tool_args):
+    if not isinstance(tool_args, dict):
+        return None
+    for arg_name in path_arg_names:
+        if isinstance(tool_args.get(arg_name), str):
+            return os.path.normcase(os.path.abspath(tool_args[arg_name]))
+    return None
+
+
+def _check_tool_call(tools_mapping, tool_name, tool_args):
+    """检查工具名和参数，有问题时返回错误信息，让模型可以在同一轮中改正"""
+    tool = tools_mapping.get(tool_name)
+    if tool is None:
+        return f"错误：未知的工具 '{tool_name}'"
+    if not isinstance(tool_args, dict):
+        return "错误：参数无效 - 工具参数必须是 JSON 对象"
+    try:
+        inspect.signature(tool).bind(**tool_args)
+    except TypeError as e:
+        return f"错误：参数无效 - {str(e)}"
+    return None
+
+
+def _is_path_related(path_a, path_b):
+    """两个路径相同或存在包含关系时视为相关；未知路径与任何路径都相关"""
+    if path_a is None or path_b is None:
+        return True
+    if path_a == path_b:
+        return True
+    return path_a.startswith(path_b.rstrip(os.sep) + os.sep) or path_b.startswith(path_a.rstrip(os.sep) + os.sep)
+
+
+class ToolScheduler:
+    """
+    同一轮助手消息中多个工具调用的调度器
+
+    只读工具并发执行；会修改文件系统的工具需要等待之前所有涉及相关路径的调用完成，
+    之后涉及相关路径的调用也会等待它完成，从而保证同一路径上的读写顺序与模型给出的顺序一致。
+    结果始终按原始的 tool_call 顺序返回。
+
+    默认使用所有会话共用的线程池，每个调度器（会话）同时运行的调用不超过 max_concurrent 个，
+    其余调用在调度器内部排队，一个会话的大量工具调用不会占满线程池而让其他会话等待。
+    """
+
+    def __init__(self, tools_mapping, read_only_tool_names, max_workers = None, max_concurrent = default_max_concurrent, on_tool_finished = None):
+        """
+        Args:
+            max_workers: 指定时创建独占的线程池（shutdown 时一并关闭），否则使用共用的线程池
+            on_tool_finished: 每个工具执行完后在工具线程中调用 on_tool_finished(工具名, 耗时秒数, 返回内容的字符数, 是否出错)，
+                耗时只包括工具本身，不包括排队和等待依赖的时间
+        """
+        self.tools_mapping = tools_mapping
+        self.on_tool_finished = on_tool_finished
+        self.read_only_tool_names = read_only_tool_names
+        self.is_executor_owned = max_workers is not None
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool") if self.is_executor_owned else shared_tool_executor
+        self.max_concurrent = max_workers if self.is_executor_owned else max_concurrent
+        self._pending = deque()
+        self._running_count = 0
+        self._is_shut_down = False
+        self._lock = threading.Lock()
+
+    def submit(self, tool_calls):
+        """
+        提交一组工具调用
+
+        Args:
+            tool_calls: [(tool_name, tool_args), ...]
+
+        Returns:
+            与 tool_calls 顺序一致的 Future 列表，结果为工具返回内容的字符串
+        """
+        submitted: list[tuple[str | None, bool, Future]] = []
+        futures = []
+
+        with self._lock:
+            for tool_name, tool_args in tool_calls:
+                tool_path = _get_tool_path(tool_args)
+                is_read_only = tool_name in self.read_only_tool_names
+
+                # 调用按提交顺序进入线程池，依赖的调用一定先于当前调用开始执行，不会产生死锁
+                dependencies = [
+                    future for path, read_only, future in submitted
+                    if not (is_read_only and read_only) and _is_path_related(tool_path, path)
+                ]
+                future = Future()
+                self._pending.append((future, tool_name, tool_args, dependencies))
+                submitted.append((tool_path, is_read_only, future))
+                futures.append(future)
+
+        self._dispatch()
+        return futures
+
+    def run(self, tool_calls):
+        """调度执行一组工具调用，按原始顺序产出每个调用的返回内容"""
+        for future in self.submit(tool_calls):
+            yield future.result()
+
+    def _dispatch(self):
+        """在配额内把排队的调用交给线程池"""
+        with self._lock:
+            while self._pending and self._running_count < self.max_concurrent and not self._is_shut_down:
+                future, tool_name, tool_args, dependencies = self._pending.popleft()
+                # 已被取消的调用直接跳过
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._running_count += 1
+                self.executor.submit(self._run_tool, future, tool_name, tool_args, dependencies)
+
+    def _run_tool(self, future, tool_name, tool_args, dependencies):
+        try:
+            if dependencies:
+                wait(dependencies)
+            error_content = _check_tool_call(self.tools_mapping, tool_name, tool_args)
+            if error_content is not None:
+                self._report(tool_name, 0.0, len(error_content), True)
+                future.set_result(error_content)
+                return
+            tool = self.tools_mapping[tool_name]
+            started_at = time.monotonic()
+            try:
+                tool_content = str(tool(**tool_args))
+            except BaseException:
+                self._report(tool_name, time.monotonic() - started_at, 0, True)
+                raise
+            # 工具以“错误：”开头的返回表示执行失败
+            self._report(tool_name, time.monotonic() - started_at, len(tool_content), tool_content.startswith("错误"))
+            future.set_result(tool_content)
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._running_count -= 1
+            self._dispatch()
+
+    def _report(self, tool_name, wall_time, output_chars, is_error):
+        if self.on_tool_finished is not None:
+            try:
+                self.on_tool_finished(tool_name, wall_time, output_chars, is_error)
+            except Exception:
+                # 统计出错不影响工具结果
+                pass
+
+    def shutdown(self):
+        """取消尚未开始的调用；独占的线程池一并关闭，共用的线程池继续为其他会话服务"""
+        with self._lock:
+            self._is_shut_down = True
+            pending = list(self._pending)
+            self._pending.clear()
+        for future, _, _, _ in pending:
+            future.cancel()
+        if self.is_executor_owned:
+            self.executor.shutdown(wait=False, cancel_futures=True)
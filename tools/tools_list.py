@@ -1,4 +1,6 @@
-from tools.file_ops import get_dir_tree, read_file, create_file, edit_file, delete_file_or_dir
+from tools.file_ops import get_dir_tree, read_file, create_file, edit_file, multi_edit, delete_file_or_dir
+from tools.code_search import search_code
+from tools.outline import outline, find_symbol
 
 
 tools_list = [
@@ -6,13 +8,25 @@ tools_list = [
         "type": "function",
         "function": {
             "name": "get_dir_tree",
-            "description": "Recursively read the structure of a specified directory and return a string in the form of a directory tree (omitting detailed structures of .git and IDE configuration directories, and excluding __pycache__ directories). Use this tool when you need to understand the structure of an existing directory (e.g., to quickly familiarize yourself with a project, obtain file paths within the project, or when a user requests an operation on a specific file but you don't know its path).",
+            "description": "Recursively read the structure of a specified directory and return a string in the form of a directory tree (omitting detailed structures of .git and IDE configuration directories, and excluding __pycache__ directories and everything ignored by .gitignore/.ignore files). Use this tool when you need to understand the structure of an existing directory (e.g., to quickly familiarize yourself with a project, obtain file paths within the project, or when a user requests an operation on a specific file but you don't know its path). The output is limited in size: when the tree is too large, directories that do not fit are collapsed into a summary line such as \"gen/ (3,412 files)\"; call this tool again with such a directory as dir_path to expand it. If the output ends with a cursor, pass it back to see the remaining entries of the same directory.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "dir_path": {
                         "type": "string",
                         "description": "The path of the directory to be read (must be an absolute path, please concatenate the path based on the user's project root directory path)"
+                    },
+                    "max_depth": {
+                        "type": "integer",
+                        "description": "Optional. Maximum depth to expand (1 lists only the direct children). Omit for no depth limit"
+                    },
+                    "max_chars": {
+                        "type": "integer",
+                        "description": "Optional. Maximum number of characters to return, at least 200, defaults to 30000"
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "Optional. The cursor given at the end of a previous output of the same dir_path, to continue listing its remaining entries"
                     }
                 },
                 "required": ["dir_path"]
@@ -23,19 +37,106 @@ tools_list = [
         "type": "function",
         "function": {
             "name": "read_file",
-            "description": "Read the entire content of the specified file and return the original content as a string. Use this tool when you need to inspect an existing file but are unaware of its content (e.g., analyzing code, reviewing text files, or extracting information from configuration files). Not suitable for binary files.",
+            "description": "Read the content of the specified file and return the original content as a string. Use this tool when you need to inspect an existing file but are unaware of its content (e.g., analyzing code, reviewing text files, or extracting information from configuration files). Small files are returned in full. For large files only the first part is returned, followed by a note with the total line count and the offset to continue from; you can also read a specific line range with offset and limit. Not suitable for binary files.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "file_path": {
                         "type": "string",
                         "description": "The path of the file to be read (must be an absolute path, please concatenate the path based on the user's project root directory path)"
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Optional. The line number to start reading from (1-based). Omit to start from the first line"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Optional. The number of lines to read. Omit to read to the end of the file (still subject to the size limit)"
+                    }
+                },
+                "required": ["file_path"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_code",
+            "description": "Search all text files under a directory (skipping files ignored by .gitignore/.ignore) for a regular expression or a literal string, and return matching lines in the form \"path:line: snippet\". Use this tool to find where a symbol, string or pattern is defined or used instead of reading many whole files.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "pattern": {
+                        "type": "string",
+                        "description": "The regular expression (Python syntax) to search for, or a plain string when literal is true"
+                    },
+                    "dir_path": {
+                        "type": "string",
+                        "description": "The path of the directory to search (must be an absolute path, please concatenate the path based on the user's project root directory path)"
+                    },
+                    "literal": {
+                        "type": "boolean",
+                        "description": "Optional. Treat pattern as a plain string instead of a regular expression, defaults to false"
+                    },
+                    "ignore_case": {
+                        "type": "boolean",
+                        "description": "Optional. Match case-insensitively, defaults to false"
+                    },
+                    "file_pattern": {
+                        "type": "string",
+                        "description": "Optional. Only search files whose name matches this wildcard pattern, e.g. \"*.py\""
+                    },
+                    "max_results": {
+                        "type": "integer",
+                        "description": "Optional. Maximum number of matching lines to return, defaults to 100"
+                    }
+                },
+                "required": ["pattern", "dir_path"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "outline",
+            "description": "Return the classes, functions and methods defined in a source file together with their start and end line numbers, nested by containment. Use this tool to get an overview of a large file before reading it, then read only the line range you need with read_file. Supports Python, JavaScript/TypeScript, Java, C#, Kotlin, Go, Rust and C/C++.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "file_path": {
+                        "type": "string",
+                        "description": "The path of the file to outline (must be an absolute path, please concatenate the path based on the user's project root directory path)"
                     }
                 },
                 "required": ["file_path"]
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "find_symbol",
+            "description": "Find where a class, function or method is defined in a directory, e.g. \"where is AgentWorker defined\". Returns lines in the form \"path:line: kind qualified_name (start-end)\". Prefer this over search_code when looking for a definition by name.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "name": {
+                        "type": "string",
+                        "description": "The symbol name, either a simple name such as \"run\" or a qualified name such as \"AgentWorker.run\""
+                    },
+                    "dir_path": {
+                        "type": "string",
+                        "description": "The path of the directory to search (must be an absolute path, please concatenate the path based on the user's project root directory path)"
+                    },
+                    "max_results": {
+                        "type": "integer",
+                        "description": "Optional. Maximum number of definitions to return, defaults to 50"
+                    }
+                },
+                "required": ["name", "dir_path"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -78,6 +179,41 @@ tools_list = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "multi_edit",
+            "description": "Apply several text replacements to one file in a single call. The edits are applied in order, each one to the result of the previous ones. Every old text must appear exactly once in the file at the time it is applied; if any edit fails, the file is left unchanged. Prefer this tool over calling edit_file repeatedly when you need to change several places in the same file.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "file_path": {
+                        "type": "string",
+                        "description": "The path of the file to be edited (must be an absolute path, please concatenate the path based on the user's project root directory path)"
+                    },
+                    "edits": {
+                        "type": "array",
+                        "description": "The list of replacements, applied in order",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "old_text": {
+                                    "type": "string",
+                                    "description": "Old text, must not be empty and must be unique in the file (include enough surrounding context)"
+                                },
+                                "new_text": {
+                                    "type": "string",
+                                    "description": "New text"
+                                }
+                            },
+                            "required": ["old_text", "new_text"]
+                        }
+                    }
+                },
+                "required": ["file_path", "edits"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -100,7 +236,14 @@ tools_list = [
 tools_mapping = {
     "get_dir_tree": get_dir_tree,
     "read_file": read_file,
+    "search_code": search_code,
+    "outline": outline,
+    "find_symbol": find_symbol,
     "create_file": create_file,
     "edit_file": edit_file,
+    "multi_edit": multi_edit,
     "delete_file_or_dir": delete_file_or_dir,
-}
\ No newline at end of file
+}
+
+# 只读工具，可以在同一轮中并发执行
+read_only_tool_names = {"get_dir_tree", "read_file", "search_code", "outline", "find_symbol"}